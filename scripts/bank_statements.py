@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from itertools import chain
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO
+
+SVEA_HEADER = ['Referens', 'Datum', 'Valuta', 'Belopp', 'Saldo']
+REVOLUT_HEADER = 'Type,Product,Started Date,Completed Date,Description,Amount,Fee,Currency,State,Balance'
+
+_DATE_LINE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+_SWEDISH_AMOUNT = re.compile(r'^-?[\d\s\u00a0]+(,\d+)?$')
+
+def parse_swedish_amount(value: str) -> float:
+    """Parse a Swedish formatted amount such as '-1 796,97'."""
+    cleaned = re.sub(r'[\s\u00a0]', '', value).replace(',', '.')
+    return float(cleaned)
+
+def _transaction_id(source: str, *parts: str) -> str:
+    """Stable id derived from the record contents, independent of file position."""
+    digest = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:12]
+    return f"{source}-{digest}"
+
+def iter_svea_transactions(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Yield transactions from a Svea export, one field per line.
+
+    Each record is a reference line, a booking date, an optional value date
+    (the 'Valuta' column, usually left out) and then the amount and balance.
+    """
+    record: List[str] = []
+    seen: Dict[str, int] = {}
+    seen_date = None
+    header_done = False
+
+    for raw in lines:
+        line = raw.strip()
+        if not header_done:
+            if line == SVEA_HEADER[-1]:
+                header_done = True
+            continue
+        if not line:
+            continue
+
+        # A second date straight after the booking date is the value date
+        if len(record) == 2 and _DATE_LINE.match(line):
+            continue
+        record.append(line)
+        if len(record) < 4:
+            continue
+
+        reference, date, amount, balance = record
+        record = []
+        if not _DATE_LINE.match(date) or not _SWEDISH_AMOUNT.match(amount):
+            raise ValueError(f"Malformed Svea record: {reference!r} {date!r} {amount!r}")
+
+        # Identical rows on the same day are legitimate (e.g. two coffees);
+        # number repeats so ids stay unique. Exports are grouped by date, so
+        # only the current day has to be remembered.
+        if date != seen_date:
+            seen, seen_date = {}, date
+        key = '|'.join((date, reference, amount, balance))
+        seen[key] = seen.get(key, 0) + 1
+        yield {
+            "id": _transaction_id('svea', key, str(seen[key])),
+            "date": date,
+            "amount": parse_swedish_amount(amount),
+            "reference": reference,
+            "currency": "SEK",
+            "balance": parse_swedish_amount(balance),
+            "source": "svea"
+        }
+
+    if record:
+        raise ValueError(f"Truncated Svea record at end of file: {record}")
+
+def iter_revolut_transactions(lines: Iterable[str], states: Optional[Iterable[str]] = ('COMPLETED',)) -> Iterator[Dict[str, Any]]:
+    """Yield transactions from a Revolut account statement CSV.
+
+    The transaction date is the 'Started Date' (when the card was used), which
+    is the date printed on the receipt. Rows in other states than `states`
+    (e.g. REVERTED) are skipped; pass None to keep everything.
+    """
+    allowed = set(states) if states is not None else None
+    for row in csv.DictReader(lines):
+        if allowed is not None and row['State'] not in allowed:
+            continue
+        started = row['Started Date']
+        completed = row['Completed Date']
+        yield {
+            "id": _transaction_id('revolut', started, row['Type'], row['Description'], row['Amount'], row['Balance']),
+            "date": started[:10],
+            "amount": float(row['Amount']),
+            "reference": row['Description'],
+            "currency": row['Currency'],
+            "fee": float(row['Fee'] or 0),
+            "type": row['Type'],
+            "state": row['State'],
+            "completed_date": completed[:10] if completed else None,
+            "source": "revolut"
+        }
+
+def detect_bank(first_line: str) -> str:
+    """Identify the bank export format from its first line."""
+    line = first_line.lstrip('\ufeff').strip()
+    if line == SVEA_HEADER[0]:
+        return 'svea'
+    if line == REVOLUT_HEADER:
+        return 'revolut'
+    raise ValueError(f"Unrecognized bank statement header: {line[:80]!r}")
+
+def _iter_statement_lines(lines: Iterator[str]) -> Iterator[Dict[str, Any]]:
+    first_line = next(lines, '')
+    bank = detect_bank(first_line)
+    lines = chain([first_line.lstrip('\ufeff')], lines)
+    if bank == 'svea':
+        yield from iter_svea_transactions(lines)
+    else:
+        yield from iter_revolut_transactions(lines)
+
+def _iter_open_statement(handle: TextIO) -> Iterator[Dict[str, Any]]:
+    yield from _iter_statement_lines(iter(handle))
+
+def iter_statement(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream normalized transactions from one bank export file."""
+    with open(path, 'r', encoding='utf-8-sig', newline='') as handle:
+        yield from _iter_open_statement(handle)
+
+def iter_statements(paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Stream normalized transactions from several bank export files."""
+    for path in paths:
+        yield from iter_statement(path)
+
+def iter_json_values(handle: TextIO, head: str = '', chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """Yield the elements of a JSON array, or the values of a JSON-lines stream,
+    reading `chunk_size` characters at a time.
+
+    head is text already read from handle. Only the value being decoded and
+    the rest of the current chunk are held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = head, 0, False
+    in_array = None
+    while True:
+        # Whitespace, and commas between array elements
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,\ufeff':
+            pos += 1
+        if pos == len(buffer):
+            if eof:
+                if in_array:
+                    raise ValueError("Unterminated JSON array")
+                return
+            buffer, pos = handle.read(chunk_size), 0
+            eof = not buffer
+            continue
+        if in_array is None:
+            in_array = buffer[pos] == '['
+            if in_array:
+                pos += 1
+                continue
+        if in_array and buffer[pos] == ']':
+            return
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+            # A number is only complete once a delimiter follows ("2." may be "2.5")
+            complete = (eof or type(value) not in (int, float)
+                        or (end < len(buffer) and buffer[end] in ' \t\r\n,]}'))
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            complete = False
+        if not complete:
+            chunk = handle.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield value
+        pos = end
+
+def iter_transaction_input(handle: TextIO, chunk_size: int = 1 << 16) -> Iterator[Dict[str, Any]]:
+    """Stream transactions from a JSON array, JSON lines, or a Svea/Revolut export."""
+    head = handle.read(chunk_size)
+    if head.lstrip('\ufeff \t\r\n')[:1] in ('[', '{', ''):
+        yield from iter_json_values(handle, head, chunk_size)
+        return
+    # Complete the last line of the chunk and go on line by line
+    lines = chain((head + handle.readline()).splitlines(keepends=True), handle)
+    yield from _iter_statement_lines(lines)
+
+def iter_transaction_source(source: str) -> Iterator[Dict[str, Any]]:
+    """iter_transaction_input over a file, or stdin when source is '-'."""
+    if source == '-':
+        yield from iter_transaction_input(sys.stdin)
+        return
+    with open(source, 'r', encoding='utf-8-sig', newline='') as handle:
+        yield from iter_transaction_input(handle)
+
+def _write_multi_year_copy(path: str, years: int, target: TextIO) -> None:
+    """Write `path` repeated `years` times, shifting dates back a year each time."""
+    with open(path, 'r', encoding='utf-8-sig', newline='') as handle:
+        first_line = handle.readline()
+        body = handle.read()
+    target.write(first_line)
+    if detect_bank(first_line) == 'svea':
+        # The remaining header fields come before the first record
+        header, _, body = body.partition(SVEA_HEADER[-1] + '\n')
+        target.write(header + SVEA_HEADER[-1] + '\n')
+    for offset in range(years):
+        target.write(re.sub(
+            r'\b(\d{4})(-\d{2}-\d{2})',
+            lambda m: f"{int(m.group(1)) - offset}{m.group(2)}",
+            body
+        ))
+        if not body.endswith('\n'):
+            target.write('\n')
+
+def benchmark(path: str, years: int) -> Dict[str, Any]:
+    """Measure streaming throughput on a synthetic multi-year copy of a statement."""
+    with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as target:
+        _write_multi_year_copy(path, years, target)
+    try:
+        size = os.path.getsize(target.name)
+        start = time.perf_counter()
+        count = sum(1 for _ in iter_statement(target.name))
+        elapsed = time.perf_counter() - start
+        # Separate pass, tracemalloc slows parsing down considerably
+        tracemalloc.start()
+        for _ in iter_statement(target.name):
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        os.unlink(target.name)
+    return {
+        "file": os.path.basename(path),
+        "years": years,
+        "transactions": count,
+        "bytes": size,
+        "seconds": round(elapsed, 4),
+        "transactions_per_second": round(count / elapsed) if elapsed else None,
+        "mb_per_second": round(size / elapsed / 1e6, 2) if elapsed else None,
+        "peak_memory_kb": round(peak / 1024, 1)
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Normalize Svea and Revolut exports into matcher transactions')
+    parser.add_argument('paths', nargs='+', help='Bank export files (Svea.csv, Revolut account-statement_*.csv)')
+    parser.add_argument('--benchmark', type=int, metavar='YEARS',
+                        help='Report parsing throughput on each file repeated over YEARS years')
+    args = parser.parse_args()
+
+    try:
+        if args.benchmark:
+            for path in args.paths:
+                print(json.dumps(benchmark(path, args.benchmark)), flush=True)
+        else:
+            # One transaction per line, so the output is streamable as well
+            for transaction in iter_statements(args.paths):
+                sys.stdout.write(json.dumps(transaction, ensure_ascii=False) + '\n')
+    except (OSError, ValueError) as e:
+        print(json.dumps({
+            "stage": "error",
+            "progress": 0,
+            "message": f"Error: {str(e)}"
+        }), flush=True)
+        sys.exit(1)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmark_fields import field_matches
+from gpt_batches import estimate_tokens
+from make_receipt_fixtures import FIXTURE_DIR
+from receipt_fields import REQUIRED_FIELDS, extract_fields
+from text_compaction import DEFAULT_MAX_TEXT_TOKENS, compact_text
+
+def load_fixtures(directory: str):
+    """(names, texts, labels) for the `<name>.txt` OCR texts; labels from `<name>.json` where present."""
+    names = sorted(name[:-4] for name in os.listdir(directory) if name.endswith('.txt'))
+    texts, labels = [], []
+    for name in names:
+        with open(os.path.join(directory, name + '.txt'), 'r', encoding='utf-8') as f:
+            texts.append(f.read())
+        label_path = os.path.join(directory, name + '.json')
+        labels.append(None)
+        if os.path.exists(label_path):
+            with open(label_path, 'r', encoding='utf-8') as f:
+                labels[-1] = json.load(f)
+    return names, texts, labels
+
+def accuracy(parsed: List[Dict[str, Any]], reference: List[Optional[Dict[str, Any]]]) -> Dict[str, float]:
+    """Share of receipts whose field matches the reference, per field."""
+    pairs = [(p, r) for p, r in zip(parsed, reference) if r is not None]
+    if not pairs:
+        return {}
+    return {field: round(sum(1 for p, r in pairs if field_matches(field, r.get(field), p.get(field))) / len(pairs), 4)
+            for field in REQUIRED_FIELDS}
+
+def local_fields(text: str) -> Dict[str, Any]:
+    return {field: value for field, (value, _) in extract_fields(text).items()}
+
+def gpt_run(texts: List[str], compact: bool) -> Dict[str, Any]:
+    """Parse every text with GPT, compacted or raw, and count requests, tokens and seconds."""
+    # parse_receipt mirrors its log to stdout; keep stdout for the results
+    _stdout, sys.stdout = sys.stdout, sys.stderr
+    try:
+        import parse_receipt
+    finally:
+        sys.stdout = _stdout
+    from progress_events import events_to
+    from stage_timings import collecting
+    os.environ['RECEIPT_COMPACT'] = '1' if compact else '0'
+    start = time.perf_counter()
+    with events_to(lambda event: None), collecting() as timings:
+        parsed = [parse_receipt.parse_receipt_with_gpt(text) for text in texts]
+    stages = timings.as_dict()
+    return {
+        "requests": stages.get('parse_receipt_with_gpt', {}).get('calls', 0),
+        "errors": sum(1 for parsed_data in parsed if parsed_data.get('error')),
+        "prompt_tokens": stages.get('gpt_prompt_tokens', {}).get('items', 0),
+        "completion_tokens": stages.get('gpt_completion_tokens', {}).get('items', 0),
+        "seconds": round(time.perf_counter() - start, 4),
+        "parsed": parsed
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure OCR text compaction: tokens saved and field accuracy kept')
+    parser.add_argument('directory', nargs='?', default=FIXTURE_DIR,
+                        help='Directory of <name>.txt OCR texts, optionally with <name>.json field labels '
+                             '(default: the bundled synthetic receipts and noisy invoices)')
+    parser.add_argument('--max-tokens', type=int, default=DEFAULT_MAX_TEXT_TOKENS,
+                        help=f'Token cap for compacted text (default {DEFAULT_MAX_TEXT_TOKENS}, 0 = no cap)')
+    parser.add_argument('--gpt', action='store_true',
+                        help='Also parse raw and compacted texts with GPT and compare tokens and fields')
+    args = parser.parse_args()
+
+    names, texts, labels = load_fixtures(args.directory)
+    os.environ['RECEIPT_GPT_TEXT_TOKENS'] = str(args.max_tokens)
+    start = time.perf_counter()
+    compacted = [compact_text(text, args.max_tokens) for text in texts]
+    compact_seconds = time.perf_counter() - start
+    for name, text, compact in zip(names, texts, compacted):
+        print(json.dumps({
+            "file": name,
+            "raw_tokens": estimate_tokens(text),
+            "compact_tokens": estimate_tokens(compact),
+            "raw_lines": len(text.splitlines()),
+            "compact_lines": len(compact.splitlines())
+        }), flush=True)
+
+    raw_tokens = sum(estimate_tokens(text) for text in texts)
+    compact_tokens = sum(estimate_tokens(text) for text in compacted)
+    # Without labels, fields from compacted text are compared with those from the raw text
+    raw_local = [local_fields(text) for text in texts]
+    reference = labels if any(label is not None for label in labels) else raw_local
+    summary = {
+        "fixtures": len(texts),
+        "max_tokens": args.max_tokens,
+        "raw_tokens": raw_tokens,
+        "compact_tokens": compact_tokens,
+        "token_reduction": round(1 - compact_tokens / raw_tokens, 4) if raw_tokens else None,
+        "compact_seconds": round(compact_seconds, 4),
+        "local_accuracy_raw": accuracy(raw_local, reference),
+        "local_accuracy_compact": accuracy([local_fields(text) for text in compacted], reference)
+    }
+    if args.gpt:
+        for mode, compact in (('raw', False), ('compact', True)):
+            result = gpt_run(texts, compact)
+            result["field_accuracy"] = accuracy(result.pop('parsed'), reference)
+            summary["gpt_" + mode] = result
+    print(json.dumps({"summary": summary}), flush=True)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+from typing import Any, Dict, List
+
+from make_receipt_fixtures import FIXTURE_DIR
+from receipt_fields import DEFAULT_MIN_CONFIDENCE, REQUIRED_FIELDS, extract_fields, parse_locally
+
+def field_matches(field: str, expected: Any, actual: Any) -> bool:
+    """Compare an extracted value with its label, tolerating formatting differences."""
+    if expected is None or actual is None:
+        return expected is None and actual is None
+    if field in ('total_amount', 'vat_amount'):
+        try:
+            return abs(float(expected) - float(actual)) < 0.01
+        except (TypeError, ValueError):
+            return False
+    expected_text = ' '.join(str(expected).split()).lower()
+    actual_text = ' '.join(str(actual).split()).lower()
+    if field == 'supplier_name':
+        # OCR headers often add a suffix or prefix to the legal name
+        return expected_text in actual_text or actual_text in expected_text
+    return expected_text == actual_text
+
+def evaluate(directory: str, min_confidence: float) -> Dict[str, Any]:
+    """Score the local extractor on `<name>.txt` OCR texts labelled by `<name>.json`.
+
+    Reports how often GPT would be skipped, and per-field accuracy both over
+    all fixtures and over the skipped ones (where a wrong field goes
+    unchecked by GPT).
+    """
+    names = sorted(name[:-5] for name in os.listdir(directory)
+                   if name.endswith('.json') and os.path.exists(os.path.join(directory, name[:-5] + '.txt')))
+    found = {field: 0 for field in REQUIRED_FIELDS}
+    correct = {field: 0 for field in REQUIRED_FIELDS}
+    skipped_correct = {field: 0 for field in REQUIRED_FIELDS}
+    skipped: List[str] = []
+    for name in names:
+        with open(os.path.join(directory, name + '.txt'), 'r', encoding='utf-8') as f:
+            text = f.read()
+        with open(os.path.join(directory, name + '.json'), 'r', encoding='utf-8') as f:
+            labels = json.load(f)
+        fields = extract_fields(text)
+        local = parse_locally(text, min_confidence)
+        if local is not None:
+            skipped.append(name)
+        for field in REQUIRED_FIELDS:
+            value = fields[field][0]
+            if value is not None:
+                found[field] += 1
+            if field_matches(field, labels.get(field), value):
+                correct[field] += 1
+                if local is not None:
+                    skipped_correct[field] += 1
+    total = len(names)
+    return {
+        "fixtures": total,
+        "min_confidence": min_confidence,
+        "gpt_skip_rate": round(len(skipped) / total, 4) if total else None,
+        "field_found_rate": {f: round(found[f] / total, 4) for f in REQUIRED_FIELDS} if total else {},
+        "field_accuracy": {f: round(correct[f] / total, 4) for f in REQUIRED_FIELDS} if total else {},
+        "skipped_field_accuracy": {f: round(skipped_correct[f] / len(skipped), 4) for f in REQUIRED_FIELDS} if skipped else {},
+        "skipped": skipped
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure the local receipt field extractor against labelled OCR texts')
+    parser.add_argument('directory', nargs='?', default=FIXTURE_DIR,
+                        help='Directory of <name>.txt OCR texts with <name>.json field labels (default: the bundled synthetic receipts)')
+    parser.add_argument('--min-confidence', type=float, default=DEFAULT_MIN_CONFIDENCE)
+    args = parser.parse_args()
+
+    print(json.dumps(evaluate(args.directory, args.min_confidence), ensure_ascii=False, indent=2))
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+# parse_receipt mirrors its log to stdout; keep stdout for the results
+_stdout, sys.stdout = sys.stdout, sys.stderr
+try:
+    import parse_receipt
+finally:
+    sys.stdout = _stdout
+from benchmark_fields import field_matches
+from gpt_batches import BatchPacker
+from progress_events import events_to
+from receipt_fields import REQUIRED_FIELDS
+from stage_timings import collecting
+
+GPT_STAGES = ('parse_receipt_with_gpt', 'parse_receipts_with_gpt_batch', 'gpt_reask')
+
+def load_texts(directory: str):
+    """(names, texts, labels) for the `<name>.txt` OCR texts; labels from `<name>.json` where present."""
+    names = sorted(name[:-4] for name in os.listdir(directory) if name.endswith('.txt'))
+    texts, labels = [], []
+    for name in names:
+        with open(os.path.join(directory, name + '.txt'), 'r', encoding='utf-8') as f:
+            texts.append(f.read())
+        label_path = os.path.join(directory, name + '.json')
+        if os.path.exists(label_path):
+            with open(label_path, 'r', encoding='utf-8') as f:
+                labels.append(json.load(f))
+        else:
+            labels.append(None)
+    return names, texts, labels
+
+def run(texts: List[str], budget: int) -> Dict[str, Any]:
+    """Parse every text with GPT, one request each (budget 0) or packed into batches."""
+    start = time.perf_counter()
+    # Only the results go to stdout
+    with events_to(lambda event: None), collecting() as timings:
+        if budget:
+            packer = BatchPacker(budget)
+            batches = [batch for position, text in enumerate(texts) for batch in packer.add(position, text)]
+            batches += packer.flush()
+            parsed: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+            for batch in batches:
+                results = parse_receipt.parse_receipts_with_gpt_batch([text for _, text in batch])
+                for (position, _), parsed_data in zip(batch, results):
+                    parsed[position] = parsed_data
+        else:
+            parsed = [parse_receipt.parse_receipt_with_gpt(text) for text in texts]
+    seconds = time.perf_counter() - start
+    stages = timings.as_dict()
+    count = len(texts) or 1
+    tokens = {stage: stages.get(stage, {}).get('items', 0) for stage in
+              ('gpt_prompt_tokens', 'gpt_completion_tokens', 'gpt_reask_prompt_tokens',
+               'gpt_reask_completion_tokens', 'gpt_full_rerun_tokens')}
+    reask_tokens = tokens['gpt_reask_prompt_tokens'] + tokens['gpt_reask_completion_tokens']
+    prompt_tokens = tokens['gpt_prompt_tokens'] + tokens['gpt_reask_prompt_tokens']
+    completion_tokens = tokens['gpt_completion_tokens'] + tokens['gpt_reask_completion_tokens']
+    return {
+        "budget": budget,
+        "receipts": len(texts),
+        "requests": sum(stages.get(stage, {}).get('calls', 0) for stage in GPT_STAGES),
+        "batched_requests": stages.get('parse_receipts_with_gpt_batch', {}).get('calls', 0),
+        "reask_requests": stages.get('gpt_reask', {}).get('calls', 0),
+        "errors": sum(1 for parsed_data in parsed if parsed_data.get('error')),
+        # Follow-ups for missing or invalid fields against sending those receipts again whole
+        "reask_tokens": reask_tokens,
+        "full_rerun_tokens": tokens['gpt_full_rerun_tokens'],
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "tokens_per_receipt": round((prompt_tokens + completion_tokens) / count, 1),
+        "seconds": round(seconds, 4),
+        "seconds_per_receipt": round(seconds / count, 4),
+        "parsed": parsed
+    }
+
+def accuracy(parsed: List[Dict[str, Any]], reference: List[Optional[Dict[str, Any]]]) -> Dict[str, float]:
+    """Share of receipts whose field matches the reference, per field, over receipts with a reference."""
+    pairs = [(p, r) for p, r in zip(parsed, reference) if r is not None]
+    if not pairs:
+        return {}
+    return {field: round(sum(1 for p, r in pairs if field_matches(field, r.get(field), p.get(field))) / len(pairs), 4)
+            for field in REQUIRED_FIELDS}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare batched GPT extraction with one request per receipt')
+    parser.add_argument('directory', help='Directory of <name>.txt OCR texts, optionally with <name>.json field labels')
+    parser.add_argument('--budgets', type=int, nargs='+', default=[1000, 2000, 4000],
+                        help='Batch token budgets to compare with one request per receipt')
+    parser.add_argument('--gpt-reasks', type=int,
+                        help='Follow-up requests per receipt for missing or invalid fields (default 0: off)')
+    args = parser.parse_args()
+    if args.gpt_reasks is not None:
+        os.environ['RECEIPT_GPT_REASKS'] = str(args.gpt_reasks)
+
+    names, texts, labels = load_texts(args.directory)
+    single = run(texts, 0)
+    # Without labels, batched fields are compared with the one-per-request ones
+    reference = labels if any(label is not None for label in labels) else single['parsed']
+    for result in [single] + [run(texts, budget) for budget in args.budgets]:
+        parsed = result.pop('parsed')
+        if result is not single:
+            result["tokens_vs_single"] = round((result["prompt_tokens"] + result["completion_tokens"]) /
+                                               max(1, single["prompt_tokens"] + single["completion_tokens"]), 4)
+            result["seconds_vs_single"] = round(result["seconds"] / max(single["seconds"], 1e-9), 4)
+        if reference is labels:
+            result["field_accuracy"] = accuracy(parsed, reference)
+        elif result is not single:
+            result["field_agreement_with_single"] = accuracy(parsed, reference)
+        print(json.dumps(result), flush=True)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+# parse_receipt mirrors its log to stdout; keep stdout for the results
+_stdout, sys.stdout = sys.stdout, sys.stderr
+try:
+    import parse_receipt
+    import match_transactions
+finally:
+    sys.stdout = _stdout
+from progress_events import encode_event, events_to
+from reconciliation_data import DEFAULT_TRANSACTIONS_PER_DAY, generate, load_profile
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+MATCHERS = ['greedy', 'optimal', 'pairwise']
+# Confidence (0-100) at which a pairwise candidate counts as a match,
+# the same bar as match_transactions.MATCH_THRESHOLD
+PAIRWISE_THRESHOLD = 50
+
+def run_reconcile(data: Dict[str, Any], mode: str) -> Dict[str, str]:
+    """match_transactions.reconcile; returns {receipt id: transaction id} from its match events."""
+    pairs = {}
+
+    def sink(event: Dict[str, Any]) -> None:
+        if event['stage'] == 'matches':
+            for match in event['data']['matches']:
+                pairs[match['receipt']['id']] = match['transaction']['id']
+
+    with events_to(sink):
+        match_transactions.reconcile(data['receipts'], data['transactions'], mode)
+    return pairs
+
+def run_pairwise(data: Dict[str, Any]) -> Dict[str, str]:
+    """parse_receipt.match_receipts_with_transactions; each receipt's best candidate above the threshold."""
+    receipts = [parse_receipt.Receipt(**receipt) for receipt in data['receipts']]
+    pairs = {}
+    for result in parse_receipt.match_receipts_with_transactions(receipts, data['transactions']):
+        best = result['matches'][0]
+        if best['confidence'] >= PAIRWISE_THRESHOLD:
+            pairs[result['receipt_id']] = best['transaction_id']
+    return pairs
+
+def match_quality(pairs: Dict[str, str], truth: Dict[str, str]) -> Dict[str, Any]:
+    correct = sum(1 for receipt_id, transaction_id in pairs.items() if truth.get(receipt_id) == transaction_id)
+    precision = correct / len(pairs) if pairs else None
+    recall = correct / len(truth) if truth else None
+    f1 = 2 * precision * recall / (precision + recall) if precision and recall else 0.0
+    return {
+        "matches": len(pairs),
+        "correct": correct,
+        "precision": round(precision, 4) if precision is not None else None,
+        "recall": round(recall, 4) if recall is not None else None,
+        "f1": round(f1, 4)
+    }
+
+def measure(run: Callable[[], Dict[str, str]], memory: bool) -> Dict[str, Any]:
+    start = time.perf_counter()
+    pairs = run()
+    elapsed = time.perf_counter() - start
+    result = {"seconds": round(elapsed, 4), "pairs": pairs}
+    if memory:
+        # Separate pass, tracemalloc slows matching down considerably
+        tracemalloc.start()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["peak_memory_kb"] = round(peak / 1024, 1)
+    return result
+
+def benchmark_size(size: int, matchers: List[str], seed: int, profile, transactions_per_day: float,
+                   memory: bool) -> List[Dict[str, Any]]:
+    """Time each matcher on one generated data set and score it against the known matches."""
+    data = generate(size, seed, profile, transactions_per_day=transactions_per_day)
+    results = []
+    for matcher in matchers:
+        result = {"matcher": matcher, "size": size, "receipts": len(data['receipts']),
+                  "transactions": len(data['transactions'])}
+        if matcher == 'pairwise':
+            measured = measure(lambda: run_pairwise(data), memory)
+        else:
+            measured = measure(lambda: run_reconcile(data, matcher), memory)
+        pairs = measured.pop("pairs")
+        result.update(measured)
+        result["receipts_per_second"] = round(size / measured["seconds"]) if measured["seconds"] else None
+        result.update(match_quality(pairs, data['truth']))
+        results.append(result)
+    return results
+
+def _reconcile_to_devnull(data: Dict[str, Any], mode: str, progress: bool) -> Dict[str, Any]:
+    """Time reconcile with its events encoded and written out, as the CLI does, to os.devnull."""
+    written = {"events": 0, "bytes": 0}
+    fd = os.open(os.devnull, os.O_WRONLY)
+
+    def sink(event: Dict[str, Any]) -> None:
+        line = encode_event(event)
+        os.write(fd, line)
+        written["events"] += 1
+        written["bytes"] += len(line)
+
+    previous = os.environ.get('RECEIPT_PROGRESS')
+    os.environ['RECEIPT_PROGRESS'] = '1' if progress else '0'
+    try:
+        start = time.perf_counter()
+        with events_to(sink):
+            match_transactions.reconcile(data['receipts'], data['transactions'], mode)
+        written["seconds"] = time.perf_counter() - start
+    finally:
+        if previous is None:
+            del os.environ['RECEIPT_PROGRESS']
+        else:
+            os.environ['RECEIPT_PROGRESS'] = previous
+        os.close(fd)
+    return written
+
+def progress_overhead(size: int, matchers: List[str], seed: int, profile, transactions_per_day: float,
+                      repeat: int = 3) -> List[Dict[str, Any]]:
+    """Best-of-repeat reconcile time with progress events on and off, and what each run writes."""
+    data = generate(size, seed, profile, transactions_per_day=transactions_per_day)
+    results = []
+    for matcher in matchers:
+        if matcher == 'pairwise':
+            continue
+        runs: Dict[bool, List[Dict[str, Any]]] = {False: [], True: []}
+        # Alternated, so drift in machine load hits both sides alike
+        for _ in range(repeat):
+            for progress in (False, True):
+                runs[progress].append(_reconcile_to_devnull(data, matcher, progress))
+        quiet, reported = (min(runs[progress], key=lambda run: run["seconds"]) for progress in (False, True))
+        results.append({
+            "matcher": matcher,
+            "size": size,
+            "seconds_quiet": round(quiet["seconds"], 4),
+            "seconds_progress": round(reported["seconds"], 4),
+            "overhead_ratio": round(reported["seconds"] / quiet["seconds"], 3) if quiet["seconds"] else None,
+            "events_quiet": quiet["events"],
+            "events_progress": reported["events"],
+            "bytes_quiet": quiet["bytes"],
+            "bytes_progress": reported["bytes"]
+        })
+    return results
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment(seed: int, transactions_per_day: float) -> Dict[str, Any]:
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+        "transactions_per_day": transactions_per_day
+    }
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Per matcher and size: time and memory ratios, and quality deltas, against a saved run."""
+    previous = {(r['matcher'], r['size']): r for r in baseline.get('results', []) if 'seconds' in r}
+    comparisons = []
+    for result in results:
+        before = previous.get((result['matcher'], result['size']))
+        if before is None or 'seconds' not in result:
+            continue
+        entry = {"matcher": result['matcher'], "size": result['size'],
+                 "seconds_ratio": round(result['seconds'] / before['seconds'], 3) if before['seconds'] else None}
+        if result.get('peak_memory_kb') and before.get('peak_memory_kb'):
+            entry["peak_memory_ratio"] = round(result['peak_memory_kb'] / before['peak_memory_kb'], 3)
+        for key in ('precision', 'recall', 'f1'):
+            if result.get(key) is not None and before.get(key) is not None:
+                entry[key + "_delta"] = round(result[key] - before[key], 4)
+        comparisons.append(entry)
+    return comparisons
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time the receipt matchers on seeded synthetic data')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Receipts (and transactions) per run')
+    parser.add_argument('--matchers', nargs='+', choices=MATCHERS, default=MATCHERS,
+                        help='greedy/optimal: match_transactions.py; pairwise: parse_receipt.py --match')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--per-day', type=float, default=DEFAULT_TRANSACTIONS_PER_DAY,
+                        help='Transactions per day in the generated data')
+    parser.add_argument('--statements', nargs='+', metavar='CSV',
+                        help='Bank exports to sample references and amounts from (default: the repo exports)')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the peak memory pass')
+    parser.add_argument('--output', help='Write the results and environment as JSON to this file')
+    parser.add_argument('--compare', metavar='JSON', help='Compare with the results of an earlier --output')
+    parser.add_argument('--progress-overhead', action='store_true',
+                        help='Also time greedy/optimal with progress events on against off')
+    args = parser.parse_args()
+
+    profile = load_profile(args.statements)
+    results = []
+    for size in args.sizes:
+        for result in benchmark_size(size, args.matchers, args.seed, profile, args.per_day,
+                                     not args.no_memory):
+            print(json.dumps(result), flush=True)
+            results.append(result)
+        if args.progress_overhead:
+            for overhead in progress_overhead(size, args.matchers, args.seed, profile, args.per_day):
+                print(json.dumps({"progress_overhead": overhead}), flush=True)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        for entry in compare(results, baseline):
+            print(json.dumps({"comparison": entry}), flush=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"environment": environment(args.seed, args.per_day), "results": results}, f, indent=2)
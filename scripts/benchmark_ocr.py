@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional
+
+# parse_receipt mirrors its log to stdout; keep stdout for the results
+_stdout, sys.stdout = sys.stdout, sys.stderr
+try:
+    import parse_receipt
+finally:
+    sys.stdout = _stdout
+from make_receipt_fixtures import FIXTURE_DIR
+from ocr_backends import PytesseractBackend, TesserocrBackend
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.heic')
+BACKENDS = {'pytesseract': PytesseractBackend, 'tesserocr': TesserocrBackend}
+
+def _normalized(text: str) -> str:
+    return ' '.join(text.split()).lower()
+
+def text_similarity(expected: str, actual: str) -> float:
+    """Character-level similarity of two OCR texts, ignoring whitespace and case."""
+    return round(SequenceMatcher(None, _normalized(expected), _normalized(actual), autojunk=False).ratio(), 4)
+
+def start_backends(names: List[str]) -> Dict[str, Any]:
+    """The requested OCR backends, each started once; reports how long that took."""
+    backends = {}
+    for name in names:
+        start = time.perf_counter()
+        backends[name] = BACKENDS[name]()
+        print(json.dumps({"backend": name, "startup_seconds": round(time.perf_counter() - start, 4)}), flush=True)
+    return backends
+
+def variant(mode: str, backend: str, backends: Dict[str, Any]) -> str:
+    return mode if len(backends) == 1 else f"{mode}/{backend}"
+
+def benchmark_file(path: str, modes: List[str], backends: Dict[str, Any], repeat: int = 1) -> List[Dict[str, Any]]:
+    """Preprocess and OCR one image in every mode, with every backend.
+
+    Accuracy is measured against a `<name>.txt` transcription next to the
+    image when there is one; otherwise each variant is compared with the
+    first. OCR runs `repeat` times and the median is reported.
+    """
+    Image = parse_receipt._image_module()
+    transcription = os.path.splitext(path)[0] + '.txt'
+    expected: Optional[str] = None
+    if os.path.exists(transcription):
+        with open(transcription, 'r', encoding='utf-8') as f:
+            expected = f.read()
+
+    results = []
+    baseline = None
+    first = variant(modes[0], next(iter(backends)), backends)
+    for mode in modes:
+        image = Image.open(path)
+        start = time.perf_counter()
+        processed = parse_receipt.preprocess_image(image, mode)
+        preprocess_seconds = time.perf_counter() - start
+        for name, backend in backends.items():
+            ocr_seconds = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                text = backend.image_to_string(processed)
+                ocr_seconds.append(time.perf_counter() - start)
+            ocr = statistics.median(ocr_seconds)
+            result = {
+                "file": os.path.basename(path),
+                "mode": mode,
+                "backend": name,
+                "input_pixels": image.width * image.height,
+                "ocr_pixels": processed.width * processed.height,
+                "preprocess_seconds": round(preprocess_seconds, 4),
+                "ocr_seconds": round(ocr, 4),
+                "total_seconds": round(preprocess_seconds + ocr, 4)
+            }
+            if expected is not None:
+                result["accuracy"] = text_similarity(expected, text)
+            elif baseline is None:
+                baseline = text
+            else:
+                result["agreement_with_" + first] = text_similarity(baseline, text)
+            results.append(result)
+    return results
+
+def summarize(results: List[Dict[str, Any]], modes: List[str], backends: Dict[str, Any]) -> List[Dict[str, Any]]:
+    summary = []
+    first = variant(modes[0], next(iter(backends)), backends)
+    for mode, name in ((mode, name) for mode in modes for name in backends):
+        rows = [r for r in results if r['mode'] == mode and r['backend'] == name]
+        if not rows:
+            continue
+        entry = {
+            "mode": mode,
+            "backend": name,
+            "files": len(rows),
+            "median_ocr_seconds": round(statistics.median(r['ocr_seconds'] for r in rows), 4),
+            "median_total_seconds": round(statistics.median(r['total_seconds'] for r in rows), 4),
+            "sum_total_seconds": round(sum(r['total_seconds'] for r in rows), 4),
+            "median_ocr_pixels": statistics.median(r['ocr_pixels'] for r in rows)
+        }
+        for key in ("accuracy", "agreement_with_" + first):
+            scores = [r[key] for r in rows if key in r]
+            if scores:
+                entry["mean_" + key] = round(statistics.mean(scores), 4)
+        summary.append(entry)
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare OCR preprocessing modes and backends on a directory of receipt images')
+    parser.add_argument('directory', nargs='?', default=FIXTURE_DIR,
+                        help='Receipt images, optionally with <name>.txt transcriptions (default: the bundled synthetic receipts)')
+    parser.add_argument('--modes', nargs='+', choices=parse_receipt.PREPROCESS_MODES,
+                        default=list(parse_receipt.PREPROCESS_MODES))
+    parser.add_argument('--backends', nargs='+', choices=list(BACKENDS), default=['pytesseract'],
+                        help='OCR backends to run on every preprocessed image')
+    parser.add_argument('--repeat', type=int, default=1, help='OCR runs per image and variant; the median is reported')
+    args = parser.parse_args()
+
+    backends = start_backends(args.backends)
+    results = []
+    for name in sorted(os.listdir(args.directory)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        for result in benchmark_file(os.path.join(args.directory, name), args.modes, backends, args.repeat):
+            print(json.dumps(result), flush=True)
+            results.append(result)
+    for entry in summarize(results, args.modes, backends):
+        print(json.dumps({"summary": entry}), flush=True)
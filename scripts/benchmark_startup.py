@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def time_to_first_event(command: List[str]) -> Dict[str, Any]:
+    """Run a command and time how long it takes to print its first progress event."""
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                               text=True, cwd=SCRIPTS_DIR)
+    first_event = None
+    first_stage = None
+    for line in process.stdout:
+        # Log lines share stdout with the JSON events
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(event, dict) and 'stage' in event:
+            first_event = time.perf_counter() - start
+            first_stage = event['stage']
+            break
+    process.stdout.read()
+    process.wait()
+    return {
+        "first_event_seconds": first_event,
+        "first_stage": first_stage,
+        "total_seconds": time.perf_counter() - start,
+        "returncode": process.returncode
+    }
+
+def benchmark(runs: int) -> List[Dict[str, Any]]:
+    """Time cold starts of parse_receipt.py and match_transactions.py.
+
+    Both run against empty inputs so nothing but interpreter start-up,
+    imports and initialization is measured; no OpenAI request is made.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        data_path = os.path.join(tmp, 'data.json')
+        with open(data_path, 'w') as f:
+            json.dump({"receipts": [], "transactions": []}, f)
+        commands = {
+            "parse_receipt --scan": [sys.executable, os.path.join(SCRIPTS_DIR, 'parse_receipt.py'),
+                                     '--no-cache', '--scan', tmp],
+            "match_transactions": [sys.executable, os.path.join(SCRIPTS_DIR, 'match_transactions.py'), data_path]
+        }
+        for name, command in commands.items():
+            samples = [time_to_first_event(command) for _ in range(runs)]
+            first_events = [s['first_event_seconds'] for s in samples if s['first_event_seconds'] is not None]
+            results.append({
+                "command": name,
+                "runs": runs,
+                "first_stage": samples[-1]['first_stage'],
+                "median_first_event_seconds": round(statistics.median(first_events), 4) if first_events else None,
+                "min_first_event_seconds": round(min(first_events), 4) if first_events else None,
+                "median_total_seconds": round(statistics.median(s['total_seconds'] for s in samples), 4),
+                "failures": sum(1 for s in samples if s['returncode'] != 0)
+            })
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure time to the first progress event of the receipt scripts')
+    parser.add_argument('--runs', type=int, default=5, help='Cold starts per script')
+    args = parser.parse_args()
+
+    for result in benchmark(args.runs):
+        print(json.dumps(result), flush=True)
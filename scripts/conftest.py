@@ -0,0 +1,11 @@
+import os
+
+# The scripts import each other as siblings; pytest puts this directory on
+# sys.path for the test modules next to it.
+
+# parse_receipt needs a key to import; tests that call GPT point
+# OPENAI_BASE_URL at a local server
+os.environ.setdefault('OPENAI_API_KEY', 'test-key')
+
+# An OpenAI connection check run by hand, not a test
+collect_ignore = ['test_openai.py']
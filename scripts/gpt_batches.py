@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from receipt_fields import REQUIRED_FIELDS
+
+# Receipt text tokens per batched GPT request; 0 sends one receipt per request
+DEFAULT_BATCH_TOKENS = 0
+# Receipts are mostly short words and digits, which tokenize densely; the
+# estimate errs high so a batch stays under its budget
+CHARS_PER_TOKEN = 3
+# Every receipt adds its fields (and line items) to the response, which is
+# capped far lower than the prompt
+MAX_BATCH_RECEIPTS = 8
+NUMERIC_FIELDS = ('total_amount', 'vat_amount')
+
+# (key, text) pairs; the key is whatever the caller needs to place the result
+Batch = List[Tuple[Any, str]]
+
+def batch_token_budget() -> int:
+    """Receipt text tokens per GPT request, from --gpt-batch-tokens / RECEIPT_GPT_BATCH_TOKENS."""
+    return max(0, int(os.getenv('RECEIPT_GPT_BATCH_TOKENS') or DEFAULT_BATCH_TOKENS))
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+class BatchPacker:
+    """Packs receipt texts, in arrival order, into batches of at most `budget`
+    estimated tokens and MAX_BATCH_RECEIPTS receipts.
+
+    A text over the budget by itself makes a batch of one. `measure` gives
+    a text's tokens as it will be sent.
+    """
+
+    def __init__(self, budget: int, max_receipts: int = MAX_BATCH_RECEIPTS,
+                 measure: Callable[[str], int] = estimate_tokens):
+        self.budget = budget
+        self.max_receipts = max_receipts
+        self.measure = measure
+        self._pending: Batch = []
+        self._tokens = 0
+
+    def add(self, key: Any, text: str) -> List[Batch]:
+        """Queue a receipt; returns the batches that are now full."""
+        tokens = self.measure(text)
+        full = []
+        if self._pending and (self._tokens + tokens > self.budget or len(self._pending) >= self.max_receipts):
+            full.append(self._take())
+        self._pending.append((key, text))
+        self._tokens += tokens
+        if self._tokens >= self.budget:
+            full.append(self._take())
+        return full
+
+    def flush(self) -> List[Batch]:
+        """The last, partly filled batch, if any."""
+        return [self._take()] if self._pending else []
+
+    def _take(self) -> Batch:
+        batch, self._pending, self._tokens = self._pending, [], 0
+        return batch
+
+def batch_receipts_text(texts: List[str]) -> str:
+    """The receipts of one request, each under a header with its id (1, 2, ...)."""
+    return '\n\n'.join(f"=== Receipt id {position} ===\n{text.strip()}"
+                       for position, text in enumerate(texts, start=1))
+
+def valid_entry(entry: Any) -> bool:
+    """Whether a batch entry has every required field and numbers where amounts go."""
+    if not isinstance(entry, dict) or any(field not in entry for field in REQUIRED_FIELDS):
+        return False
+    for field in NUMERIC_FIELDS:
+        if entry[field] is not None:
+            try:
+                float(entry[field])
+            except (TypeError, ValueError):
+                return False
+    return True
+
+def parse_batch_response(content: Optional[str], count: int) -> Tuple[Dict[int, Dict[str, Any]], List[int]]:
+    """Split a batch response into valid entries by position (0-based) and the failed positions.
+
+    An entry fails when it is missing, repeated or invalid; a response that
+    is not the expected JSON fails them all.
+    """
+    try:
+        entries = json.loads(content or '').get('receipts')
+    except (ValueError, AttributeError):
+        entries = None
+    if not isinstance(entries, list):
+        return {}, list(range(count))
+    found: Dict[int, Any] = {}
+    repeated = set()
+    for entry in entries:
+        try:
+            position = int(entry.get('id')) - 1
+        except (AttributeError, TypeError, ValueError):
+            continue
+        if not 0 <= position < count:
+            continue
+        if position in found:
+            repeated.add(position)
+        found[position] = entry
+    parsed = {}
+    for position, entry in found.items():
+        if position not in repeated and valid_entry(entry):
+            # Nulls become the defaults a single request fills in
+            parsed[position] = {field: value for field, value in entry.items() if field != 'id' and value is not None}
+    return parsed, [position for position in range(count) if position not in parsed]
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import re
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from receipt_fields import REQUIRED_FIELDS
+from text_compaction import compact_text
+
+# Follow-up requests per receipt for fields GPT left out or got wrong; off
+# unless asked for, as each one is another paid request
+DEFAULT_REASKS = 0
+# A follow-up sends the header and field lines of the receipt, not all of it
+REASK_TEXT_TOKENS = 250
+
+FIELD_DESCRIPTIONS = {
+    'supplier_name': 'The company issuing the receipt/invoice',
+    'invoice_number': 'The invoice or receipt number',
+    'date': 'The payment/invoice date (YYYY-MM-DD format)',
+    'total_amount': 'The final/grand total amount (as a number)',
+    'currency': 'The currency code (e.g., SEK, USD)',
+    'vat_amount': 'The VAT/tax amount (as a number)'
+}
+
+_CURRENCY_CODE = re.compile(r'^[A-Z]{3}$')
+
+def reask_budget() -> int:
+    """Follow-up requests per receipt, from --gpt-reasks / RECEIPT_GPT_REASKS (0 = none)."""
+    return max(0, int(os.getenv('RECEIPT_GPT_REASKS') or DEFAULT_REASKS))
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def invalid_fields(parsed_data: Dict[str, Any]) -> Dict[str, str]:
+    """Required fields of a GPT response that are missing or implausible, with the reason.
+
+    The date must parse as YYYY-MM-DD, the total must be positive, VAT must
+    be between 0 and the total and the currency a three-letter code.
+    """
+    problems = {}
+    for field in REQUIRED_FIELDS:
+        value = parsed_data.get(field)
+        if value is None or (isinstance(value, str) and value.strip().lower() in ('', 'unknown', 'n/a', 'null')):
+            problems[field] = 'missing'
+    if 'date' not in problems:
+        try:
+            if not 2000 <= datetime.strptime(str(parsed_data['date']), '%Y-%m-%d').year <= 2100:
+                problems['date'] = 'not a plausible year'
+        except ValueError:
+            problems['date'] = 'not a YYYY-MM-DD date'
+    total = _number(parsed_data.get('total_amount'))
+    if 'total_amount' not in problems:
+        if total is None:
+            problems['total_amount'] = 'not a number'
+        elif total <= 0:
+            problems['total_amount'] = 'not positive'
+    if 'vat_amount' not in problems:
+        vat = _number(parsed_data['vat_amount'])
+        if vat is None:
+            problems['vat_amount'] = 'not a number'
+        elif vat < 0:
+            problems['vat_amount'] = 'negative'
+        elif total is not None and total > 0 and vat > total:
+            # Either can be the wrong one
+            problems['vat_amount'] = 'more than the total'
+            problems['total_amount'] = 'less than the VAT'
+    if 'currency' not in problems and not _CURRENCY_CODE.match(str(parsed_data['currency'])):
+        problems['currency'] = 'not a currency code'
+    return problems
+
+def reask_prompt(text: str, problems: Dict[str, str], parsed_data: Dict[str, Any]) -> str:
+    """A prompt for just the fields in `problems`, with the receipt's header and field lines."""
+    fields = '\n'.join(
+        f"- {field}: {FIELD_DESCRIPTIONS[field]}"
+        + ('' if reason == 'missing' else f" (previously {json.dumps(parsed_data.get(field))}: {reason})")
+        for field, reason in problems.items()
+    )
+    return f"""From this receipt/invoice text, extract only these fields. Format the response as a JSON object with just these keys; use null for a field that is not in the text:
+{fields}
+
+Receipt text:
+{compact_text(text, REASK_TEXT_TOKENS)}
+
+Respond only with the JSON object, no additional text."""
+
+def merge_answer(parsed_data: Dict[str, Any], content: Optional[str], problems: Dict[str, str]) -> Dict[str, Any]:
+    """parsed_data with the follow-up answers that fix their field; other answers are ignored."""
+    try:
+        answer = json.loads(content or '')
+    except ValueError:
+        return parsed_data
+    if not isinstance(answer, dict):
+        return parsed_data
+    answered = {field: answer[field] for field in problems if answer.get(field) is not None}
+    # Checked together, as VAT is checked against the total
+    still_invalid = invalid_fields({**parsed_data, **answered})
+    return {**parsed_data, **{field: value for field, value in answered.items() if field not in still_invalid}}
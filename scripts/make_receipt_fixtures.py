@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import random
+from typing import Any, Dict, List, Optional, Tuple
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'receipts')
+
+# Synthetic receipts: the printed lines and the fields a reader would take
+# from them. Some are easy for the local extractor, some need GPT.
+RECEIPTS: List[Dict[str, Any]] = [
+    {
+        'name': 'ica_nara',
+        'lines': ['ICA Nära Södermalm', 'Götgatan 12, 118 46 Stockholm', 'Org.nr 556123-4567',
+                  'Kvitto nr 40211', 'Datum 2024-03-14 17:42', '',
+                  'Mjölk 3% 1,5L            18,90', 'Bröd Levain              42,00',
+                  'Ost Präst 700g           89,95', '',
+                  'Totalt SEK              150,85', 'Moms 12%                 16,16',
+                  'Kortköp VISA ****1234   150,85'],
+        'fields': {'supplier_name': 'ICA Nära Södermalm', 'invoice_number': '40211', 'date': '2024-03-14',
+                   'total_amount': 150.85, 'currency': 'SEK', 'vat_amount': 16.16}
+    },
+    {
+        'name': 'clas_ohlson',
+        'lines': ['Clas Ohlson AB', 'Org.nr 556035-8672', 'Kvittonr 7781-2209', 'Datum: 2024-01-09', '',
+                  'Skruvdragare 18V       1 299,00', 'Bits 32 delar            149,00', '',
+                  'Att betala SEK         1 448,00', 'Moms 25%                 289,60'],
+        'fields': {'supplier_name': 'Clas Ohlson AB', 'invoice_number': '7781-2209', 'date': '2024-01-09',
+                   'total_amount': 1448.00, 'currency': 'SEK', 'vat_amount': 289.60}
+    },
+    {
+        'name': 'espresso_house',
+        'lines': ['Espresso House', 'Org.nr 556758-6345', 'Kvitto 2024-0611-883', '11.06.2024 08:15', '',
+                  'Cappuccino               49,00', 'Kanelbulle               35,00', '',
+                  'Summa                    84,00', 'Moms 12%                  9,00', 'Kortköp                  84,00'],
+        'fields': {'supplier_name': 'Espresso House', 'invoice_number': '2024-0611-883', 'date': '2024-06-11',
+                   'total_amount': 84.00, 'currency': 'SEK', 'vat_amount': 9.00}
+    },
+    {
+        'name': 'bauhaus_two_rates',
+        'lines': ['BAUHAUS Barkarby', 'Org.nr 556360-7823', 'Kvitto nr 99120', 'Köpdatum 2024/02/27', '',
+                  'Färg vit 10L            899,00', 'Pensel 50mm               59,90', 'Kaffe 500g                54,90', '',
+                  'Totalt                1 013,80', 'Moms 25%                 191,78', 'Moms 12%                   5,88',
+                  'Summa moms               197,66'],
+        'fields': {'supplier_name': 'BAUHAUS Barkarby', 'invoice_number': '99120', 'date': '2024-02-27',
+                   'total_amount': 1013.80, 'currency': 'SEK', 'vat_amount': 197.66}
+    },
+    {
+        'name': 'circle_k',
+        'lines': ['Circle K Kungens Kurva', 'Kvitto nr 5521873', '2024-04-02', '',
+                  'Diesel 42,31 l           812,35', 'Spolarvätska              79,00', '',
+                  'Totalt                   891,35', 'Moms 25%                 178,27'],
+        'fields': {'supplier_name': 'Circle K Kungens Kurva', 'invoice_number': '5521873', 'date': '2024-04-02',
+                   'total_amount': 891.35, 'currency': 'SEK', 'vat_amount': 178.27}
+    },
+    {
+        'name': 'hotel_berlin',
+        'lines': ['Hotel Am Kanal GmbH', 'Invoice No. HB-20240518', 'Invoice date 18.05.2024', '',
+                  'Room 2 nights          238,00 EUR', 'Breakfast               36,00 EUR', '',
+                  'Total EUR               274,00', 'VAT 7%                   17,93'],
+        'fields': {'supplier_name': 'Hotel Am Kanal GmbH', 'invoice_number': 'HB-20240518', 'date': '2024-05-18',
+                   'total_amount': 274.00, 'currency': 'EUR', 'vat_amount': 17.93}
+    },
+    {
+        'name': 'london_taxi',
+        'lines': ['Receipt', 'City Cabs London', 'Receipt No 31877', 'Date 2024-09-21', '',
+                  'Fare                     £24.50', 'Tip                       £3.00', '',
+                  'Total                    £27.50', 'VAT 0%                    £0.00'],
+        'fields': {'supplier_name': 'City Cabs London', 'invoice_number': '31877', 'date': '2024-09-21',
+                   'total_amount': 27.50, 'currency': 'GBP', 'vat_amount': 0.00}
+    },
+    {
+        'name': 'restaurant_no_number',
+        'lines': ['Restaurang Pelikan', 'Blekingegatan 40', 'Tel 08-556 090 90', '2024-10-04 20:31', '',
+                  'Pytt i panna             195,00', 'Öl 50cl                   89,00', '',
+                  'Totalt                   284,00', 'Moms 12%                  20,89', 'Moms 25%                  17,80'],
+        'fields': {'supplier_name': 'Restaurang Pelikan', 'invoice_number': None, 'date': '2024-10-04',
+                   'total_amount': 284.00, 'currency': 'SEK', 'vat_amount': 38.69}
+    },
+    {
+        'name': 'software_invoice',
+        'lines': ['Faktura', 'Molnkontor Sverige AB', 'Org.nr 559201-4410', 'Fakturanummer 2024-1187',
+                  'Fakturadatum 2024-07-01', 'Förfallodatum 2024-07-31', '',
+                  'Licenser 5 st          2 500,00', '', 'Summa exkl. moms       2 500,00',
+                  'Moms 25%                 625,00', 'Att betala SEK         3 125,00'],
+        'fields': {'supplier_name': 'Molnkontor Sverige AB', 'invoice_number': '2024-1187', 'date': '2024-07-01',
+                   'total_amount': 3125.00, 'currency': 'SEK', 'vat_amount': 625.00}
+    },
+    {
+        'name': 'parking_faded',
+        'lines': ['EasyPark', 'Kvitto', 'Start 2024-08-15 09:02', 'Slut 2024-08-15 11:47', '',
+                  'Parkering zon 4021        62,00', 'Serviceavgift              4,90', '',
+                  'Betalt                    66,90', 'Varav moms                13,38'],
+        'fields': {'supplier_name': 'EasyPark', 'invoice_number': None, 'date': '2024-08-15',
+                   'total_amount': 66.90, 'currency': 'SEK', 'vat_amount': 13.38},
+        'faded': True
+    }
+]
+
+# Multi-page invoices as OCR reads them: the header and legal footer repeat
+# on every page, with page counters and specks read as symbols. Only their
+# text is bundled, for the compaction benchmark.
+INVOICES: List[Dict[str, Any]] = [
+    {
+        'name': 'noisy_telia_invoice',
+        'header': ['Telia Sverige AB', 'Stjärntorget 1, 169 94 Solna', 'Org.nr 556430-0142'],
+        'details': ['Fakturanummer 88123456', 'Fakturadatum 2024-05-02', 'Förfallodatum 2024-05-31',
+                    'Kundnummer 1029384'],
+        'items': [f'Mobilabonnemang 070-{100 + i:03d} {4000 + 37 * i:04d}' for i in range(24)],
+        'prices': (99, 349), 'vat_rate': 0.25, 'currency': 'SEK', 'pages': 3,
+        'footer': ['Styrelsens säte Stockholm. Godkänd för F-skatt.', 'Bankgiro 5025-0062 Plusgiro 4 31 00-9',
+                   'Kundtjänst 90 200 telia.se/foretag']
+    },
+    {
+        'name': 'noisy_vattenfall_invoice',
+        'header': ['Vattenfall AB', 'Evenemangsgatan 13, 169 79 Solna', 'Org.nr 556036-2138'],
+        'details': ['Fakturanummer 512009871', 'Fakturadatum 2024-02-05', 'Anläggnings-id 735999100012345678'],
+        'items': [f'Elförbrukning januari vecka {week}' for week in range(1, 6)]
+                 + ['Elnätsavgift', 'Effektavgift', 'Energiskatt', 'Elcertifikat'],
+        'prices': (120, 900), 'vat_rate': 0.25, 'currency': 'SEK', 'pages': 2,
+        'footer': ['Vattenfall AB, säte Stockholm', 'Innehar F-skattsedel', 'Frågor? Ring 020-82 00 00']
+    },
+    {
+        'name': 'noisy_dhl_invoice',
+        'header': ['DHL Freight GmbH', 'Godesberger Allee 102-104, 53175 Bonn', 'VAT ID DE 812 345 678'],
+        'details': ['Invoice No. DF-24-0098812', 'Invoice date 2024-08-19', 'Customer 4410023'],
+        'items': [f'Shipment 70{3300 + 17 * i} Hamburg-Stockholm pallet' for i in range(18)],
+        'prices': (40, 260), 'vat_rate': 0.19, 'currency': 'EUR', 'pages': 3, 'english': True,
+        'footer': ['Registered office Bonn, HRB 1234', 'All business is transacted under ADSp 2017',
+                   'Payment within 30 days without deduction']
+    },
+    {
+        'name': 'noisy_lyreco_invoice',
+        'header': ['Lyreco Sverige AB', 'Box 1234, 131 26 Nacka', 'Org.nr 556219-5489'],
+        'details': ['Fakturanr 3300123987', 'Fakturadatum 2024-09-30', 'Er referens Anna Berg'],
+        'items': [f'{product} art.nr {10000 + 7 * i}'
+                  for i, product in enumerate(['Kopieringspapper A4', 'Kulspetspenna blå', 'Pärm A4 50mm',
+                                               'Post-it 76x76', 'Whiteboardpenna', 'Häftapparat',
+                                               'Toner svart', 'Kuvert C5', 'Gem 28mm', 'Tejp 19mm'] * 4)],
+        'prices': (12, 480), 'vat_rate': 0.25, 'currency': 'SEK', 'pages': 4,
+        'footer': ['Allmänna leveransvillkor se lyreco.se', 'Dröjsmålsränta debiteras enligt räntelagen',
+                   'Godkänd för F-skatt']
+    },
+    {
+        'name': 'noisy_hotel_folio',
+        'header': ['The Grand Harbour Hotel Ltd', '12 Quay Street, Bristol BS1 4DJ', 'VAT Reg GB 123 4567 89'],
+        'details': ['Invoice No. GH-77120', 'Invoice date 2024-11-08', 'Guest Mr J Lindqvist, room 412'],
+        'items': [f'{item} {day:02d} Nov' for day in range(3, 8)
+                  for item in ('Room charge', 'Breakfast', 'Restaurant')],
+        'prices': (14, 189), 'vat_rate': 0.20, 'currency': 'GBP', 'pages': 2, 'english': True,
+        'footer': ['Registered in England No. 0456789', 'Thank you for staying with us',
+                   'reservations@grandharbour.example']
+    },
+    {
+        'name': 'noisy_fortnox_invoice',
+        'header': ['Fortnox AB', 'Box 427, 351 06 Växjö', 'Org.nr 556469-6291'],
+        'details': ['Fakturanummer 7200451', 'Fakturadatum 2024-01-15', 'Period 2024-01-01 - 2024-12-31'],
+        'items': [f'Licens {module}' for module in ('Bokföring', 'Fakturering', 'Lön', 'Tid', 'Order',
+                                                   'Lager', 'Anläggningsregister', 'Koncern')],
+        'prices': (99, 2400), 'vat_rate': 0.25, 'currency': 'SEK', 'pages': 2,
+        'footer': ['Fortnox AB är godkänd för F-skatt', 'Betalningsvillkor 30 dagar netto',
+                   'Vid frågor kontakta support@fortnox.se']
+    }
+]
+NOISE = ['.,;:', '~ ~ -', '| | |', "'' .", '_____', '°=', '» ,']
+
+def _amount(value: float, english: bool) -> str:
+    if english:
+        return f'{value:.2f}'
+    whole, cents = f'{value:.2f}'.split('.')
+    return f"{int(whole):,}".replace(',', ' ') + ',' + cents
+
+def invoice_text(invoice: Dict[str, Any], seed: int) -> Tuple[str, Dict[str, Any]]:
+    """The OCR text of a multi-page invoice, and its fields."""
+    rng = random.Random(seed)
+    english = invoice.get('english', False)
+    low, high = invoice['prices']
+    prices = [round(rng.uniform(low, high), 2) for _ in invoice['items']]
+    net = round(sum(prices), 2)
+    vat = round(net * invoice['vat_rate'], 2)
+    total = round(net + vat, 2)
+    rate = f"{round(invoice['vat_rate'] * 100)}%"
+    summary = ([f"Subtotal {_amount(net, True)}", f"VAT {rate} {_amount(vat, True)}",
+                f"Total {invoice['currency']} {_amount(total, True)}"] if english else
+               [f"Summa exkl. moms {_amount(net, False)}", f"Moms {rate} {_amount(vat, False)}",
+                f"Att betala {invoice['currency']} {_amount(total, False)}"])
+    lines = [f"{item} {_amount(price, english)}" for item, price in zip(invoice['items'], prices)]
+    pages = invoice['pages']
+    per_page = -(-len(lines) // pages)
+    out = []
+    for page in range(pages):
+        out += invoice['header']
+        out += invoice['details'] if page == 0 else [invoice['details'][0]]
+        out.append('')
+        out += lines[page * per_page:(page + 1) * per_page]
+        if page == pages - 1:
+            out += [''] + summary
+        out += [''] + invoice['footer']
+        out.append(f"Page {page + 1} of {pages}" if english else f"Sida {page + 1} av {pages}")
+    text = []
+    for line in out:
+        # Specks and fold marks read as symbols, and uneven spacing
+        if rng.random() < 0.15:
+            text.append(rng.choice(NOISE))
+        text.append(line.replace(' ', '  ', 1) if rng.random() < 0.3 else line)
+    invoice_number = invoice['details'][0].split()[-1]
+    date = invoice['details'][1].split()[-1]
+    fields = {'supplier_name': invoice['header'][0], 'invoice_number': invoice_number, 'date': date,
+              'total_amount': total, 'currency': invoice['currency'], 'vat_amount': vat}
+    return '\n'.join(text) + '\n', fields
+
+def load_font(path: Optional[str] = None):
+    """A monospaced TrueType font with Swedish letters; Pillow's own font lacks them."""
+    from PIL import ImageFont
+    for candidate in ([path] if path else []) + ['DejaVuSansMono.ttf', 'LiberationMono-Regular.ttf']:
+        try:
+            return ImageFont.truetype(candidate, 22)
+        except OSError:
+            if candidate == path:
+                raise
+    return ImageFont.load_default(size=22)
+
+def render(lines: List[str], seed: int, font, faded: bool = False):
+    """A photo-like picture of a printed receipt: paper on a darker table, slightly rotated, with noise."""
+    from PIL import Image, ImageDraw, ImageFilter
+    rng = random.Random(seed)
+    line_height, margin = 30, 28
+    width = 2 * margin + max(int(font.getlength(line)) for line in lines)
+    paper = Image.new('L', (width, 2 * margin + line_height * len(lines)), 245)
+    draw = ImageDraw.Draw(paper)
+    ink = 110 if faded else 20
+    for position, line in enumerate(lines):
+        draw.text((margin, margin + position * line_height), line, fill=ink, font=font)
+
+    photo = Image.new('L', (paper.width + 160, paper.height + 160), 90)
+    photo.paste(paper.rotate(rng.uniform(-2.5, 2.5), expand=True, fillcolor=90), (rng.randint(40, 100), rng.randint(40, 100)))
+    # Seeded, so regenerating gives the same pictures
+    noise = Image.frombytes('L', photo.size, bytes(min(255, max(0, int(rng.gauss(128, 12))))
+                                                   for _ in range(photo.width * photo.height)))
+    photo = Image.blend(photo, noise, 0.08).filter(ImageFilter.GaussianBlur(0.6))
+    # Colour, like a phone photo
+    return photo.convert('RGB')
+
+def _write_fields(base: str, fields: Dict[str, Any]) -> None:
+    with open(base + '.json', 'w', encoding='utf-8') as f:
+        json.dump(fields, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+
+def write_fixtures(directory: str = FIXTURE_DIR, font_path: Optional[str] = None) -> List[str]:
+    """Write <name>.jpg, its <name>.txt transcription and <name>.json fields for every receipt,
+    and the <name>.txt OCR text and <name>.json fields of every invoice."""
+    os.makedirs(directory, exist_ok=True)
+    font = load_font(font_path)
+    names = []
+    for seed, receipt in enumerate(RECEIPTS):
+        base = os.path.join(directory, receipt['name'])
+        render(receipt['lines'], seed, font, receipt.get('faded', False)).save(base + '.jpg', quality=85)
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            f.write('\n'.join(receipt['lines']) + '\n')
+        _write_fields(base, receipt['fields'])
+        names.append(receipt['name'])
+    for seed, invoice in enumerate(INVOICES):
+        base = os.path.join(directory, invoice['name'])
+        text, fields = invoice_text(invoice, seed)
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            f.write(text)
+        _write_fields(base, fields)
+        names.append(invoice['name'])
+    return names
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Write the synthetic receipt fixtures used by the OCR, field and compaction benchmarks')
+    parser.add_argument('directory', nargs='?', default=FIXTURE_DIR)
+    parser.add_argument('--font', help='TrueType font to print with (default DejaVu Sans Mono when installed)')
+    args = parser.parse_args()
+
+    print(json.dumps({"directory": args.directory, "receipts": write_fixtures(args.directory, args.font)}))
@@ -4,12 +4,26 @@ import json
 import sys
 import os
 from datetime import datetime
-from typing import Dict, List, Any, Union, Optional, Tuple
-import openai
+from typing import Dict, Iterable, Iterator, List, Any, Union, Optional, Set, Tuple
 from difflib import SequenceMatcher
 from dateutil.parser import parse
 from dateutil.relativedelta import relativedelta
+import argparse
+import heapq
 import re
+import time
+from contextlib import nullcontext
+from bank_statements import iter_statements
+from reconciliation_store import ReconciliationStore
+from progress_events import ProgressReporter, current_reporter, emit_event
+from stage_timings import collecting, run_summary, timed
+from supplier_aliases import SupplierAliasIndex
+from matching_engine import WEIGHTED_RULES, CandidateIndex, MatchEngine, normalize_amount, score_pair
+
+MATCH_THRESHOLD = WEIGHTED_RULES.threshold
+# Statement columns matching and its output use; exports also carry
+# balances, fees and states
+STATEMENT_COLUMNS = ('id', 'date', 'amount', 'reference', 'currency')
 
 def send_progress(stage: str, progress: float, message: str, data: Dict[str, Any] = None) -> None:
     """Send progress updates as JSON to stdout."""
@@ -20,193 +34,542 @@ def send_progress(stage: str, progress: float, message: str, data: Dict[str, Any
     }
     if data is not None:
         output["data"] = data
-    print(json.dumps(output), flush=True)
+    emit_event(output)
+
+def calculate_match_score(receipt: Dict[str, Any], transaction: Dict[str, Any],
+                          aliases: Optional[SupplierAliasIndex] = None) -> Tuple[float, List[str]]:
+    """Calculate a match score between a receipt and transaction with detailed reasons."""
+    return score_pair(receipt, transaction, WEIGHTED_RULES, aliases)
+
+def receipt_features(receipt: Dict[str, Any]) -> Dict[str, Any]:
+    """The receipt fields calculate_match_score depends on, normalized."""
+    return {
+        "total_amount": normalize_amount(receipt['total_amount']),
+        "date": receipt['date'],
+        "supplier_name": receipt['supplier_name'].lower(),
+        "invoice_number": str(receipt['invoice_number']).lower() if receipt.get('invoice_number') else None
+    }
 
-def normalize_amount(amount: str | float | int) -> float:
-    """Normalize amount string to float, handling various formats."""
-    if isinstance(amount, (float, int)):
-        return float(amount)
+def transaction_features(transaction: Dict[str, Any]) -> Dict[str, Any]:
+    """The transaction fields calculate_match_score depends on, normalized."""
+    return {
+        "amount": normalize_amount(transaction['amount']),
+        "date": transaction['date'],
+        "reference": transaction['reference'].lower()
+    }
+
+def find_greedy_matches(receipts: List[Dict[str, Any]], scorer: MatchEngine,
+                        report: bool = True) -> List[Dict[str, Any]]:
+    """Give each receipt, in input order, its best still-unused transaction."""
+    matches = []
+    used_transactions = set()
+    transactions = scorer.transactions
+    progress = current_reporter() if report else None
+    if progress:
+        progress.start('score', len(receipts))
+    
+    for receipt_num, receipt in enumerate(receipts):
+        best_match = None
+        best_score = 0
+        best_reasons = []
+        
+        positions = [
+            t for t in scorer.index.candidate_positions(receipt)
+            if transactions[t]['id'] not in used_transactions
+        ]
+        
+        if progress:
+            progress.advance(receipt_num)
+            if progress.due():
+                progress.progress("progress", f"Analyzing matches... ({len(matches)} found)")
+        
+        for t, score, reasons in scorer.score(receipt, positions):
+            if score > best_score:
+                best_score = score
+                best_match = transactions[t]
+                best_reasons = reasons
+        
+        # If we found a good match (confidence > 50%)
+        if best_match and best_score >= MATCH_THRESHOLD:
+            match_data = {
+                "receipt": receipt,
+                "transaction": best_match,
+                "confidence_score": best_score,
+                "reasons": best_reasons
+            }
+            matches.append(match_data)
+            used_transactions.add(best_match['id'])
+            
+            if progress:
+                progress.match(match_data)
     
-    # Remove spaces and currency symbols
-    amount = str(amount).strip().replace(' ', '')
-    amount = re.sub(r'[£$€]', '', amount)
+    if progress:
+        progress.advance(len(receipts))
+    return matches
+
+def build_score_matrix(receipts: List[Dict[str, Any]], scorer: MatchEngine,
+                       clean_receipts: Optional[Set[str]] = None,
+                       clean_transactions: Optional[Set[str]] = None) -> Dict[Tuple[int, int], Tuple[float, List[str]]]:
+    """Score candidate pairs, keeping only those at or above MATCH_THRESHOLD.
+
+    Keys are (receipt position, transaction position); pairs below the
+    threshold are left out, so the matrix stays sparse. Pairs of a clean
+    receipt and a clean transaction (unchanged since the last incremental
+    run, which stored their scores) are skipped.
+    """
+    scores = {}
+    changed = None
+    if clean_receipts:
+        # Clean receipts only pair up with new or changed transactions; index those alone
+        changed = [t for t, transaction in enumerate(scorer.transactions)
+                   if str(transaction['id']) not in clean_transactions]
+        changed_index = CandidateIndex(scorer.amounts[changed].tolist(), scorer.days[changed].tolist(), scorer.rules)
+    progress = current_reporter()
+    if progress:
+        progress.start('score', len(receipts))
+    for r, receipt in enumerate(receipts):
+        if progress:
+            progress.advance(r)
+            if progress.due():
+                progress.progress("progress", f"Scoring candidate pairs... ({len(scores)} found)")
+        if changed is not None and str(receipt['id']) in clean_receipts:
+            positions = [changed[p] for p in changed_index.candidate_positions(receipt)]
+        else:
+            positions = scorer.index.candidate_positions(receipt)
+        for t, score, reasons in scorer.score(receipt, positions):
+            if score >= MATCH_THRESHOLD:
+                scores[(r, t)] = (score, reasons)
+    if progress:
+        progress.advance(len(receipts))
+    return scores
+
+def _connected_components(scores: Dict[Tuple[int, int], Any]) -> List[List[Tuple[int, int]]]:
+    """Split the sparse score matrix into independent groups of pairs."""
+    parent: Dict[Tuple[str, int], Tuple[str, int]] = {}
     
-    # Convert comma to decimal point if needed
-    if ',' in amount and '.' not in amount:
-        amount = amount.replace(',', '.')
-    elif ',' in amount and '.' in amount:
-        amount = amount.replace(',', '')
+    def find(node):
+        parent.setdefault(node, node)
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
     
-    # Handle negative amounts
-    is_negative = amount.startswith('-')
-    amount = amount.replace('-', '')
+    for r, t in scores:
+        root_r, root_t = find(('r', r)), find(('t', t))
+        if root_r != root_t:
+            parent[root_r] = root_t
     
-    try:
-        value = float(amount)
-        return -value if is_negative else value
-    except ValueError:
-        return 0.0
+    components: Dict[Tuple[str, int], List[Tuple[int, int]]] = {}
+    for pair in scores:
+        components.setdefault(find(('r', pair[0])), []).append(pair)
+    return list(components.values())
 
-def calculate_match_score(receipt: Dict[str, Any], transaction: Dict[str, Any]) -> Tuple[float, List[str]]:
-    """Calculate a match score between a receipt and transaction with detailed reasons."""
-    score = 0.0
-    reasons = []
-    
-    # Compare amounts (30% weight)
-    receipt_amount = normalize_amount(receipt['total_amount'])
-    transaction_amount = normalize_amount(transaction['amount'])
-    amount_diff = abs(receipt_amount - abs(transaction_amount))
-    amount_threshold = max(receipt_amount, abs(transaction_amount)) * 0.01  # 1% tolerance
-    
-    if amount_diff <= amount_threshold:
-        score += 0.3
-        reasons.append(f"Amount matches exactly: {receipt_amount:.2f} = {abs(transaction_amount):.2f}")
-    elif amount_diff <= amount_threshold * 3:  # 3% tolerance
-        score += 0.2
-        reasons.append(f"Amount matches within tolerance: {receipt_amount:.2f} ≈ {abs(transaction_amount):.2f}")
-    
-    # Compare dates (25% weight)
-    receipt_date = datetime.strptime(receipt['date'], '%Y-%m-%d').date()
-    transaction_date = datetime.strptime(transaction['date'], '%Y-%m-%d').date()
-    date_diff = abs((receipt_date - transaction_date).days)
-    
-    if date_diff == 0:
-        score += 0.25
-        reasons.append("Dates match exactly")
-    elif date_diff <= 3:
-        score += 0.15
-        reasons.append(f"Dates are close: {date_diff} days apart")
-    elif date_diff <= 7:
-        score += 0.1
-        reasons.append(f"Dates are within a week: {date_diff} days apart")
-    
-    # Compare supplier names (25% weight)
-    supplier_name = receipt['supplier_name'].lower()
-    transaction_ref = transaction['reference'].lower()
-    
-    if supplier_name in transaction_ref:
-        score += 0.25
-        reasons.append(f"Supplier name '{supplier_name}' found in transaction reference")
-    else:
-        # Check for partial matches
-        words = supplier_name.split()
-        matched_words = [word for word in words if word in transaction_ref]
-        if matched_words:
-            partial_score = min(len(matched_words) / len(words) * 0.25, 0.15)
-            score += partial_score
-            reasons.append(f"Partial supplier name match: {', '.join(matched_words)}")
-    
-    # Check for invoice number in reference (20% weight)
-    if receipt.get('invoice_number'):
-        invoice_number = str(receipt['invoice_number']).lower()
-        if invoice_number in transaction_ref:
-            score += 0.2
-            reasons.append(f"Invoice number '{invoice_number}' found in transaction reference")
-    
-    return score, reasons
-
-def match_transactions(data_path: str) -> None:
+def _solve_component(pairs: List[Tuple[int, int]], scores: Dict[Tuple[int, int], Tuple[float, List[str]]]) -> List[Tuple[int, int]]:
+    """Maximum-confidence one-to-one assignment for one component.
+
+    Each receipt is assigned either a transaction (cost 1 - score) or its own
+    "unmatched" column (cost 1), so minimizing total cost maximizes total
+    confidence. Receipts are added one at a time, each with a Dijkstra search
+    for the cheapest augmenting path over the sparse edges (Hungarian method
+    with potentials), which only explores the part of the component that
+    actually competes for the same transactions.
+    """
+    receipt_ids = sorted({r for r, _ in pairs})
+    transaction_ids = sorted({t for _, t in pairs})
+    column_of = {t: i for i, t in enumerate(transaction_ids)}
+    row_of = {r: i for i, r in enumerate(receipt_ids)}
+    skip_column = len(transaction_ids)  # receipt i's unmatched column is skip_column + i
+    
+    edges: List[List[Tuple[int, float]]] = [[] for _ in receipt_ids]
+    for r, t in sorted(pairs):
+        edges[row_of[r]].append((column_of[t], max(0.0, 1.0 - scores[(r, t)][0])))
+    for row in range(len(receipt_ids)):
+        edges[row].append((skip_column + row, 1.0))
+    
+    row_potential = [0.0] * len(receipt_ids)
+    column_potential = [0.0] * (skip_column + len(receipt_ids))
+    row_match: List[Optional[int]] = [None] * len(receipt_ids)
+    column_match: List[Optional[int]] = [None] * (skip_column + len(receipt_ids))
+    
+    for start in range(len(receipt_ids)):
+        row_dist = {start: 0.0}
+        column_dist: Dict[int, float] = {}
+        column_parent: Dict[int, int] = {}
+        settled_rows: List[int] = []
+        settled_columns: List[int] = []
+        settled = set()
+        heap = [(0.0, 0, start)]  # (distance, 0 = row / 1 = column, node)
+        target = None
+        while heap:
+            d, kind, node = heapq.heappop(heap)
+            if (kind, node) in settled:
+                continue
+            settled.add((kind, node))
+            if kind == 0:
+                settled_rows.append(node)
+                for column, cost in edges[node]:
+                    # Settled columns are final; skipping them also guards
+                    # against float round-off re-parenting them.
+                    if (1, column) in settled:
+                        continue
+                    nd = d + cost + row_potential[node] - column_potential[column]
+                    if nd < column_dist.get(column, float('inf')):
+                        column_dist[column] = nd
+                        column_parent[column] = node
+                        heapq.heappush(heap, (nd, 1, column))
+            else:
+                settled_columns.append(node)
+                if column_match[node] is None:
+                    target = node
+                    break
+                # Matched edges are tight, so the owning row is reached at cost d
+                owner = column_match[node]
+                if (0, owner) not in settled and d < row_dist.get(owner, float('inf')):
+                    row_dist[owner] = d
+                    heapq.heappush(heap, (d, 0, owner))
+        
+        # Only nodes settled before the target move; everything else keeps its
+        # potential, which leaves all reduced costs non-negative.
+        total = column_dist[target]
+        for row in settled_rows:
+            row_potential[row] += row_dist[row] - total
+        for column in settled_columns:
+            column_potential[column] += column_dist[column] - total
+        
+        column = target
+        while column is not None:
+            row = column_parent[column]
+            previous = row_match[row]
+            row_match[row] = column
+            column_match[column] = row
+            column = previous if row != start else None
+    
+    return [
+        (receipt_ids[row], transaction_ids[column])
+        for row, column in enumerate(row_match)
+        if column is not None and column < skip_column
+    ]
+
+def assign_greedy(receipts: List[Dict[str, Any]], transactions: List[Dict[str, Any]],
+                  scores: Dict[Tuple[int, int], Tuple[float, List[str]]]) -> List[Dict[str, Any]]:
+    """find_greedy_matches over a built score matrix: each receipt, in input
+    order, takes its best still-unused transaction, the first on equal scores."""
+    by_receipt: Dict[int, List[int]] = {}
+    for r, t in sorted(scores):
+        by_receipt.setdefault(r, []).append(t)
+    matches = []
+    used_transactions = set()
+    for r in sorted(by_receipt):
+        best = None
+        best_score = 0
+        for t in by_receipt[r]:
+            if transactions[t]['id'] not in used_transactions and scores[(r, t)][0] > best_score:
+                best = t
+                best_score = scores[(r, t)][0]
+        if best is None:
+            continue
+        score, reasons = scores[(r, best)]
+        matches.append({
+            "receipt": receipts[r],
+            "transaction": transactions[best],
+            "confidence_score": score,
+            "reasons": reasons
+        })
+        used_transactions.add(transactions[best]['id'])
+    return matches
+
+def find_optimal_matches(receipts: List[Dict[str, Any]], scorer: MatchEngine) -> List[Dict[str, Any]]:
+    """Assign receipts to transactions maximizing total confidence."""
+    with timed('build_score_matrix', items=len(receipts)):
+        scores = build_score_matrix(receipts, scorer)
+    return assign_optimal(receipts, scorer.transactions, scores)
+
+def assign_optimal(receipts: List[Dict[str, Any]], transactions: List[Dict[str, Any]],
+                   scores: Dict[Tuple[int, int], Tuple[float, List[str]]]) -> List[Dict[str, Any]]:
+    """find_optimal_matches over a built score matrix."""
+    components = _connected_components(scores)
+    progress = current_reporter()
+    if progress:
+        progress.start('solve', len(components))
+        progress.progress("progress", f"Solving {len(components)} independent groups of candidate pairs",
+                          force=True)
+    
+    assignment = []
+    with timed('solve_components', items=len(components)):
+        for done, pairs in enumerate(components):
+            if progress:
+                progress.advance(done)
+                if progress.due():
+                    progress.progress("progress", f"Solving groups of candidate pairs ({done}/{len(components)})")
+            assignment.extend(_solve_component(pairs, scores))
+    
+    matches = []
+    for r, t in sorted(assignment):
+        score, reasons = scores[(r, t)]
+        matches.append({
+            "receipt": receipts[r],
+            "transaction": transactions[t],
+            "confidence_score": score,
+            "reasons": reasons
+        })
+    return matches
+
+def compare_matches(greedy: List[Dict[str, Any]], optimal: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Describe how an optimal assignment differs from the greedy one."""
+    greedy_pairs = {m['receipt']['id']: m['transaction']['id'] for m in greedy}
+    optimal_pairs = {m['receipt']['id']: m['transaction']['id'] for m in optimal}
+    changed = [
+        {
+            "receipt_id": receipt_id,
+            "greedy_transaction_id": greedy_pairs.get(receipt_id),
+            "optimal_transaction_id": optimal_pairs.get(receipt_id)
+        }
+        for receipt_id in sorted(set(greedy_pairs) | set(optimal_pairs), key=str)
+        if greedy_pairs.get(receipt_id) != optimal_pairs.get(receipt_id)
+    ]
+    return {
+        "greedy_matches": len(greedy),
+        "optimal_matches": len(optimal),
+        "greedy_total_confidence": sum(m['confidence_score'] for m in greedy),
+        "optimal_total_confidence": sum(m['confidence_score'] for m in optimal),
+        "changed": changed
+    }
+
+def check_openai_connection() -> None:
+    """Send a one-token request to verify the OpenAI API key."""
+    # Imported here: matching itself never calls the API
+    import openai
+    client = openai.OpenAI()
+    send_progress("init", 0, "Initializing OpenAI client...")
+    client.chat.completions.create(
+        model="gpt-3.5-turbo",
+        messages=[{"role": "system", "content": "Test connection"}],
+        max_tokens=1
+    )
+    send_progress("init", 10, "OpenAI client initialized successfully")
+
+def iter_statement_transactions(paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Transactions from bank exports, streamed, with only STATEMENT_COLUMNS."""
+    for transaction in iter_statements(paths):
+        yield {column: transaction[column] for column in STATEMENT_COLUMNS}
+
+def match_transactions(data_path: str, mode: str = "greedy", statements: Optional[List[str]] = None,
+                       state_path: Optional[str] = None, check_connection: bool = False) -> None:
     """Match receipts with transactions using AI and heuristics."""
     try:
-        # Initialize OpenAI client
-        client = openai.OpenAI()
-        send_progress("init", 0, "Initializing OpenAI client...")
-        
-        # Test the client with a small request
-        client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "system", "content": "Test connection"}],
-            max_tokens=1
-        )
-        send_progress("init", 10, "OpenAI client initialized successfully")
+        if check_connection:
+            check_openai_connection()
         
         # Load the data
         with open(data_path, 'r') as f:
             data = json.load(f)
         
         receipts = data["receipts"]
-        transactions = data["transactions"]
-        
-        send_progress("progress", 20, f"Processing {len(receipts)} receipts and {len(transactions)} transactions")
-        
-        # Track matches and used items
-        matches = []
-        used_receipts = set()
-        used_transactions = set()
-        total_items = len(receipts) * len(transactions)
-        processed = 0
-        
-        # Find matches
-        for receipt in receipts:
-            best_match = None
-            best_score = 0
-            best_reasons = []
-            
-            for transaction in transactions:
-                if transaction['id'] in used_transactions:
-                    continue
-                
-                processed += 1
-                progress = (processed / total_items) * 100
-                
-                if processed % 10 == 0:  # Update progress every 10 items
-                    send_progress(
-                        "progress",
-                        progress,
-                        f"Analyzing matches... ({len(matches)} found)"
-                    )
-                
-                score, reasons = calculate_match_score(receipt, transaction)
-                
-                if score > best_score:
-                    best_score = score
-                    best_match = transaction
-                    best_reasons = reasons
-            
-            # If we found a good match (confidence > 50%)
-            if best_match and best_score >= 0.5:
-                match_data = {
-                    "receipt": receipt,
-                    "transaction": best_match,
-                    "confidence_score": best_score,
-                    "reasons": best_reasons
-                }
-                matches.append(match_data)
-                used_receipts.add(receipt['id'])
-                used_transactions.add(best_match['id'])
-                
-                send_progress("match", progress, "Found match", match_data)
-        
-        # Prepare summary
-        total_matches = len(matches)
-        average_confidence = sum(m['confidence_score'] for m in matches) / total_matches if matches else 0
-        
-        summary = {
-            "total_matches": total_matches,
-            "unmatched_receipts": len(receipts) - total_matches,
-            "unmatched_transactions": len(transactions) - total_matches,
-            "average_confidence": average_confidence
-        }
-        
-        send_progress("summary", 100, "Matching complete", summary)
-        
-        # Send unmatched items
-        unmatched = {
-            "receipts": [r for r in receipts if r['id'] not in used_receipts],
-            "transactions": [t for t in transactions if t['id'] not in used_transactions]
-        }
-        
-        send_progress("unmatched", 100, "Unmatched items identified", unmatched)
+        if statements:
+            # Bank exports are streamed straight into the matcher's index
+            transactions = iter_statement_transactions(statements)
+        else:
+            transactions = data["transactions"]
         
+        reconcile(receipts, transactions, mode, state_path, data.get("confirmed_matches"))
         send_progress("complete", 100, "Processing complete")
         
     except Exception as e:
         send_progress("error", 0, f"Error: {str(e)}")
         sys.exit(1)
 
+def reconcile(receipts: List[Dict[str, Any]], transactions: Iterable[Dict[str, Any]], mode: str = "greedy",
+              state_path: Optional[str] = None,
+              confirmed: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Match loaded receipts and transactions, streaming match events; returns the summary.
+
+    transactions is read once and may be a stream. confirmed lists the {"receipt_id", "transaction_id"} pairs the user has
+    accepted; they are kept as matches and teach the supplier alias index.
+    """
+    if mode == "optimal":
+        phases = [('prepare', 20), ('score', 60), ('solve', 20)]
+    else:
+        phases = [('prepare', 20), ('score', 80)]
+    start = time.perf_counter()
+    store = ReconciliationStore(state_path, receipt_features, transaction_features) if state_path else None
+    # The store is closed however the run ends; the daemon outlives it
+    with store or nullcontext(), ProgressReporter(phases) as progress, collecting() as timings:
+        summary = _reconcile(receipts, transactions, mode, store, confirmed or [], progress)
+        send_progress("timings", 100, "Stage timings", run_summary(timings, time.perf_counter() - start))
+    return summary
+
+def confirmed_pairs(receipts: List[Dict[str, Any]], transactions: List[Dict[str, Any]],
+                    confirmed: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """(receipt, transaction) of each confirmed pair whose records are both in the input.
+
+    A record confirmed twice keeps its first pair.
+    """
+    receipts_by_id = {str(r['id']): r for r in receipts}
+    transactions_by_id = {str(t['id']): t for t in transactions}
+    pairs = []
+    taken: Set[int] = set()
+    for entry in confirmed:
+        receipt = receipts_by_id.get(str(entry['receipt_id']))
+        transaction = transactions_by_id.get(str(entry['transaction_id']))
+        if receipt is None or transaction is None or id(receipt) in taken or id(transaction) in taken:
+            continue
+        taken.update((id(receipt), id(transaction)))
+        pairs.append((receipt, transaction))
+    return pairs
+
+def _reconcile_incremental(receipts: List[Dict[str, Any]], transactions: List[Dict[str, Any]], mode: str,
+                           store: ReconciliationStore, aliases: SupplierAliasIndex, scorer: MatchEngine,
+                           progress: ProgressReporter) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """(matches, greedy matches) from the stored scores plus those of new or changed records.
+
+    Only pairs with a new or changed record are scored. The assignment is
+    then solved again over every pair, as a full run does, so a new record
+    can take over a pair matched before.
+    """
+    with timed('store_plan', items=len(receipts) + len(transactions)):
+        plan = store.plan(receipts, transactions, aliases.digest())
+    progress.progress(
+        "progress",
+        f"Reusing {len(plan.known_scores)} stored scores; scoring "
+        f"{len(receipts) - len(plan.clean_receipts)} new or changed receipts and "
+        f"{len(transactions) - len(plan.clean_transactions)} new or changed transactions",
+        force=True
+    )
+    with timed('build_score_matrix', items=len(receipts)):
+        scores = build_score_matrix(receipts, scorer, plan.clean_receipts, plan.clean_transactions)
+    receipt_position = {str(r['id']): i for i, r in enumerate(receipts)}
+    transaction_position = {str(t['id']): i for i, t in enumerate(transactions)}
+    for (receipt_id, transaction_id), known in plan.known_scores.items():
+        scores[(receipt_position[receipt_id], transaction_position[transaction_id])] = known
+    
+    with timed('find_greedy_matches', items=len(receipts)):
+        greedy_matches = assign_greedy(receipts, transactions, scores)
+    if mode == "optimal":
+        with timed('find_optimal_matches', items=len(receipts)):
+            matches = assign_optimal(receipts, transactions, scores)
+    else:
+        matches = greedy_matches
+    for match_data in matches:
+        progress.match(match_data)
+    
+    with timed('store_save', items=len(receipts) + len(transactions)):
+        store.save(receipts, transactions,
+                   {(str(receipts[r]['id']), str(transactions[t]['id'])): score for (r, t), score in scores.items()},
+                   matches, aliases.digest(), aliases.pairs())
+    return matches, greedy_matches
+
+def _reconcile(receipts: List[Dict[str, Any]], transactions: Iterable[Dict[str, Any]], mode: str,
+               store: Optional[ReconciliationStore], confirmed: List[Dict[str, Any]],
+               progress: ProgressReporter) -> Dict[str, Any]:
+    progress.start('prepare', 1)
+    # The matcher's index reads the transactions once; they are only read
+    # up front when confirmed pairs have to be looked up among them
+    if confirmed:
+        transactions = list(transactions)
+    
+    # Aliases only come from matches the user confirmed, this run or before,
+    # never from automatic ones: a rerun on the same input scores the same.
+    pairs = confirmed_pairs(receipts, transactions, confirmed) if confirmed else []
+    aliases = SupplierAliasIndex.from_pairs(store.alias_pairs()) if store else SupplierAliasIndex()
+    aliases.learn({"receipt": receipt, "transaction": transaction} for receipt, transaction in pairs)
+    confirmed_matches = []
+    for receipt, transaction in pairs:
+        score, reasons = calculate_match_score(receipt, transaction, aliases)
+        match_data = {
+            "receipt": receipt,
+            "transaction": transaction,
+            "confidence_score": score,
+            "reasons": ["Confirmed by user"] + reasons,
+            "confirmed": True
+        }
+        confirmed_matches.append(match_data)
+        progress.match(match_data)
+    # Confirmed records are settled; only the rest is matched
+    settled = {id(record) for pair in pairs for record in pair}
+    open_receipts = [r for r in receipts if id(r) not in settled]
+    
+    with timed('match_index') as index_timer:
+        scorer = MatchEngine((t for t in transactions if id(t) not in settled), WEIGHTED_RULES, aliases)
+        open_transactions = scorer.transactions
+        index_timer.items = len(open_transactions)
+    if not confirmed:
+        transactions = open_transactions
+    progress.progress("progress", f"Processing {len(receipts)} receipts and {len(transactions)} transactions",
+                      force=True)
+    
+    if store:
+        new_matches, greedy_matches = _reconcile_incremental(open_receipts, open_transactions, mode, store,
+                                                             aliases, scorer, progress)
+    elif mode == "optimal":
+        with timed('find_optimal_matches', items=len(open_receipts)):
+            new_matches = find_optimal_matches(open_receipts, scorer)
+        for match_data in new_matches:
+            progress.match(match_data)
+        with timed('find_greedy_matches', items=len(open_receipts)):
+            greedy_matches = find_greedy_matches(open_receipts, scorer, False)
+    else:
+        with timed('find_greedy_matches', items=len(open_receipts)):
+            new_matches = find_greedy_matches(open_receipts, scorer, True)
+    if mode == "optimal":
+        comparison = compare_matches(confirmed_matches + greedy_matches, confirmed_matches + new_matches)
+    # Keep receipt input order so the output matches a full run's layout
+    receipt_order = {id(r): i for i, r in enumerate(receipts)}
+    matches = sorted(confirmed_matches + new_matches, key=lambda m: receipt_order[id(m['receipt'])])
+    
+    used_receipts = {m['receipt']['id'] for m in matches}
+    used_transactions = {m['transaction']['id'] for m in matches}
+    
+    # Prepare summary
+    total_matches = len(matches)
+    average_confidence = sum(m['confidence_score'] for m in matches) / total_matches if matches else 0
+    
+    summary = {
+        "total_matches": total_matches,
+        "unmatched_receipts": len(receipts) - total_matches,
+        "unmatched_transactions": len(transactions) - total_matches,
+        "average_confidence": average_confidence
+    }
+    
+    send_progress("summary", 100, "Matching complete", summary)
+    
+    if mode == "optimal":
+        send_progress(
+            "comparison",
+            100,
+            f"Optimal assignment changed {len(comparison['changed'])} receipts compared to greedy",
+            comparison
+        )
+    
+    # Send unmatched items
+    unmatched = {
+        "receipts": [r for r in receipts if r['id'] not in used_receipts],
+        "transactions": [t for t in transactions if t['id'] not in used_transactions]
+    }
+    
+    send_progress("unmatched", 100, "Unmatched items identified", unmatched)
+    
+    return summary
+
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python match_transactions.py <data_path>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description='Match receipts with bank transactions')
+    parser.add_argument('data_path', help='JSON file with "receipts" and "transactions", and optionally '
+                                          '"confirmed_matches": [{"receipt_id", "transaction_id"}, ...]')
+    parser.add_argument('--statements', nargs='+', metavar='CSV',
+                        help='Read transactions from Svea/Revolut exports instead of data_path')
+    parser.add_argument('--mode', choices=['greedy', 'optimal'], default='greedy',
+                        help='greedy: first-come best match per receipt; optimal: maximize total confidence')
+    parser.add_argument('--state', metavar='SQLITE',
+                        help='Reconciliation store; keeps the scores of matching pairs and only scores new or changed records')
+    parser.add_argument('--check-connection', action='store_true',
+                        help='Send a one-token test request to OpenAI before matching')
+    parser.add_argument('--progress-interval', type=float,
+                        help='Seconds between progress events (default: $RECEIPT_PROGRESS_INTERVAL or 0.2)')
+    parser.add_argument('--no-progress', action='store_true',
+                        help='Only write matches and results, no progress events')
+    args = parser.parse_args()
+    if args.progress_interval is not None:
+        os.environ['RECEIPT_PROGRESS_INTERVAL'] = str(args.progress_interval)
+    if args.no_progress:
+        os.environ['RECEIPT_PROGRESS'] = '0'
     
-    match_transactions(sys.argv[1]) 
\ No newline at end of file
+    match_transactions(args.data_path, args.mode, args.statements, args.state, args.check_connection) 
\ No newline at end of file
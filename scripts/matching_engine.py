@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+
+import heapq
+import re
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from supplier_aliases import SupplierAliasIndex, supplier_key
+
+def normalize_amount(amount: str | float | int) -> float:
+    """Normalize amount string to float, handling various formats."""
+    if isinstance(amount, (float, int)):
+        return float(amount)
+
+    # Remove spaces and currency symbols
+    amount = str(amount).strip().replace(' ', '')
+    amount = re.sub(r'[£$€]', '', amount)
+
+    # Convert comma to decimal point if needed
+    if ',' in amount and '.' not in amount:
+        amount = amount.replace(',', '.')
+    elif ',' in amount and '.' in amount:
+        amount = amount.replace(',', '')
+
+    # Handle negative amounts
+    is_negative = amount.startswith('-')
+    amount = amount.replace('-', '')
+
+    try:
+        value = float(amount)
+        return -value if is_negative else value
+    except ValueError:
+        return 0.0
+
+def parse_day(date: str) -> int:
+    """Day number of a YYYY-MM-DD date."""
+    return datetime.strptime(date, '%Y-%m-%d').toordinal()
+
+@dataclass(frozen=True)
+class Tier:
+    """Points for a difference up to `limit`.
+
+    reason is formatted with receipt, transaction (amounts) and days.
+    """
+    limit: float
+    points: float
+    reason: str
+
+@dataclass(frozen=True)
+class MatchRules:
+    """Declarative scoring rules for receipt/transaction pairs.
+
+    A pair earns the points of the first amount tier and the first date tier
+    its differences fall in, plus the supplier name and invoice number
+    checks against the transaction reference. Transaction amounts are
+    compared by absolute value, so bank exports with negative spending
+    match receipt totals.
+    """
+    amount_tiers: Tuple[Tier, ...]
+    date_tiers: Tuple[Tier, ...]
+    # Amount tier limits in percent of the larger amount, or in currency units
+    relative_amounts: bool = True
+    # Amount differences must be below the limit rather than at most the limit
+    strict_amounts: bool = False
+    supplier_points: float = 0.0
+    # Cap for a supplier name that only partly appears in the reference
+    partial_supplier_points: float = 0.0
+    invoice_points: float = 0.0
+    threshold: float = 0.5
+
+    @property
+    def date_window(self) -> int:
+        return int(max(tier.limit for tier in self.date_tiers))
+
+    @property
+    def uses_reference(self) -> bool:
+        return bool(self.supplier_points or self.invoice_points)
+
+    def text_ceiling(self, receipt: Dict[str, Any]) -> float:
+        """Most points the reference checks can add for this receipt."""
+        return self.supplier_points + (self.invoice_points if receipt.get('invoice_number') else 0.0)
+
+    def amount_band(self, receipt_amount: float) -> Optional[Tuple[float, float]]:
+        """Transaction amounts the widest amount tier accepts, widened slightly
+        so float rounding never drops a pair; scoring decides."""
+        widest = max(tier.limit for tier in self.amount_tiers)
+        if self.relative_amounts:
+            if receipt_amount < 0:
+                return None
+            # |r - a| <= p% of max(r, a)  <=>  (1 - p%) r <= a <= r / (1 - p%)
+            share = widest / 100
+            return receipt_amount * (1 - share) * (1 - 1e-9), receipt_amount / (1 - share) * (1 + 1e-9)
+        margin = widest * (1 + 1e-9) + 1e-9
+        return receipt_amount - margin, receipt_amount + margin
+
+    def amount_unit(self, receipt_amount: float, transaction_amount: float) -> float:
+        return max(receipt_amount, transaction_amount) * 0.01 if self.relative_amounts else 1.0
+
+# match_transactions.py: amount 30%, date 25%, supplier 25%, invoice number 20%.
+# A pair needs either the amount band or the date window to reach the
+# threshold: supplier (0.25) + invoice (0.2) alone tops out at 0.45.
+WEIGHTED_RULES = MatchRules(
+    amount_tiers=(
+        Tier(1, 0.3, "Amount matches exactly: {receipt:.2f} = {transaction:.2f}"),
+        Tier(3, 0.2, "Amount matches within tolerance: {receipt:.2f} ≈ {transaction:.2f}")
+    ),
+    date_tiers=(
+        Tier(0, 0.25, "Dates match exactly"),
+        Tier(3, 0.15, "Dates are close: {days} days apart"),
+        Tier(7, 0.1, "Dates are within a week: {days} days apart")
+    ),
+    supplier_points=0.25,
+    partial_supplier_points=0.15,
+    invoice_points=0.2,
+    threshold=0.5
+)
+
+# parse_receipt.py --match: date and amount 50% each with absolute amount
+# tolerances; every pair with any points is a candidate (the smallest tier
+# is 0.1).
+AMOUNT_DATE_RULES = MatchRules(
+    amount_tiers=(
+        Tier(0.01, 0.5, "Amount matches exactly: {receipt:.2f} = {transaction:.2f}"),
+        Tier(1.0, 0.3, "Amount within 1.00: {receipt:.2f} ≈ {transaction:.2f}"),
+        Tier(5.0, 0.1, "Amount within 5.00: {receipt:.2f} ≈ {transaction:.2f}")
+    ),
+    date_tiers=(
+        Tier(0, 0.5, "Dates match exactly"),
+        Tier(2, 0.3, "Dates are close: {days} days apart"),
+        Tier(5, 0.1, "Dates are within 5 days: {days} days apart")
+    ),
+    relative_amounts=False,
+    strict_amounts=True,
+    threshold=0.1
+)
+
+def _amount_tier(rules: MatchRules, receipt_amount: float, transaction_amount: float) -> Optional[Tier]:
+    amount_diff = abs(receipt_amount - transaction_amount)
+    unit = rules.amount_unit(receipt_amount, transaction_amount)
+    for tier in rules.amount_tiers:
+        limit = unit * tier.limit
+        if amount_diff < limit if rules.strict_amounts else amount_diff <= limit:
+            return tier
+    return None
+
+def _date_tier(rules: MatchRules, date_diff: int) -> Optional[Tier]:
+    for tier in rules.date_tiers:
+        if date_diff <= tier.limit:
+            return tier
+    return None
+
+def _add_reference_points(rules: MatchRules, score: float, reasons: List[str], receipt: Dict[str, Any],
+                          transaction_ref: str, alias: Optional[Tuple[str, str, float]] = None) -> float:
+    """Add the supplier and invoice number components to score.
+
+    alias is the SupplierAliasIndex lookup of the transaction reference, if any.
+    """
+    supplier_name = receipt['supplier_name'].lower()
+
+    if supplier_name in transaction_ref:
+        score += rules.supplier_points
+        reasons.append(f"Supplier name '{supplier_name}' found in transaction reference")
+    elif alias is not None and alias[0] == supplier_key(supplier_name):
+        score += rules.supplier_points
+        reasons.append(f"Supplier name '{supplier_name}' matches known reference alias '{alias[1]}'")
+    else:
+        # Check for partial matches
+        words = supplier_name.split()
+        matched_words = [word for word in words if word in transaction_ref]
+        if matched_words:
+            partial_score = min(len(matched_words) / len(words) * rules.supplier_points,
+                                rules.partial_supplier_points)
+            score += partial_score
+            reasons.append(f"Partial supplier name match: {', '.join(matched_words)}")
+
+    # Check for invoice number in reference
+    if rules.invoice_points and receipt.get('invoice_number'):
+        invoice_number = str(receipt['invoice_number']).lower()
+        if invoice_number in transaction_ref:
+            score += rules.invoice_points
+            reasons.append(f"Invoice number '{invoice_number}' found in transaction reference")
+
+    return score
+
+def score_pair(receipt: Dict[str, Any], transaction: Dict[str, Any], rules: MatchRules = WEIGHTED_RULES,
+               aliases: Optional[SupplierAliasIndex] = None) -> Tuple[float, List[str]]:
+    """Score one receipt/transaction pair with detailed reasons."""
+    score = 0.0
+    reasons = []
+
+    receipt_amount = normalize_amount(receipt['total_amount'])
+    transaction_amount = abs(normalize_amount(transaction['amount']))
+    tier = _amount_tier(rules, receipt_amount, transaction_amount)
+    if tier:
+        score += tier.points
+        reasons.append(tier.reason.format(receipt=receipt_amount, transaction=transaction_amount))
+
+    date_diff = abs(parse_day(receipt['date']) - parse_day(transaction['date']))
+    tier = _date_tier(rules, date_diff)
+    if tier:
+        score += tier.points
+        reasons.append(tier.reason.format(days=date_diff))
+
+    if rules.uses_reference:
+        alias = aliases.lookup(transaction['reference']) if aliases else None
+        score = _add_reference_points(rules, score, reasons, receipt, transaction['reference'].lower(), alias)
+
+    return score, reasons
+
+class CandidateIndex:
+    """Index of normalized transactions by absolute amount and by date.
+
+    Only transactions inside the widest amount tier or the widest date tier
+    of a receipt can reach the threshold, so everything else is skipped.
+    When the reference checks alone can reach it, every transaction is a
+    candidate. Candidates are returned in input order to keep tie-breaking
+    identical to a full scan.
+    """
+
+    def __init__(self, amounts: List[float], days: List[int], rules: MatchRules):
+        self.rules = rules
+        self.size = len(amounts)
+        self.exhaustive = rules.supplier_points + rules.invoice_points >= rules.threshold
+        order = sorted(range(len(amounts)), key=amounts.__getitem__)
+        self._amount_keys = [amounts[i] for i in order]
+        self._amount_positions = order
+        self._by_day: Dict[int, List[int]] = {}
+        for i, day in enumerate(days):
+            self._by_day.setdefault(day, []).append(i)
+
+    def _amount_candidates(self, receipt_amount: float) -> List[int]:
+        band = self.rules.amount_band(receipt_amount)
+        if band is None:
+            return []
+        start = bisect_left(self._amount_keys, band[0])
+        end = bisect_right(self._amount_keys, band[1])
+        return self._amount_positions[start:end]
+
+    def _date_candidates(self, receipt_day: int) -> List[int]:
+        window = self.rules.date_window
+        found = []
+        for day in range(receipt_day - window, receipt_day + window + 1):
+            found.extend(self._by_day.get(day, ()))
+        return found
+
+    def candidate_positions(self, receipt: Dict[str, Any]) -> List[int]:
+        """Return input positions of the transactions that can plausibly match a receipt."""
+        if self.exhaustive:
+            return list(range(self.size))
+        positions = set(self._amount_candidates(normalize_amount(receipt['total_amount'])))
+        positions.update(self._date_candidates(parse_day(receipt['date'])))
+        return sorted(positions)
+
+class MatchEngine:
+    """Vectorized score_pair for one receipt against many transactions.
+
+    Transaction amounts, dates and lowercased references are normalized once
+    and shared with the candidate index. The amount and date components are
+    computed as array operations over a block of transactions, and the
+    supplier/invoice text checks only run for the pairs whose numeric part
+    can still reach the threshold. Scores and reasons are identical to
+    score_pair for every returned pair. Supplier aliases, when given, are
+    resolved once per transaction.
+    """
+
+    def __init__(self, transactions: Iterable[Dict[str, Any]], rules: MatchRules = WEIGHTED_RULES,
+                 aliases: Optional[SupplierAliasIndex] = None, keep_transactions: bool = True):
+        """transactions is read once, so it may be a stream. With
+        keep_transactions=False only the normalized columns are kept
+        (self.transactions is None) and callers refer to pairs by position."""
+        self.rules = rules
+        kept: List[Dict[str, Any]] = []
+        amounts: List[float] = []
+        days: List[int] = []
+        references: List[str] = []
+        resolved: List[Optional[Tuple[str, str, float]]] = []
+        for t in transactions:
+            amounts.append(abs(normalize_amount(t['amount'])))
+            days.append(parse_day(t['date']))
+            if rules.uses_reference:
+                references.append(t['reference'].lower())
+                if aliases:
+                    resolved.append(aliases.lookup(t['reference']))
+            if keep_transactions:
+                kept.append(t)
+        self.transactions = kept if keep_transactions else None
+        self.index = CandidateIndex(amounts, days, rules)
+        self.amounts = np.array(amounts, dtype=np.float64)
+        self.days = np.array(days, dtype=np.int64)
+        # Points per tier index; index -1 (no tier) picks the trailing 0
+        self._amount_points = np.array([tier.points for tier in rules.amount_tiers] + [0.0])
+        self._date_points = np.array([tier.points for tier in rules.date_tiers] + [0.0])
+        self.references = references if rules.uses_reference else None
+        self.aliases = resolved if aliases and rules.uses_reference else None
+
+    def _tier_index(self, diff: np.ndarray, tiers: Tuple[Tier, ...], unit, strict: bool) -> np.ndarray:
+        # First matching tier wins, as in score_pair; -1 for none
+        conditions = [diff < unit * tier.limit if strict else diff <= unit * tier.limit for tier in tiers]
+        return np.select(conditions, list(range(len(tiers))), -1)
+
+    def score(self, receipt: Dict[str, Any], positions: Optional[List[int]] = None) -> List[Tuple[int, float, List[str]]]:
+        """Return (position, score, reasons) for pairs that can reach the threshold.
+
+        positions restricts the block to those transactions (the receipt's
+        index candidates by default); results are in input order.
+        """
+        rules = self.rules
+        if positions is None:
+            positions = self.index.candidate_positions(receipt)
+        positions = np.asarray(positions, dtype=np.int64)
+        receipt_amount = normalize_amount(receipt['total_amount'])
+        receipt_day = parse_day(receipt['date'])
+
+        amounts = self.amounts[positions]
+        amount_diff = np.abs(receipt_amount - amounts)
+        unit = np.maximum(receipt_amount, amounts) * 0.01 if rules.relative_amounts else 1.0
+        amount_tier = self._tier_index(amount_diff, rules.amount_tiers, unit, rules.strict_amounts)
+        amount_points = self._amount_points[amount_tier]
+
+        date_diff = np.abs(receipt_day - self.days[positions])
+        date_tier = self._tier_index(date_diff, rules.date_tiers, 1, False)
+        date_points = self._date_points[date_tier]
+
+        # Best case for the text checks: full supplier match plus invoice number
+        text_ceiling = rules.text_ceiling(receipt)
+        survivors = np.flatnonzero(amount_points + date_points + text_ceiling >= rules.threshold - 1e-9)
+
+        results = []
+        for i, amount, amount_t, diff, date_t in zip(
+            survivors.tolist(),
+            amounts[survivors].tolist(),
+            amount_tier[survivors].tolist(),
+            date_diff[survivors].tolist(),
+            date_tier[survivors].tolist()
+        ):
+            position = int(positions[i])
+            score = 0.0
+            reasons = []
+            if amount_t >= 0:
+                tier = rules.amount_tiers[amount_t]
+                score += tier.points
+                reasons.append(tier.reason.format(receipt=receipt_amount, transaction=amount))
+            if date_t >= 0:
+                tier = rules.date_tiers[date_t]
+                score += tier.points
+                reasons.append(tier.reason.format(days=diff))
+            if rules.uses_reference:
+                alias = self.aliases[position] if self.aliases else None
+                score = _add_reference_points(rules, score, reasons, receipt, self.references[position], alias)
+            results.append((position, score, reasons))
+        return results
+
+    def top_k(self, receipt: Dict[str, Any], k: Optional[int] = None,
+              positions: Optional[List[int]] = None) -> List[Tuple[int, float, List[str]]]:
+        """The k best pairs at or above the threshold, best first (all of them
+        when k is None); equal scores keep input order.
+
+        Only k pairs are held at a time: a min-heap whose root is the worst
+        kept pair, replaced whenever a better one comes along.
+        """
+        threshold = self.rules.threshold
+        # Rounded so sums of the same points in another order tie
+        if k is None:
+            scored = [s for s in self.score(receipt, positions) if s[1] >= threshold]
+            return sorted(scored, key=lambda s: (-round(s[1], 9), s[0]))
+        if k <= 0:
+            return []
+        heap: List[Tuple[float, int, Tuple[int, float, List[str]]]] = []
+        for scored in self.score(receipt, positions):
+            if scored[1] < threshold:
+                continue
+            # Lower position ranks higher on equal scores
+            entry = (round(scored[1], 9), -scored[0], scored)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+        return [entry[2] for entry in sorted(heap, key=lambda e: e[:2], reverse=True)]
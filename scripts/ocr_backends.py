@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import importlib.util
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 'auto' uses tesserocr when it is installed and pytesseract otherwise
+OCR_BACKENDS = ('auto', 'tesserocr', 'pytesseract')
+# Both backends read pages with Tesseract's defaults for this language
+OCR_LANGUAGE = 'eng'
+
+def ocr_backend_setting() -> str:
+    """Requested OCR backend, from --ocr-backend / RECEIPT_OCR_BACKEND."""
+    name = os.getenv('RECEIPT_OCR_BACKEND') or 'auto'
+    return name if name in OCR_BACKENDS else 'auto'
+
+def resolve_backend(name: Optional[str] = None) -> str:
+    """The backend a request for `name` runs on, without loading it."""
+    name = name or ocr_backend_setting()
+    if name == 'auto':
+        return 'tesserocr' if importlib.util.find_spec('tesserocr') else 'pytesseract'
+    return name
+
+class PytesseractBackend:
+    """Runs the tesseract command once per image, through temporary files."""
+
+    name = 'pytesseract'
+
+    def image_to_string(self, image) -> str:
+        import pytesseract
+        return pytesseract.image_to_string(image, lang=OCR_LANGUAGE)
+
+class TesserocrBackend:
+    """Keeps Tesseract loaded in this process and hands it images in memory.
+
+    An engine serves one thread at a time, so each thread gets its own and
+    loads the language data once, instead of once per image.
+    """
+
+    name = 'tesserocr'
+
+    def __init__(self):
+        import tesserocr
+        self._tesserocr = tesserocr
+        self._local = threading.local()
+        # Fail here, where the caller can still fall back, if Tesseract
+        # cannot load its language data
+        self._engine()
+
+    def _engine(self):
+        engine = getattr(self._local, 'engine', None)
+        if engine is None:
+            engine = self._tesserocr.PyTessBaseAPI(lang=OCR_LANGUAGE)
+            self._local.engine = engine
+        return engine
+
+    def image_to_string(self, image) -> str:
+        # Raw pixels rather than SetImage(), which goes through a BMP that
+        # claims 96 dpi; without a resolution Tesseract estimates one from
+        # the text, as it does for the PNG pytesseract writes
+        if image.mode not in ('L', 'RGB'):
+            image = image.convert('RGB')
+        bands = len(image.getbands())
+        engine = self._engine()
+        engine.SetImageBytes(image.tobytes(), image.width, image.height, bands, image.width * bands)
+        return engine.GetUTF8Text()
+
+_backends: Dict[str, object] = {}
+_backends_lock = threading.Lock()
+
+def get_backend(name: Optional[str] = None):
+    """This process's OCR backend for `name`, created on first use.
+
+    Falls back to pytesseract when tesserocr is missing or cannot start;
+    its first import installs signal handlers, so it has to happen on the
+    main thread (ValueError elsewhere).
+    """
+    resolved = resolve_backend(name)
+    with _backends_lock:
+        backend = _backends.get(resolved)
+        if backend is None:
+            if resolved == 'tesserocr':
+                try:
+                    backend = TesserocrBackend()
+                    logger.info("Using the in-process tesserocr OCR engine")
+                except (ImportError, RuntimeError, ValueError) as e:
+                    logger.warning(f"tesserocr unavailable, falling back to pytesseract: {str(e)}")
+                    backend = _backends.setdefault('pytesseract', PytesseractBackend())
+            else:
+                backend = PytesseractBackend()
+            _backends[resolved] = backend
+    return backend
@@ -8,8 +8,19 @@ from datetime import datetime
 from pathlib import Path
 import logging
 import traceback
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass, asdict
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
+from dataclasses import dataclass, asdict, field
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+import contextvars
+import functools
+import random
+import time
+from concurrent.futures.process import BrokenProcessPool
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
 # Configure logging first, before any other imports
 logging.basicConfig(
@@ -38,77 +49,46 @@ except Exception as e:
     }), flush=True)
     sys.exit(1)
 
-try:
-    import pytesseract
-    from pdf2image import convert_from_path
-    import openai
-    from openai import OpenAI
-    import PyPDF2
-    import cv2
-    import numpy as np
-    from PIL import Image
-    
-    # Add import for HEIC support
-    try:
-        from pillow_heif import register_heif_opener
-        register_heif_opener()
-        logger.info("Successfully registered HEIF/HEIC opener")
-    except ImportError:
-        logger.warning("pillow_heif not available, HEIC files will not be supported")
-    
-    logger.info("Successfully imported all required packages")
-except Exception as e:
-    error_msg = f"Failed to import required packages: {str(e)}\n{traceback.format_exc()}"
-    logger.error(error_msg)
-    print(json.dumps({
-        "stage": "initialization",
-        "progress": 0,
-        "message": f"Import error: {str(e)}"
-    }), flush=True)
-    sys.exit(1)
+from receipt_cache import ReceiptCache, file_digest, text_digest
+from bank_statements import iter_transaction_source
+from progress_events import ProgressReporter, emit_event, reporting
+from ocr_backends import OCR_BACKENDS, get_backend
+from receipt_dedup import COMPARE_WIDTH, ReceiptDeduplicator, comparable, dedup_enabled, image_hash, same_picture
+from stage_timings import PROFILERS, StageTimings, collecting, profiled, record, record_file, run_summary, timed
+from receipt_fields import DEFAULT_MIN_CONFIDENCE, REQUIRED_FIELDS, parse_locally
+from gpt_batches import Batch, BatchPacker, batch_receipts_text, batch_token_budget, estimate_tokens, parse_batch_response
+from text_compaction import DEFAULT_MAX_TEXT_TOKENS, compact_text, compaction_settings
+from gpt_followup import DEFAULT_REASKS, invalid_fields, merge_answer, reask_budget, reask_prompt
 
-# Initialize OpenAI client
-try:
-    logger.info("Initializing OpenAI client...")
-    # Read API key directly from .env file
-    env_path = Path(__file__).parent.parent / '.env'
-    logger.info(f"Looking for .env file at: {env_path}")
-    
-    if not env_path.exists():
-        logger.error(f".env file not found at {env_path}")
-        raise FileNotFoundError(f".env file not found at {env_path}")
-        
-    with open(env_path, 'r') as f:
-        for line in f:
-            if line.startswith('OPENAI_API_KEY='):
-                api_key = line.strip().split('=', 1)[1].strip()  # Make sure to strip any whitespace
-                # Log key details without exposing the full key
-                logger.info(f"API key found in .env file:")
-                logger.info(f"- Length: {len(api_key)}")
-                logger.info(f"- Prefix: {api_key[:15]}...")  # Show more of prefix to verify format
-                logger.info(f"- Contains whitespace: {' ' in api_key}")
-                logger.info(f"- Contains newlines: {chr(10) in api_key or chr(13) in api_key}")
-                logger.info(f"- Is project key: {api_key.startswith('sk-proj-')}")
-                break
-    
-    if not api_key:
-        raise ValueError("OpenAI API key not found in .env file")
-    
-    # Initialize client with detailed logging
-    logger.info("Configuring OpenAI client...")
-    client_config = {
+# The OCR stack (pytesseract, pdf2image, PyPDF2, cv2, numpy, PIL) and the
+# OpenAI SDK are imported by the code paths that use them, so a process that
+# only matches, hits the cache or fails early does not pay for them.
+def client_config() -> Dict[str, Any]:
+    """OpenAI client settings. OPENAI_BASE_URL, read whenever a client is
+    made, points the scripts at a local OpenAI-compatible server."""
+    return {
         "api_key": api_key,
-        "base_url": "https://api.openai.com/v1"
+        "base_url": os.getenv('OPENAI_BASE_URL', "https://api.openai.com/v1")
     }
-    logger.info(f"Client configuration:")
-    logger.info(f"- Base URL: {client_config['base_url']}")
-    logger.info(f"- API Key prefix: {client_config['api_key'][:15]}...")
-    
-    client = OpenAI(**client_config)
-    
+
+_client = None
+_heif_registered = False
+
+def get_client():
+    """Return the shared OpenAI client, creating it on first use."""
+    global _client
+    if _client is None:
+        from openai import OpenAI
+        config = client_config()
+        logger.info(f"Initializing OpenAI client (base URL: {config['base_url']})")
+        _client = OpenAI(**config)
+    return _client
+
+def check_openai_connection() -> None:
+    """Send a one-token request to verify the API key and endpoint."""
     logger.info("Testing OpenAI client connection...")
     try:
-        response = client.chat.completions.create(
+        response = get_client().chat.completions.create(
             model="gpt-3.5-turbo",
             messages=[{"role": "system", "content": "Test connection"}],
             max_tokens=1
@@ -120,31 +100,38 @@ try:
         logger.error(f"Error type: {type(e).__name__}")
         logger.error(f"Full error details: {traceback.format_exc()}")
         raise
-    
-    print(json.dumps({
-        "stage": "initialization",
-        "progress": 10,
-        "message": "Successfully initialized OpenAI client"
-    }), flush=True)
-except Exception as e:
-    error_msg = f"Failed to initialize OpenAI client: {str(e)}\nTraceback: {traceback.format_exc()}"
-    logger.error(error_msg)
-    print(json.dumps({
-        "stage": "error",
-        "progress": 0,
-        "message": error_msg
-    }), flush=True)
-    sys.exit(1)
 
-def send_progress(stage: str, progress: int, message: str):
+def _image_module():
+    """Import PIL, registering the HEIC opener the first time."""
+    global _heif_registered
+    from PIL import Image
+    if not _heif_registered:
+        _heif_registered = True
+        try:
+            from pillow_heif import register_heif_opener
+            register_heif_opener()
+            logger.info("Successfully registered HEIF/HEIC opener")
+        except ImportError:
+            logger.warning("pillow_heif not available, HEIC files will not be supported")
+    return Image
+
+# Set inside OCR pool workers so progress is handed back to the parent
+# instead of being interleaved on stdout.
+_captured_events: Optional[List[Dict[str, Any]]] = None
+
+def send_progress(stage: str, progress: int, message: str, data: Optional[Dict[str, Any]] = None):
     """Send progress update to stdout."""
     progress_data = {
         "stage": stage,
         "progress": progress,
         "message": message
     }
-    print(json.dumps(progress_data), flush=True)
-    sys.stdout.flush()
+    if data is not None:
+        progress_data["data"] = data
+    if _captured_events is not None:
+        _captured_events.append(progress_data)
+        return
+    emit_event(progress_data)
 
 @dataclass
 class Receipt:
@@ -159,200 +146,872 @@ class Receipt:
     confidence_score: float
     line_items: List[Dict[str, Any]]
     error: Optional[str] = None
+    # Near-duplicate files of this receipt, left out of the scan (see receipt_dedup)
+    duplicates: List[Dict[str, Any]] = field(default_factory=list)
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png', '.heic')
+
+# Cache versions: bump OCR_PIPELINE_VERSION when text extraction or image
+# preprocessing changes, GPT_PROMPT_VERSION when the prompt, the model or
+# the text compaction changes. Cached entries from other versions are
+# treated as stale and pruned; entries for other run settings (see
+# cache_settings) are kept.
+OCR_PIPELINE_VERSION = "2"
+GPT_PROMPT_VERSION = "3:gpt-3.5-turbo"
+
+# Rasterization of PDF pages without a text layer. The CLI flags set these
+# environment variables so OCR pool workers use the same settings.
+DEFAULT_PDF_DPI = 200
+DEFAULT_PDF_MAX_OCR_PAGES = 10
+
+def pdf_settings() -> Tuple[int, int]:
+    """(dpi, max_ocr_pages) for PDF rasterization."""
+    return (
+        int(os.getenv('RECEIPT_PDF_DPI') or DEFAULT_PDF_DPI),
+        int(os.getenv('RECEIPT_PDF_MAX_OCR_PAGES') or DEFAULT_PDF_MAX_OCR_PAGES)
+    )
+
+# Image preprocessing: 'full' (original resolution, whole image) or 'fast'
+# (crop to the text region, downscale to TARGET_TEXT_HEIGHT pixel characters)
+PREPROCESS_MODES = ('full', 'fast')
+TARGET_TEXT_HEIGHT = 30
+MIN_PREPROCESS_SCALE = 0.2
+ANALYSIS_SIZE = 1000
+
+def preprocess_mode() -> str:
+    """Image preprocessing mode, from --preprocess / RECEIPT_PREPROCESS."""
+    mode = os.getenv('RECEIPT_PREPROCESS') or 'full'
+    return mode if mode in PREPROCESS_MODES else 'full'
+
+def cache_versions() -> Dict[str, str]:
+    """Receipt cache versions of the code and prompt."""
+    return {'text': OCR_PIPELINE_VERSION, 'parsed': GPT_PROMPT_VERSION}
+
+def cache_settings() -> Dict[str, str]:
+    """Run settings cached results depend on, part of their cache keys: OCR text
+    on the PDF and preprocessing settings (and on the backend that read it, see
+    _text_key), GPT fields on the compaction settings and follow-up budget."""
+    dpi, max_ocr_pages = pdf_settings()
+    compact, max_text_tokens = compaction_settings()
+    return {
+        'text': f"pdf{dpi}x{max_ocr_pages}:{preprocess_mode()}",
+        'parsed': f"{f'compact{max_text_tokens}' if compact else 'raw'}:reask{reask_budget()}"
+    }
+
+def _file_size(file_path: str) -> int:
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+def extract_text(file_path: str) -> Optional[str]:
+    """Extract text from a receipt file based on its type."""
+    with timed('extract_text', nbytes=_file_size(file_path)):
+        if file_path.lower().endswith('.pdf'):
+            return extract_text_from_pdf(file_path)
+        elif file_path.lower().endswith('.heic'):
+            # For HEIC files, convert to PIL Image first
+            image = convert_heic_to_pil(file_path)
+            processed_image = preprocess_image(image)
+            return _ocr_image(processed_image)
+        else:
+            # For other image formats
+            return extract_text_from_image(file_path)
+
+def _ocr_image(image) -> str:
+    """OCR a preprocessed image with this process's backend (see ocr_backends), timed."""
+    backend = get_backend()
+    with timed('image_to_string', nbytes=image.width * image.height * len(image.getbands())):
+        return backend.image_to_string(image)
+
+def _file_cache_key(file_path: str, cache: Optional[ReceiptCache]) -> Optional[str]:
+    if cache is None:
+        return None
+    try:
+        return file_digest(file_path)
+    except OSError:
+        # Unreadable files are left to extraction to report
+        return None
+
+def _text_key(key: str, backend: Optional[str] = None) -> str:
+    """Cache key of a file's text: its contents and the OCR backend that read
+    it, by default the one this process runs on (a tesserocr request falls
+    back to pytesseract when tesserocr cannot start)."""
+    return f"{backend or get_backend().name}:{key}"
+
+def _cached_text(file_path: str, cache: Optional[ReceiptCache], key: Optional[str]) -> Optional[str]:
+    if cache is None or key is None:
+        return None
+    text = cache.get('text', _text_key(key))
+    if text is not None:
+        logger.info(f"Using cached text for {file_path}")
+        send_progress("text_extraction", 80, "Using cached text extraction")
+    return text
+
+def extract_text_cached(file_path: str, cache: Optional[ReceiptCache] = None) -> Optional[str]:
+    """extract_text, reusing the cached result for unchanged file contents."""
+    key = _file_cache_key(file_path, cache)
+    text = _cached_text(file_path, cache, key)
+    if text is not None:
+        return text
+    text = extract_text(file_path)
+    if text and key is not None:
+        cache.put('text', _text_key(key), text)
+    return text
+
+def parse_receipt_locally(text: str) -> Optional[Dict[str, Any]]:
+    """Rule-based fields when every required field is confidently found, else None."""
+    if os.getenv('RECEIPT_LOCAL_FIELDS', '1') == '0':
+        return None
+    min_confidence = float(os.getenv('RECEIPT_LOCAL_MIN_CONFIDENCE') or DEFAULT_MIN_CONFIDENCE)
+    parsed_data = parse_locally(text, min_confidence)
+    if parsed_data is not None:
+        logger.info("All required fields extracted locally, skipping GPT")
+        send_progress("gpt_analysis", 95, "Fields extracted locally, GPT skipped")
+    return parsed_data
+
+def _parsed_without_gpt(text: str, cache: Optional[ReceiptCache]) -> Optional[Dict[str, Any]]:
+    """Fields from the local extractor or the cache; None when the text needs GPT."""
+    parsed_data = parse_receipt_locally(text)
+    if parsed_data is not None or cache is None:
+        return parsed_data
+    parsed_data = cache.get('parsed', text_digest(text))
+    if parsed_data is not None:
+        logger.info("Using cached GPT analysis")
+        send_progress("gpt_analysis", 95, "Using cached GPT analysis")
+    return parsed_data
+
+def _cache_parsed(text: str, parsed_data: Dict[str, Any], cache: Optional[ReceiptCache]) -> None:
+    # Failed calls are not cached so they are retried next run
+    if cache is not None and not parsed_data.get('error'):
+        cache.put('parsed', text_digest(text), parsed_data)
+
+def parse_receipt_cached(text: str, cache: Optional[ReceiptCache] = None) -> Dict[str, Any]:
+    """parse_receipt_with_gpt, reusing the cached fields for identical text.
+
+    Receipts the local extractor handles confidently never reach GPT.
+    """
+    parsed_data = _parsed_without_gpt(text, cache)
+    if parsed_data is not None:
+        return parsed_data
+    parsed_data = parse_receipt_with_gpt(text)
+    _cache_parsed(text, parsed_data, cache)
+    return parsed_data
+
+def _error_receipt(file: str, error: str) -> Receipt:
+    return Receipt(
+        id=file,
+        filename=file,
+        supplier_name='Error',
+        invoice_number='Error',
+        date=datetime.now().strftime('%Y-%m-%d'),
+        total_amount=0,
+        vat_amount=0,
+        currency='SEK',
+        confidence_score=0,
+        line_items=[],
+        error=error
+    )
+
+def _build_receipt(file: str, extracted_text: Optional[str], cache: Optional[ReceiptCache] = None) -> Receipt:
+    """Parse extracted text with GPT into a Receipt."""
+    if not extracted_text:
+        raise Exception("No text could be extracted")
+    
+    # Parse with GPT
+    parsed_data = parse_receipt_cached(extracted_text, cache)
+    return _receipt_from_parsed(file, parsed_data)
+
+def _queue_receipt(file: str, extracted_text: Optional[str], receipts: List[Optional[Receipt]],
+                   packer: BatchPacker, cache: Optional[ReceiptCache] = None) -> List[Batch]:
+    """Like _build_receipt, but a text that needs GPT gets a placeholder in
+    `receipts` and a place in a batch; returns the batches now full."""
+    if not extracted_text:
+        raise Exception("No text could be extracted")
+    parsed_data = _parsed_without_gpt(extracted_text, cache)
+    if parsed_data is not None:
+        receipts.append(_receipt_from_parsed(file, parsed_data))
+        return []
+    receipts.append(None)
+    return packer.add((len(receipts) - 1, file), extracted_text)
+
+def _fill_batch(batch: Batch, results: List[Dict[str, Any]], receipts: List[Optional[Receipt]],
+                cache: Optional[ReceiptCache]) -> None:
+    """Put a batch's parsed fields in the placeholders _queue_receipt left."""
+    for ((slot, file), text), parsed_data in zip(batch, results):
+        _cache_parsed(text, parsed_data, cache)
+        try:
+            receipts[slot] = _receipt_from_parsed(file, parsed_data)
+        except Exception as e:
+            _log_file_error(file, str(e), traceback.format_exc())
+            receipts[slot] = _error_receipt(file, str(e))
+
+def _send_batches(batches: List[Batch], receipts: List[Optional[Receipt]], cache: Optional[ReceiptCache]) -> None:
+    for batch in batches:
+        _fill_batch(batch, parse_receipts_with_gpt_batch([text for _, text in batch]), receipts, cache)
+
+def _receipt_from_parsed(file: str, parsed_data: Dict[str, Any]) -> Receipt:
+    # Create Receipt object
+    return Receipt(
+        id=file,
+        filename=file,
+        supplier_name=parsed_data.get('supplier_name', 'Unknown'),
+        invoice_number=parsed_data.get('invoice_number', 'Unknown'),
+        date=parsed_data.get('date', datetime.now().strftime('%Y-%m-%d')),
+        total_amount=float(parsed_data.get('total_amount', 0)),
+        vat_amount=float(parsed_data.get('vat_amount', 0)),
+        currency=parsed_data.get('currency', 'SEK'),
+        confidence_score=float(parsed_data.get('confidence_score', 0)),
+        line_items=parsed_data.get('line_items', []),
+        error=parsed_data.get('error')
+    )
+
+def _log_file_error(file: str, error: str, details: str) -> None:
+    logger.error(f"Error processing {file}: {error}")
+    logger.error(details)
+
+def _list_receipt_files(directory: str) -> List[str]:
+    file_paths = []
+    for root, _, files in os.walk(directory):
+        for file in files:
+            # Add HEIC to supported file types
+            if file.lower().endswith(SUPPORTED_EXTENSIONS):
+                file_paths.append(os.path.join(root, file))
+    return file_paths
+
+def _open_thumbnail(file_path: str):
+    Image = _image_module()
+    image = Image.open(file_path)
+    # JPEGs decode at a fraction of their size; comparisons only need COMPARE_WIDTH pixels
+    image.draft('L', (COMPARE_WIDTH, COMPARE_WIDTH))
+    return image
+
+def _image_hash(file_path: str) -> Optional[int]:
+    """Perceptual hash of an image file; None for PDFs and images that cannot be read."""
+    if file_path.lower().endswith('.pdf'):
+        return None
+    try:
+        with timed('image_hash', nbytes=_file_size(file_path)), _open_thumbnail(file_path) as image:
+            return image_hash(image)
+    except Exception as e:
+        logger.warning(f"Could not hash {file_path} for duplicate detection: {str(e)}")
+        return None
+
+def _drop_image_duplicates(file_paths: List[str], dedup: ReceiptDeduplicator,
+                           progress: ProgressReporter) -> List[str]:
+    """The files left to OCR once copies of an earlier image are linked to it."""
+    # The image being checked and its likely matches stay loaded between comparisons
+    @functools.lru_cache(maxsize=8)
+    def loaded(file_path: str):
+        with _open_thumbnail(file_path) as image:
+            return comparable(image)
+    
+    def compare(file_path: str, other_path: str) -> bool:
+        try:
+            with timed('image_compare'):
+                return same_picture(loaded(file_path), loaded(other_path))
+        except Exception as e:
+            logger.warning(f"Could not compare {file_path} with {other_path}: {str(e)}")
+            return False
+    
+    kept = []
+    for position, file_path in enumerate(file_paths):
+        progress.advance(position)
+        progress.progress("dedup", f"Checking file {position + 1} of {len(file_paths)} for duplicates")
+        value = _image_hash(file_path)
+        representative = dedup.add_image(file_path, value, compare) if value is not None else None
+        if representative is None:
+            kept.append(file_path)
+            continue
+        logger.info(f"Skipping {os.path.basename(file_path)}: "
+                    f"same picture as {os.path.basename(representative)}")
+    return kept
+
+def _text_duplicate(file_path: str, text: str, dedup: Optional[ReceiptDeduplicator]) -> bool:
+    """Link a file whose text repeats an earlier receipt's to that receipt; True when it did."""
+    if dedup is None:
+        return False
+    with timed('text_dedup'):
+        representative = dedup.add_text(file_path, text)
+    if representative is None:
+        return False
+    logger.info(f"Skipping GPT for {os.path.basename(file_path)}: "
+                f"same receipt as {os.path.basename(representative)}")
+    return True
+
+def _init_ocr_worker() -> None:
+    """Keep stdout for the parent's ordered JSON events; workers log to the file only."""
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        if isinstance(handler, logging.StreamHandler) and getattr(handler, 'stream', None) is sys.stdout:
+            root_logger.removeHandler(handler)
+
+def _ocr_worker(file_path: str) -> Tuple[Optional[str], List[Dict[str, Any]], Optional[Tuple[str, str]],
+                                         Dict[str, Dict[str, float]], Optional[str]]:
+    """Run text extraction in a pool worker.
+
+    Progress events are captured instead of printed so the parent can emit
+    them in file order, and stage timings and the OCR backend are handed back
+    with them; errors are returned rather than raised so one bad file never
+    takes the scan down.
+    """
+    global _captured_events
+    events: List[Dict[str, Any]] = []
+    _captured_events = events
+    try:
+        text, _, error, stages, backend = _extract_in_process(file_path)
+        return text, events, error, stages, backend
+    finally:
+        _captured_events = None
+
+def _extract_in_fresh_worker(file_path: str):
+    """Retry a single file in its own worker after the shared pool died."""
+    try:
+        with ProcessPoolExecutor(max_workers=1, initializer=_init_ocr_worker) as executor:
+            return executor.submit(_ocr_worker, file_path).result()
+    except Exception as e:
+        return None, [], (f"OCR worker crashed: {str(e)}", traceback.format_exc()), {}, None
+
+def _iter_parallel_extraction(file_paths: List[str], workers: int):
+    """Yield (text, events, error, stages, backend) per file, in input order, from a process pool.
+
+    If a worker process dies (e.g. tesseract crashing) the whole pool breaks;
+    the file being collected is then retried on its own, so only a file that
+    crashes by itself is reported as failed, and the rest continue in a new pool.
+    """
+    position = 0
+    while position < len(file_paths):
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_ocr_worker) as executor:
+            futures = [executor.submit(_ocr_worker, path) for path in file_paths[position:]]
+            for future in futures:
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    result = None
+                position += 1
+                if result is None:
+                    yield _extract_in_fresh_worker(file_paths[position - 1])
+                    break
+                yield result
+
+def _extract_in_process(file_path: str):
+    # Timed on their own; the caller records them with the file
+    with collecting(isolated=True) as timings:
+        try:
+            text, error = extract_text(file_path), None
+        except Exception as e:
+            text, error = None, (str(e), traceback.format_exc())
+    # The backend this process read the file with, for the text's cache key
+    backend = get_backend().name if text else None
+    return text, [], error, timings.as_dict(), backend
 
-def process_directory(directory: str) -> List[Receipt]:
-    """Process all receipts in a directory."""
+def _iter_extracted(file_paths: List[str], workers: int, cache: Optional[ReceiptCache]):
+    """Yield (text, events, error, stage timings) for every file, in order.
+
+    Cached text is reused; the remaining files are extracted in this process
+    or, with workers > 1, in a process pool.
+    """
+    keys = {path: _file_cache_key(path, cache) for path in file_paths}
+    cached = {path: cache.get('text', _text_key(keys[path])) for path in file_paths if keys[path]} if cache else {}
+    pending = [path for path in file_paths if cached.get(path) is None]
+    if workers > 1 and len(pending) > 1:
+        logger.info(f"Extracting text from {len(pending)} of {len(file_paths)} files with {workers} workers")
+        extracted = _iter_parallel_extraction(pending, workers)
+    else:
+        extracted = (_extract_in_process(path) for path in pending)
+    
+    for file_path in file_paths:
+        logger.info(f"Processing file: {os.path.basename(file_path)}")
+        if cached.get(file_path) is not None:
+            send_progress("text_extraction", 80, "Using cached text extraction")
+            yield cached[file_path], [], None, {}
+            continue
+        extracted_text, events, error, stages, backend = next(extracted)
+        if extracted_text and keys[file_path]:
+            cache.put('text', _text_key(keys[file_path], backend), extracted_text)
+        yield extracted_text, events, error, stages
+
+async def _build_receipts_async(file_paths: List[str], extracted, cache: Optional[ReceiptCache],
+                                concurrency: int, timeout: float, max_retries: int,
+                                progress: ProgressReporter,
+                                dedup: Optional[ReceiptDeduplicator] = None) -> List[Receipt]:
+    """Pipeline OCR and GPT: each file's extraction request starts as soon as its
+    text is available, with at most `concurrency` requests in flight. Files
+    whose text repeats an earlier file's are not sent."""
+    import openai
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    async_client = openai.AsyncOpenAI(**client_config(), max_retries=0)
+    
+    budget = batch_token_budget()
+    packer = BatchPacker(budget, measure=_gpt_tokens) if budget else None
+    
+    async def parse(file: str, text: str, file_timings: StageTimings) -> Receipt:
+        # Set in this task's context only, so concurrent files keep apart
+        with collecting(file_timings):
+            parsed_data = _parsed_without_gpt(text, cache)
+            if parsed_data is not None:
+                return _receipt_from_parsed(file, parsed_data)
+            if packer is not None:
+                parsed_data = await queue(text)
+            else:
+                async with semaphore:
+                    parsed_data = await parse_receipt_with_gpt_async(text, async_client, timeout, max_retries)
+                _cache_parsed(text, parsed_data, cache)
+            send_progress("gpt_analysis", 95, f"GPT analysis complete for {file}")
+            return _receipt_from_parsed(file, parsed_data)
+    
+    batch_tasks = []
+    # A batch's request is not any one file's; it is timed for the run
+    run_context = contextvars.copy_context()
+    
+    def queue(text: str) -> asyncio.Future:
+        # Parse tasks start in file order, so batches fill in file order
+        parsed = loop.create_future()
+        for batch in packer.add(parsed, text):
+            batch_tasks.append(run_context.run(asyncio.create_task, send(batch)))
+        return parsed
+    
+    async def send(batch: Batch) -> None:
+        try:
+            try:
+                results = await parse_receipts_with_gpt_batch_async([text for _, text in batch], async_client,
+                                                                    timeout, max_retries, semaphore=semaphore)
+            except Exception as e:
+                results = [_gpt_error_result(e)] * len(batch)
+            for (parsed, _), parsed_data in zip(batch, results):
+                parsed.set_result(parsed_data)
+            for (_, text), parsed_data in zip(batch, results):
+                _cache_parsed(text, parsed_data, cache)
+        finally:
+            # Cancelled or failed first: the parse tasks waiting on this batch fail instead of hanging
+            for parsed, _ in batch:
+                if not parsed.done():
+                    parsed.set_exception(RuntimeError("Batched GPT request did not complete"))
+    
+    async def failed(receipt: Receipt) -> Receipt:
+        return receipt
+    
+    tasks = []
+    file_timings = []
+    try:
+        # OCR stays in file order on one reader thread (it fans out to the
+        # process pool itself when workers > 1)
+        with ThreadPoolExecutor(max_workers=1) as reader:
+            for position, file_path in enumerate(file_paths):
+                file = os.path.basename(file_path)
+                progress.advance(position)
+                # Run in a copy of this context so reader-thread events reach the same sink
+                extracted_text, events, error, stages = await loop.run_in_executor(
+                    reader, contextvars.copy_context().run, next, extracted
+                )
+                record(stages)
+                timings = StageTimings()
+                timings.merge(stages)
+                file_timings.append((file, timings))
+                for event in events:
+                    emit_event(event)
+                if not error and not extracted_text:
+                    error = ("No text could be extracted", "")
+                if error:
+                    _log_file_error(file, error[0], error[1])
+                    tasks.append(asyncio.ensure_future(failed(_error_receipt(file, error[0]))))
+                    continue
+                if _text_duplicate(file_path, extracted_text, dedup):
+                    continue
+                send_progress("gpt_analysis", 85, f"Analyzing text with GPT for {file}")
+                tasks.append(asyncio.create_task(parse(file, extracted_text, timings)))
+        if packer is not None:
+            # Let every parse task queue its text before the last batch goes
+            await asyncio.sleep(0)
+            for batch in packer.flush():
+                batch_tasks.append(run_context.run(asyncio.create_task, send(batch)))
+        # Together, so a failed batch surfaces instead of leaving its parse tasks waiting
+        results = list(await asyncio.gather(*tasks, *batch_tasks))[:len(tasks)]
+        progress.advance(len(file_paths))
+        for file, timings in file_timings:
+            record_file(file, timings)
+        return results
+    finally:
+        await async_client.close()
+
+# Share of --scan progress for finding copies of the same picture, and for reading the receipts
+SCAN_PHASES = [('dedup', 5), ('files', 95)]
+# A single receipt's own stage progress is the run's
+FILE_PHASES = [('file', 100)]
+
+def process_directory(directory: str, workers: int = 1, cache: Optional[ReceiptCache] = None,
+                      gpt_concurrency: int = 1, gpt_timeout: float = 60.0, gpt_retries: int = 5) -> List[Receipt]:
+    """Process all receipts in a directory.
+
+    With workers > 1, text extraction (PDF rasterization, OpenCV and
+    Tesseract) runs in a process pool while results are still handled in
+    directory order, so the output is the same as a serial run. With a cache,
+    only new or changed files are OCR'd and only new text is sent to GPT.
+    With gpt_concurrency > 1, GPT extraction runs asynchronously alongside
+    OCR, with per-request timeouts and retry with backoff. With a GPT batch
+    token budget (--gpt-batch-tokens), texts that need GPT share requests.
+    
+    Near-duplicates (the same receipt as a photo, a screenshot and a PDF)
+    are processed once: copies of an earlier image skip OCR, texts repeating
+    an earlier receipt's skip GPT, and both are listed in that receipt's
+    duplicates instead of being returned themselves.
+    """
     logger.info(f"Processing directory: {directory}")
     receipts = []
-    errors = []
     
     if not os.path.exists(directory):
         logger.error(f"Directory not found: {directory}")
         return []
     
-    for root, _, files in os.walk(directory):
-        for file in files:
-            # Add HEIC to supported file types
-            if file.lower().endswith(('.pdf', '.jpg', '.jpeg', '.png', '.heic')):
-                file_path = os.path.join(root, file)
-                try:
-                    logger.info(f"Processing file: {file}")
-                    
+    file_paths = _list_receipt_files(directory)
+    dedup = ReceiptDeduplicator() if dedup_enabled() else None
+    
+    # Per-file stage progress becomes the position in the whole scan
+    with reporting(SCAN_PHASES) as progress:
+        if dedup is not None:
+            progress.start('dedup', len(file_paths))
+            file_paths = _drop_image_duplicates(file_paths, dedup, progress)
+        extracted = _iter_extracted(file_paths, workers, cache)
+        progress.start('files', len(file_paths))
+        if gpt_concurrency > 1 and file_paths:
+            # OCR then runs on a reader thread, and tesserocr can only be
+            # imported on the main one
+            get_backend()
+            receipts = asyncio.run(_build_receipts_async(
+                file_paths, extracted, cache, gpt_concurrency, gpt_timeout, gpt_retries, progress, dedup
+            ))
+            return _with_duplicates(receipts, file_paths, dedup)
+        
+        # With a token budget, texts that need GPT are sent a batch at a time
+        budget = batch_token_budget()
+        packer = BatchPacker(budget, measure=_gpt_tokens) if budget else None
+        for position, file_path in enumerate(file_paths):
+            file = os.path.basename(file_path)
+            progress.advance(position)
+            file_timings = StageTimings()
+            batches = []
+            try:
+                with collecting(file_timings):
                     # Extract text based on file type
-                    if file.lower().endswith('.pdf'):
-                        extracted_text = extract_text_from_pdf(file_path)
-                    elif file.lower().endswith('.heic'):
-                        # For HEIC files, convert to PIL Image first
-                        image = convert_heic_to_pil(file_path)
-                        processed_image = preprocess_image(image)
-                        extracted_text = pytesseract.image_to_string(processed_image)
+                    extracted_text, events, error, stages = next(extracted)
+                    record(stages)
+                    for event in events:
+                        emit_event(event)
+                    if not error and not extracted_text:
+                        error = ("No text could be extracted", "")
+                    if error:
+                        _log_file_error(file, error[0], error[1])
+                        receipts.append(_error_receipt(file, error[0]))
+                        continue
+                    if _text_duplicate(file_path, extracted_text, dedup):
+                        continue
+                    if packer is not None:
+                        batches = _queue_receipt(file, extracted_text, receipts, packer, cache)
                     else:
-                        # For other image formats
-                        extracted_text = extract_text_from_image(file_path)
-                    
-                    if not extracted_text:
-                        raise Exception("No text could be extracted")
-                    
-                    # Parse with GPT
-                    parsed_data = parse_receipt_with_gpt(extracted_text)
-                    
-                    # Create Receipt object
-                    receipt = Receipt(
-                        id=file,
-                        filename=file,
-                        supplier_name=parsed_data.get('supplier_name', 'Unknown'),
-                        invoice_number=parsed_data.get('invoice_number', 'Unknown'),
-                        date=parsed_data.get('date', datetime.now().strftime('%Y-%m-%d')),
-                        total_amount=float(parsed_data.get('total_amount', 0)),
-                        vat_amount=float(parsed_data.get('vat_amount', 0)),
-                        currency=parsed_data.get('currency', 'SEK'),
-                        confidence_score=float(parsed_data.get('confidence_score', 0)),
-                        line_items=parsed_data.get('line_items', []),
-                        error=parsed_data.get('error')
-                    )
-                    receipts.append(receipt)
-                    
-                except Exception as e:
-                    error_msg = f"Error processing {file}: {str(e)}"
-                    logger.error(error_msg)
-                    logger.error(traceback.format_exc())
-                    errors.append(error_msg)
-                    receipts.append(Receipt(
-                        id=file,
-                        filename=file,
-                        supplier_name='Error',
-                        invoice_number='Error',
-                        date=datetime.now().strftime('%Y-%m-%d'),
-                        total_amount=0,
-                        vat_amount=0,
-                        currency='SEK',
-                        confidence_score=0,
-                        line_items=[],
-                        error=str(e)
-                    ))
+                        receipts.append(_build_receipt(file, extracted_text, cache))
+                
+            except Exception as e:
+                _log_file_error(file, str(e), traceback.format_exc())
+                receipts.append(_error_receipt(file, str(e)))
+            finally:
+                record_file(file, file_timings)
+            # A batch's request is not any one file's
+            _send_batches(batches, receipts, cache)
+        if packer is not None:
+            _send_batches(packer.flush(), receipts, cache)
+        progress.advance(len(file_paths))
     
+    return _with_duplicates(receipts, file_paths, dedup)
+
+def _with_duplicates(receipts: List[Receipt], file_paths: List[str],
+                     dedup: Optional[ReceiptDeduplicator]) -> List[Receipt]:
+    # One receipt per file that is not a duplicate, in file order
+    if dedup is not None:
+        representatives = [path for path in file_paths if not dedup.is_duplicate(path)]
+        for file_path, receipt in zip(representatives, receipts):
+            receipt.duplicates = dedup.duplicates_of(file_path)
     return receipts
 
-def match_receipts_with_transactions(receipts: List[Receipt], transactions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """Match receipts with transactions based on amount and date."""
+def send_timings(timings: StageTimings, start: float) -> None:
+    """Send the run's stage timings as a "timings" event."""
+    send_progress("timings", 100, "Stage timings", run_summary(timings, time.perf_counter() - start))
+
+def scan_result(receipts: List[Receipt]) -> Dict[str, Any]:
+    """The --scan output document; near-duplicate files count in 'duplicates', not 'total'."""
+    return {
+        'stats': {
+            'total': len(receipts),
+            'matched': 0,
+            'unmatched': len(receipts),
+            'duplicates': sum(len(receipt.duplicates) for receipt in receipts)
+        },
+        'receipts': [asdict(r) for r in receipts]
+    }
+
+# Candidates kept per receipt by --match (0 or None keeps all of them)
+DEFAULT_MATCH_TOP_K = 5
+# Share of --match progress for finding picture copies, reading the receipts and matching them
+MATCH_PHASES = [('dedup', 5), ('files', 85), ('match', 10)]
+
+def iter_receipt_matches(receipts: List[Receipt], transactions: Iterable[Dict[str, Any]],
+                         top_k: Optional[int] = DEFAULT_MATCH_TOP_K,
+                         stats: Optional[Dict[str, int]] = None) -> Iterator[Dict[str, Any]]:
+    """Yield each receipt's best candidate transactions, one receipt at a time.
+
+    transactions is read once and may be a stream; only the id, amount and
+    day of each one are kept. Candidates refer to transactions by id and by
+    position in the input ("transaction_index"). Each receipt keeps its
+    top_k best candidates; receipts without any get an empty list. stats,
+    when given, receives the transaction counts.
+    """
+    # Imported here so scans never load NumPy for it
+    from matching_engine import AMOUNT_DATE_RULES, MatchEngine, normalize_amount, parse_day
     logger.info("Matching receipts with transactions")
-    matches = []
+    stats = stats if stats is not None else {}
+    stats.update(transactions=0, skipped_transactions=0)
+    ids: List[Any] = []
+    input_index: List[int] = []
     
-    for receipt in receipts:
-        receipt_matches = []
-        receipt_date = datetime.strptime(receipt.date, '%Y-%m-%d')
-        
-        for transaction in transactions:
+    def valid_transactions() -> Iterator[Dict[str, Any]]:
+        for index, transaction in enumerate(transactions):
+            stats['transactions'] += 1
             try:
-                # Parse transaction date
-                trans_date = datetime.strptime(transaction.get('date', ''), '%Y-%m-%d')
-                
-                # Calculate date difference in days
-                date_diff = abs((receipt_date - trans_date).days)
-                
-                # Compare amounts (with small tolerance for rounding)
-                amount_diff = abs(float(receipt.total_amount) - float(transaction.get('amount', 0)))
-                
-                # Calculate confidence score based on date and amount matching
-                confidence = 0.0
-                if date_diff == 0:
-                    confidence += 0.5
-                elif date_diff <= 2:
-                    confidence += 0.3
-                elif date_diff <= 5:
-                    confidence += 0.1
-                
-                if amount_diff < 0.01:
-                    confidence += 0.5
-                elif amount_diff < 1.0:
-                    confidence += 0.3
-                elif amount_diff < 5.0:
-                    confidence += 0.1
-                
-                if confidence > 0:
-                    receipt_matches.append({
-                        'transaction_id': transaction.get('id'),
-                        'confidence': round(confidence * 100),
-                        'date_difference': date_diff,
-                        'amount_difference': amount_diff,
-                        'transaction_data': transaction
-                    })
-            except Exception as e:
+                parse_day(transaction.get('date', ''))
+                if 'amount' not in transaction:
+                    raise ValueError("Transaction has no amount")
+            except (AttributeError, TypeError, ValueError) as e:
+                stats['skipped_transactions'] += 1
                 logger.error(f"Error matching transaction: {str(e)}")
                 continue
-        
-        if receipt_matches:
-            # Sort matches by confidence
-            receipt_matches.sort(key=lambda x: x['confidence'], reverse=True)
-            matches.append({
-                'receipt_id': receipt.id,
-                'receipt_data': asdict(receipt),
-                'matches': receipt_matches
+            ids.append(transaction.get('id'))
+            input_index.append(index)
+            yield transaction
+    
+    with timed('match_index') as index_timer:
+        engine = MatchEngine(valid_transactions(), AMOUNT_DATE_RULES, keep_transactions=False)
+        index_timer.items = stats['transactions']
+    
+    for receipt in receipts:
+        receipt_data = asdict(receipt)
+        receipt_amount = normalize_amount(receipt.total_amount)
+        receipt_day = parse_day(receipt.date)
+        receipt_matches = []
+        with timed('match_top_k'):
+            candidates = engine.top_k(receipt_data, top_k or None)
+        for position, score, _ in candidates:
+            receipt_matches.append({
+                'transaction_id': ids[position],
+                'transaction_index': input_index[position],
+                'confidence': round(score * 100),
+                'date_difference': abs(receipt_day - int(engine.days[position])),
+                'amount_difference': abs(receipt_amount - float(engine.amounts[position]))
             })
+        yield {
+            'receipt_id': receipt.id,
+            'receipt_data': receipt_data,
+            'matches': receipt_matches
+        }
+
+def match_receipts_with_transactions(receipts: List[Receipt], transactions: Iterable[Dict[str, Any]],
+                                     top_k: Optional[int] = DEFAULT_MATCH_TOP_K) -> List[Dict[str, Any]]:
+    """Match receipts with transactions based on amount and date; receipts without candidates are left out."""
+    return [result for result in iter_receipt_matches(receipts, transactions, top_k) if result['matches']]
+
+def stream_receipt_matches(receipts: List[Receipt], transactions: Iterable[Dict[str, Any]],
+                           top_k: Optional[int] = DEFAULT_MATCH_TOP_K) -> Dict[str, Any]:
+    """Stream the receipts with candidates, batched into "matches" events; returns a summary."""
+    stats: Dict[str, int] = {}
+    matched = 0
+    with reporting([('match', 100)]) as progress:
+        progress.start('match', len(receipts))
+        for position, result in enumerate(iter_receipt_matches(receipts, transactions, top_k, stats)):
+            progress.advance(position + 1)
+            if progress.due():
+                progress.progress("progress", f"Matched {position + 1} of {len(receipts)} receipts")
+            if result['matches']:
+                matched += 1
+                progress.match(result)
+    return {
+        'receipts': len(receipts),
+        'matched_receipts': matched,
+        'transactions': stats.get('transactions', 0),
+        'skipped_transactions': stats.get('skipped_transactions', 0),
+        'top_k': top_k or None
+    }
+
+def _binarize(gray, cv2):
+    logger.info("Applying adaptive thresholding")
+    thresh = cv2.adaptiveThreshold(
+        gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
+        cv2.THRESH_BINARY, 11, 2
+    )
+    
+    logger.info("Applying dilation")
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3,3))
+    return cv2.dilate(thresh, kernel, iterations=1)
+
+def _text_region(gray, cv2, np) -> Optional[Tuple[int, int, int, int, float]]:
+    """Locate the text on a page: (x0, y0, x1, y1, scale) in full-resolution
+    pixels, or None for a blank page.
+
+    Works on a downsampled copy. The crop is the receipt (the largest bright
+    contour, when the photo shows background around it) narrowed to the
+    bounding box of character-sized ink, which drops blank margins. The
+    scale brings the median character height down to TARGET_TEXT_HEIGHT.
+    """
+    height, width = gray.shape
+    analysis_scale = min(1.0, ANALYSIS_SIZE / max(height, width))
+    small = cv2.resize(gray, None, fx=analysis_scale, fy=analysis_scale, interpolation=cv2.INTER_AREA)
+    small_height, small_width = small.shape
     
-    return matches
+    # Receipt region: paper is the largest bright area
+    _, paper = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    contours, _ = cv2.findContours(paper, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    rx0, ry0, rx1, ry1 = 0, 0, small_width, small_height
+    if contours:
+        x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
+        if 0.15 <= (w * h) / (small_width * small_height) < 0.98:
+            rx0, ry0, rx1, ry1 = x, y, x + w, y + h
+    
+    # Character-sized ink inside it; specks and large blobs are ignored
+    region = small[ry0:ry1, rx0:rx1]
+    _, ink = cv2.threshold(region, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    boxes = stats[1:]
+    chars = boxes[
+        (boxes[:, cv2.CC_STAT_HEIGHT] >= 3)
+        & (boxes[:, cv2.CC_STAT_HEIGHT] <= max(3, region.shape[0] // 10))
+        & (boxes[:, cv2.CC_STAT_WIDTH] <= boxes[:, cv2.CC_STAT_HEIGHT] * 3)
+    ]
+    if len(chars) == 0:
+        return None
+    
+    text_height = float(np.median(chars[:, cv2.CC_STAT_HEIGHT])) / analysis_scale
+    pad = int(text_height) + 1
+    x0 = int((rx0 + chars[:, cv2.CC_STAT_LEFT].min()) / analysis_scale) - pad
+    y0 = int((ry0 + chars[:, cv2.CC_STAT_TOP].min()) / analysis_scale) - pad
+    x1 = int((rx0 + (chars[:, cv2.CC_STAT_LEFT] + chars[:, cv2.CC_STAT_WIDTH]).max()) / analysis_scale) + pad
+    y1 = int((ry0 + (chars[:, cv2.CC_STAT_TOP] + chars[:, cv2.CC_STAT_HEIGHT]).max()) / analysis_scale) + pad
+    scale = min(1.0, max(MIN_PREPROCESS_SCALE, TARGET_TEXT_HEIGHT / text_height))
+    return max(0, x0), max(0, y0), min(width, x1), min(height, y1), scale
+
+def preprocess_image(image, mode: Optional[str] = None):
+    """Preprocess image to improve OCR accuracy.
 
-def preprocess_image(image):
-    """Preprocess image to improve OCR accuracy."""
+    'full' binarizes the whole image at its original resolution. 'fast'
+    crops to the text region and downscales to a target text height first,
+    so Tesseract sees far fewer pixels on large phone photos.
+    """
+    import cv2
+    import numpy as np
+    Image = _image_module()
+    mode = mode or preprocess_mode()
     try:
-        logger.info("Converting image to grayscale")
-        gray = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2GRAY)
-        
-        logger.info("Applying adaptive thresholding")
-        thresh = cv2.adaptiveThreshold(
-            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-            cv2.THRESH_BINARY, 11, 2
-        )
-        
-        logger.info("Applying dilation")
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3,3))
-        dilation = cv2.dilate(thresh, kernel, iterations=1)
-        
-        logger.info("Image preprocessing completed successfully")
-        return Image.fromarray(dilation)
+        with timed('preprocess_image', nbytes=image.width * image.height * len(image.getbands())):
+            logger.info("Converting image to grayscale")
+            if mode == 'full':
+                gray = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2GRAY)
+            else:
+                gray = np.array(image.convert('L'))
+                region = _text_region(gray, cv2, np)
+                if region is None:
+                    logger.info("No text found, skipping OCR of a blank page")
+                    return Image.new('L', (32, 32), 255)
+                x0, y0, x1, y1, scale = region
+                logger.info(f"Cropping to text region {x1 - x0}x{y1 - y0} and scaling by {scale:.2f}")
+                gray = gray[y0:y1, x0:x1]
+                if scale < 1.0:
+                    gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            
+            dilation = _binarize(gray, cv2)
+            
+            logger.info("Image preprocessing completed successfully")
+            return Image.fromarray(dilation)
     except Exception as e:
         logger.error(f"Error in image preprocessing: {str(e)}")
         raise
 
-def extract_text_from_pdf(pdf_path):
-    """Extract text from PDF using OCR and PDF text extraction."""
+def _peak_rss_kb() -> Optional[int]:
+    """Peak resident memory of this process (Unix only)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS, kilobytes on Linux
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+@timed('extract_text_from_pdf')
+def extract_text_from_pdf(pdf_path, dpi: Optional[int] = None, max_ocr_pages: Optional[int] = None):
+    """Extract text from a PDF page by page.
+
+    Pages with a text layer use it directly. Only pages without one are
+    rasterized, one at a time at `dpi`, and OCR'd, up to max_ocr_pages.
+    """
+    import PyPDF2
+    from pdf2image import convert_from_path
+    default_dpi, default_max_pages = pdf_settings()
+    dpi = dpi or default_dpi
+    max_ocr_pages = default_max_pages if max_ocr_pages is None else max_ocr_pages
     try:
-        text_content = []
         logger.info(f"Processing PDF: {pdf_path}")
         
         # Report progress
         send_progress("pdf_processing", 10, "Starting PDF processing")
         
-        # First try to extract text directly from PDF
+        # Text layer first, for every page
+        page_texts = []
         with open(pdf_path, 'rb') as file:
             pdf_reader = PyPDF2.PdfReader(file)
+            page_count = len(pdf_reader.pages)
             for page_num, page in enumerate(pdf_reader.pages):
                 logger.info(f"Extracting text from page {page_num + 1}")
-                send_progress("text_extraction", 20 + (page_num * 10), f"Extracting text from page {page_num + 1}")
-                text = page.extract_text()
-                if text.strip():
-                    text_content.append(text)
+                send_progress("text_extraction", 20 + (30 * page_num) // page_count, f"Extracting text from page {page_num + 1}")
+                page_texts.append(page.extract_text() or '')
+                if page_texts[-1].strip():
                     logger.info(f"Successfully extracted text from page {page_num + 1}")
         
-        # If no text was extracted, use OCR
-        if not text_content:
-            logger.info("No text extracted directly from PDF, attempting OCR")
-            send_progress("ocr_processing", 50, "Starting OCR processing")
-            images = convert_from_path(pdf_path)
-            
-            for page_num, image in enumerate(images):
-                logger.info(f"Processing page {page_num + 1} with OCR")
-                send_progress("ocr_processing", 60 + (page_num * 10), f"OCR processing page {page_num + 1}")
-                processed_image = preprocess_image(image)
-                text = pytesseract.image_to_string(processed_image)
-                if text.strip():
-                    text_content.append(text)
-                    logger.info(f"Successfully extracted text from page {page_num + 1} using OCR")
+        # OCR only the pages without a text layer
+        scanned_pages = [page_num for page_num, text in enumerate(page_texts) if not text.strip()]
+        skipped_pages = scanned_pages[max_ocr_pages:]
+        scanned_pages = scanned_pages[:max_ocr_pages]
+        if skipped_pages:
+            logger.warning(f"Skipping OCR of {len(skipped_pages)} pages beyond the limit of {max_ocr_pages}")
+        
+        page_stats = []
+        for position, page_num in enumerate(scanned_pages):
+            logger.info(f"Processing page {page_num + 1} with OCR")
+            send_progress("ocr_processing", 50 + (30 * position) // len(scanned_pages), f"OCR processing page {page_num + 1}")
+            start = time.perf_counter()
+            # One page in memory at a time
+            with timed('pdf_rasterize') as raster:
+                image = convert_from_path(pdf_path, dpi=dpi, first_page=page_num + 1, last_page=page_num + 1)[0]
+                raster_bytes = image.width * image.height * len(image.getbands())
+                raster.nbytes = raster_bytes
+            text = _ocr_image(preprocess_image(image))
+            del image
+            page_texts[page_num] = text
+            page_stats.append({
+                "page": page_num + 1,
+                "seconds": round(time.perf_counter() - start, 3),
+                "raster_bytes": raster_bytes
+            })
+            if text.strip():
+                logger.info(f"Successfully extracted text from page {page_num + 1} using OCR")
         
+        text_content = [text for text in page_texts if text.strip()]
         if not text_content:
             raise Exception("No text could be extracted from the PDF")
-            
-        send_progress("text_extraction", 80, "Text extraction complete")
+        
+        stats = {
+            "pages": page_count,
+            "text_layer_pages": page_count - len(scanned_pages) - len(skipped_pages),
+            "ocr_pages": page_stats,
+            "skipped_pages": [page_num + 1 for page_num in skipped_pages],
+            "dpi": dpi,
+            "peak_rss_kb": _peak_rss_kb()
+        }
+        logger.info(f"PDF extraction stats: {json.dumps(stats)}")
+        send_progress("text_extraction", 80, "Text extraction complete", stats)
         return '\n'.join(text_content)
     except Exception as e:
         logger.error(f"Error extracting text from PDF: {str(e)}")
@@ -361,6 +1020,7 @@ def extract_text_from_pdf(pdf_path):
 
 def extract_text_from_image(image_path: str) -> str:
     """Extract text from an image file using OCR."""
+    Image = _image_module()
     try:
         logger.info(f"Processing image: {image_path}")
         send_progress("image_processing", 10, "Starting image processing")
@@ -371,7 +1031,7 @@ def extract_text_from_image(image_path: str) -> str:
         
         send_progress("ocr_processing", 50, "Starting OCR processing")
         # Perform OCR
-        text = pytesseract.image_to_string(processed_image)
+        text = _ocr_image(processed_image)
         
         if not text.strip():
             raise Exception("No text could be extracted from the image")
@@ -383,19 +1043,24 @@ def extract_text_from_image(image_path: str) -> str:
         logger.error(traceback.format_exc())
         return None
 
-def parse_receipt_with_gpt(text):
-    """Parse receipt text using GPT to extract structured data."""
-    try:
-        if not text or not text.strip():
-            raise ValueError("No text provided for analysis")
+GPT_MODEL = "gpt-3.5-turbo"  # More cost-effective than GPT-4
+GPT_SYSTEM_PROMPT = "You are a financial document parser that extracts structured data from receipts and invoices. Be precise with numbers and dates."
 
-        logger.info("Sending text to GPT for analysis")
-        send_progress("gpt_analysis", 85, "Analyzing text with GPT")
-        
-        # Create a focused prompt for financial information extraction
-        prompt = f"""Extract the following financial information from this receipt/invoice text. Format the response as JSON:
+def _gpt_text(text: str) -> str:
+    """Receipt text as GPT gets it: compacted (see text_compaction) unless --no-compact."""
+    compact, max_text_tokens = compaction_settings()
+    if not compact:
+        return text
+    with timed('compact_text', nbytes=len(text.encode('utf-8'))):
+        return compact_text(text, max_text_tokens)
 
-Required fields:
+def _gpt_tokens(text: str) -> int:
+    """Estimated tokens of a text as GPT gets it, for packing batches."""
+    compact, max_text_tokens = compaction_settings()
+    return estimate_tokens(compact_text(text, max_text_tokens) if compact else text)
+
+# The fields and rules both prompts ask for
+GPT_FIELD_RULES = """Required fields:
 - supplier_name: The company issuing the receipt/invoice
 - invoice_number: The invoice or receipt number
 - date: The payment/invoice date (YYYY-MM-DD format)
@@ -421,64 +1086,334 @@ Additional rules:
 7. If multiple totals found, use the final/grand total
 8. If currency not explicitly stated, try to infer from symbols (€->EUR, $->USD, etc.)
 9. Calculate VAT amount if only percentage is given
-10. Assign confidence based on completeness and clarity of data
+10. Assign confidence based on completeness and clarity of data"""
+
+def _gpt_messages(text: str) -> List[Dict[str, str]]:
+    """Build the extraction request for one receipt."""
+    # Create a focused prompt for financial information extraction
+    prompt = f"""Extract the following financial information from this receipt/invoice text. Format the response as JSON:
+
+{GPT_FIELD_RULES}
 
 Receipt text:
-{text}
+{_gpt_text(text)}
+
+Respond only with the JSON object, no additional text."""
+    return [
+        {"role": "system", "content": GPT_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def _gpt_batch_messages(texts: List[str]) -> List[Dict[str, str]]:
+    """Build one extraction request for several receipts (see gpt_batches)."""
+    prompt = f"""Extract the following financial information from each receipt/invoice text below. Format the response as a JSON object with a "receipts" array holding one object per receipt: its "id" and its fields. Use null for a required field that is not found.
+
+{GPT_FIELD_RULES}
+
+Receipts:
+{batch_receipts_text([_gpt_text(text) for text in texts])}
 
 Respond only with the JSON object, no additional text."""
+    return [
+        {"role": "system", "content": GPT_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def _complete_parsed_data(parsed_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill in confidence and defaults for fields GPT left out."""
+    # Add confidence score if not present
+    if 'confidence_score' not in parsed_data:
+        confidence = sum(1 for field in REQUIRED_FIELDS if field in parsed_data and parsed_data[field]) / len(REQUIRED_FIELDS)
+        parsed_data['confidence_score'] = round(confidence, 2)
+    
+    # Ensure all required fields are present
+    for field in REQUIRED_FIELDS:
+        if field not in parsed_data or not parsed_data[field]:
+            if field in ['total_amount', 'vat_amount']:
+                parsed_data[field] = 0
+            else:
+                parsed_data[field] = 'Unknown'
+    
+    # Ensure line_items is always an array
+    if 'line_items' not in parsed_data:
+        parsed_data['line_items'] = []
+    
+    return parsed_data
+
+def _gpt_error_result(e: Exception) -> Dict[str, Any]:
+    logger.error(f"Error parsing with GPT: {str(e)}")
+    logger.error(traceback.format_exc())
+    return {
+        'error': str(e),
+        'supplier_name': 'Error',
+        'invoice_number': 'Error',
+        'date': datetime.now().strftime('%Y-%m-%d'),
+        'total_amount': 0,
+        'vat_amount': 0,
+        'currency': 'SEK',
+        'confidence_score': 0,
+        'line_items': []
+    }
 
+def parse_receipt_with_gpt(text):
+    """Parse receipt text using GPT to extract structured data."""
+    try:
+        if not text or not text.strip():
+            raise ValueError("No text provided for analysis")
+
+        logger.info("Sending text to GPT for analysis")
+        send_progress("gpt_analysis", 85, "Analyzing text with GPT")
+        
         # Call GPT with the focused prompt, using a more cost-effective model
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",  # More cost-effective than GPT-4
-            messages=[
-                {"role": "system", "content": "You are a financial document parser that extracts structured data from receipts and invoices. Be precise with numbers and dates."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={ "type": "json_object" },
-            temperature=0.1  # Lower temperature for more consistent results
-        )
+        with timed('parse_receipt_with_gpt', nbytes=len(text.encode('utf-8'))):
+            response = get_client().chat.completions.create(
+                model=GPT_MODEL,
+                messages=_gpt_messages(text),
+                response_format={ "type": "json_object" },
+                temperature=0.1  # Lower temperature for more consistent results
+            )
+        _record_usage(response)
 
         # Parse GPT's response
         parsed_data = json.loads(response.choices[0].message.content)
         logger.info("Successfully received and parsed GPT response")
+        parsed_data = _reask_invalid_fields(text, parsed_data, response)
         send_progress("gpt_analysis", 95, "GPT analysis complete")
         
-        # Add confidence score if not present
-        if 'confidence_score' not in parsed_data:
-            required_fields = ['supplier_name', 'invoice_number', 'date', 'total_amount', 'currency', 'vat_amount']
-            confidence = sum(1 for field in required_fields if field in parsed_data and parsed_data[field]) / len(required_fields)
-            parsed_data['confidence_score'] = round(confidence, 2)
-        
-        # Ensure all required fields are present
-        for field in ['supplier_name', 'invoice_number', 'date', 'total_amount', 'currency', 'vat_amount']:
-            if field not in parsed_data or not parsed_data[field]:
-                if field in ['total_amount', 'vat_amount']:
-                    parsed_data[field] = 0
-                else:
-                    parsed_data[field] = 'Unknown'
-        
-        # Ensure line_items is always an array
-        if 'line_items' not in parsed_data:
-            parsed_data['line_items'] = []
+        parsed_data = _complete_parsed_data(parsed_data)
         
         send_progress("complete", 100, "Receipt analysis complete")
         return parsed_data
 
     except Exception as e:
-        logger.error(f"Error parsing with GPT: {str(e)}")
-        logger.error(traceback.format_exc())
-        return {
-            'error': str(e),
-            'supplier_name': 'Error',
-            'invoice_number': 'Error',
-            'date': datetime.now().strftime('%Y-%m-%d'),
-            'total_amount': 0,
-            'vat_amount': 0,
-            'currency': 'SEK',
-            'confidence_score': 0,
-            'line_items': []
-        }
+        return _gpt_error_result(e)
+
+def _record_usage(response, prefix: str = 'gpt') -> None:
+    """Count a response's tokens in the stage timings, as items of <prefix>_prompt_tokens and <prefix>_completion_tokens."""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return
+    record({
+        f'{prefix}_prompt_tokens': {'seconds': 0.0, 'calls': 1, 'items': usage.prompt_tokens or 0, 'bytes': 0},
+        f'{prefix}_completion_tokens': {'seconds': 0.0, 'calls': 1, 'items': usage.completion_tokens or 0, 'bytes': 0}
+    })
+
+def _full_rerun_tokens(text: str, parsed_data: Dict[str, Any], response=None) -> int:
+    """Tokens of a whole new request for the receipt: the first request's when it
+    was sent alone, else an estimate (a batch entry's share is not reported)."""
+    usage = getattr(response, 'usage', None)
+    if usage is not None and usage.total_tokens:
+        return usage.total_tokens
+    prompt = ''.join(message['content'] for message in _gpt_messages(text))
+    return estimate_tokens(prompt) + estimate_tokens(json.dumps(parsed_data))
+
+def _reask_messages(text: str, problems: Dict[str, str], parsed_data: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Build a follow-up request for just the fields in `problems` (see gpt_followup)."""
+    return [
+        {"role": "system", "content": GPT_SYSTEM_PROMPT},
+        {"role": "user", "content": reask_prompt(text, problems, parsed_data)}
+    ]
+
+def _record_reask(response, rerun_tokens: int) -> None:
+    # Next to each follow-up's tokens, what re-running the receipt would have cost
+    _record_usage(response, 'gpt_reask')
+    record({'gpt_full_rerun_tokens': {'seconds': 0.0, 'calls': 1, 'items': rerun_tokens, 'bytes': 0}})
+
+def _reask_invalid_fields(text: str, parsed_data: Dict[str, Any], response=None) -> Dict[str, Any]:
+    """Ask GPT again for only the fields that are missing or invalid, up to the re-ask budget.
+
+    Answers that fix their field are merged in; the rest of the response is
+    kept as it was. `response` is the request that gave parsed_data, if it
+    was for this receipt alone.
+    """
+    rerun_tokens = None
+    for _ in range(reask_budget()):
+        problems = invalid_fields(parsed_data)
+        if not problems:
+            break
+        if rerun_tokens is None:
+            rerun_tokens = _full_rerun_tokens(text, parsed_data, response)
+        logger.info(f"Asking GPT again for {', '.join(problems)}")
+        try:
+            with timed('gpt_reask', items=len(problems)):
+                response = get_client().chat.completions.create(
+                    model=GPT_MODEL,
+                    messages=_reask_messages(text, problems, parsed_data),
+                    response_format={ "type": "json_object" },
+                    temperature=0.1
+                )
+        except Exception as e:
+            logger.warning(f"GPT follow-up request failed: {str(e)}")
+            break
+        _record_reask(response, rerun_tokens)
+        parsed_data = merge_answer(parsed_data, response.choices[0].message.content, problems)
+    return parsed_data
+
+def parse_receipts_with_gpt_batch(texts: List[str]) -> List[Dict[str, Any]]:
+    """Parse several receipt texts with one GPT request, in order.
+
+    Entries the response leaves out or gets wrong are parsed again one
+    request each, so every text ends up with the fields parse_receipt_with_gpt
+    would give it.
+    """
+    if len(texts) == 1:
+        return [parse_receipt_with_gpt(texts[0])]
+    try:
+        logger.info(f"Sending {len(texts)} receipts to GPT in one request")
+        with timed('parse_receipts_with_gpt_batch', items=len(texts),
+                   nbytes=sum(len(text.encode('utf-8')) for text in texts)):
+            response = get_client().chat.completions.create(
+                model=GPT_MODEL,
+                messages=_gpt_batch_messages(texts),
+                response_format={ "type": "json_object" },
+                temperature=0.1
+            )
+        _record_usage(response)
+        parsed, failed = parse_batch_response(response.choices[0].message.content, len(texts))
+    except Exception as e:
+        logger.warning(f"Batched GPT request failed: {str(e)}")
+        parsed, failed = {}, list(range(len(texts)))
+    if failed:
+        logger.info(f"Sending {len(failed)} of {len(texts)} batched receipts again one at a time")
+    results = []
+    for position, text in enumerate(texts):
+        parsed_data = parsed.get(position)
+        if parsed_data is None:
+            results.append(parse_receipt_with_gpt(text))
+            continue
+        parsed_data = _reask_invalid_fields(text, parsed_data)
+        results.append(_complete_parsed_data(parsed_data))
+    return results
+
+def _retryable_gpt_errors() -> Tuple[type, ...]:
+    """Errors worth retrying: rate limits, overloaded or unreachable API, timeouts."""
+    import openai
+    return (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError
+    )
+
+def _retry_delay(error: Exception, attempt: int, base_delay: float) -> float:
+    """Backoff before the next attempt, honouring Retry-After when the API sends it."""
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), 60.0)
+        except ValueError:
+            pass
+    return min(base_delay * (2 ** attempt), 30.0) * (0.5 + random.random() / 2)
+
+async def _gpt_request_async(async_client: "openai.AsyncOpenAI", messages: List[Dict[str, str]], stage: str,
+                             items: int, nbytes: int, timeout: float, max_retries: int, base_delay: float,
+                             record_usage: bool = True):
+    """One chat completion, timed as `stage`, with a per-request timeout and retry with backoff."""
+    for attempt in range(max_retries + 1):
+        try:
+            with timed(stage, items=items, nbytes=nbytes):
+                response = await async_client.chat.completions.create(
+                    model=GPT_MODEL,
+                    messages=messages,
+                    response_format={ "type": "json_object" },
+                    temperature=0.1,
+                    timeout=timeout
+                )
+            if record_usage:
+                _record_usage(response)
+            return response
+        except _retryable_gpt_errors() as e:
+            if attempt == max_retries:
+                raise
+            delay = _retry_delay(e, attempt, base_delay)
+            logger.warning(f"GPT request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+async def parse_receipt_with_gpt_async(text: str, async_client: "openai.AsyncOpenAI", timeout: float = 60.0,
+                                       max_retries: int = 5, base_delay: float = 1.0) -> Dict[str, Any]:
+    """Async parse_receipt_with_gpt with a per-request timeout and retry with backoff.
+
+    Produces the same fields as the blocking version; failures after the
+    retry budget yield the same error result.
+    """
+    try:
+        if not text or not text.strip():
+            raise ValueError("No text provided for analysis")
+        
+        response = await _gpt_request_async(async_client, _gpt_messages(text), 'parse_receipt_with_gpt', 1,
+                                            len(text.encode('utf-8')), timeout, max_retries, base_delay)
+        parsed_data = json.loads(response.choices[0].message.content)
+        logger.info("Successfully received and parsed GPT response")
+        parsed_data = await _reask_invalid_fields_async(text, parsed_data, async_client, timeout, max_retries,
+                                                        base_delay, response)
+        return _complete_parsed_data(parsed_data)
+    
+    except Exception as e:
+        return _gpt_error_result(e)
+
+async def _reask_invalid_fields_async(text: str, parsed_data: Dict[str, Any], async_client: "openai.AsyncOpenAI",
+                                      timeout: float, max_retries: int, base_delay: float,
+                                      response=None) -> Dict[str, Any]:
+    """Async _reask_invalid_fields; each follow-up retries like any other request."""
+    rerun_tokens = None
+    for _ in range(reask_budget()):
+        problems = invalid_fields(parsed_data)
+        if not problems:
+            break
+        if rerun_tokens is None:
+            rerun_tokens = _full_rerun_tokens(text, parsed_data, response)
+        logger.info(f"Asking GPT again for {', '.join(problems)}")
+        try:
+            response = await _gpt_request_async(async_client, _reask_messages(text, problems, parsed_data),
+                                                'gpt_reask', len(problems), 0, timeout, max_retries, base_delay,
+                                                record_usage=False)
+        except Exception as e:
+            logger.warning(f"GPT follow-up request failed: {str(e)}")
+            break
+        _record_reask(response, rerun_tokens)
+        parsed_data = merge_answer(parsed_data, response.choices[0].message.content, problems)
+    return parsed_data
+
+async def _limited(semaphore: Optional[asyncio.Semaphore], awaitable):
+    if semaphore is None:
+        return await awaitable
+    async with semaphore:
+        return await awaitable
+
+async def parse_receipts_with_gpt_batch_async(texts: List[str], async_client: "openai.AsyncOpenAI",
+                                              timeout: float = 60.0, max_retries: int = 5, base_delay: float = 1.0,
+                                              semaphore: Optional[asyncio.Semaphore] = None) -> List[Dict[str, Any]]:
+    """Async parse_receipts_with_gpt_batch; the batch, the entries sent again
+    and the follow-ups each take a slot of `semaphore`, so they run concurrently."""
+    if len(texts) == 1:
+        return [await _limited(semaphore, parse_receipt_with_gpt_async(texts[0], async_client, timeout,
+                                                                      max_retries, base_delay))]
+    try:
+        logger.info(f"Sending {len(texts)} receipts to GPT in one request")
+        response = await _limited(semaphore, _gpt_request_async(
+            async_client, _gpt_batch_messages(texts), 'parse_receipts_with_gpt_batch', len(texts),
+            sum(len(text.encode('utf-8')) for text in texts), timeout, max_retries, base_delay
+        ))
+        parsed, failed = parse_batch_response(response.choices[0].message.content, len(texts))
+    except Exception as e:
+        logger.warning(f"Batched GPT request failed: {str(e)}")
+        parsed, failed = {}, list(range(len(texts)))
+    if failed:
+        logger.info(f"Sending {len(failed)} of {len(texts)} batched receipts again one at a time")
+    
+    async def finish(text: str, parsed_data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        if parsed_data is None:
+            return await parse_receipt_with_gpt_async(text, async_client, timeout, max_retries, base_delay)
+        parsed_data = await _reask_invalid_fields_async(text, parsed_data, async_client, timeout, max_retries,
+                                                        base_delay)
+        return _complete_parsed_data(parsed_data)
+    
+    # Failed entries and follow-ups run concurrently, each in a slot of its own
+    return list(await asyncio.gather(*(
+        _limited(semaphore, finish(text, parsed.get(position)))
+        for position, text in enumerate(texts)
+    )))
 
 # Add function to convert HEIC to PIL Image
 def convert_heic_to_pil(file_path):
@@ -488,7 +1423,7 @@ def convert_heic_to_pil(file_path):
         send_progress("image_processing", 10, "Converting HEIC file")
         
         # Open HEIC file using pillow_heif
-        image = Image.open(file_path)
+        image = _image_module().open(file_path)
         logger.info(f"Successfully converted HEIC file to PIL Image")
         return image
     except Exception as e:
@@ -501,100 +1436,188 @@ if __name__ == '__main__':
         parser = argparse.ArgumentParser(description='Process and analyze receipts')
         parser.add_argument('--scan', help='Scan directory for receipts')
         parser.add_argument('--match', help='Match receipts with transactions')
+        parser.add_argument('--transactions', metavar='SOURCE',
+                            help='Transactions for --match: a JSON array, JSON lines or a Svea/Revolut export; - for stdin')
+        parser.add_argument('--top-k', type=int, default=DEFAULT_MATCH_TOP_K,
+                            help=f'Candidate transactions kept per receipt for --match (default {DEFAULT_MATCH_TOP_K}, 0 = all)')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of OCR worker processes for --scan/--match (0 = one per CPU core)')
+        parser.add_argument('--gpt-concurrency', type=int, default=1,
+                            help='Concurrent GPT extraction requests for --scan/--match (1 = one at a time)')
+        parser.add_argument('--gpt-timeout', type=float, default=60.0, help='Per-request GPT timeout in seconds')
+        parser.add_argument('--gpt-retries', type=int, default=5,
+                            help='Retries with backoff on rate limits, timeouts and server errors')
+        parser.add_argument('--gpt-batch-tokens', type=int,
+                            help='Pack receipts needing GPT into one request up to this many text tokens '
+                                 '(default 0: one receipt per request)')
+        parser.add_argument('--gpt-text-tokens', type=int,
+                            help=f'Most receipt text tokens sent to GPT, field lines first '
+                                 f'(default {DEFAULT_MAX_TEXT_TOKENS}, 0 = no cap)')
+        parser.add_argument('--gpt-reasks', type=int,
+                            help=f'Follow-up requests per receipt for fields GPT left out or got wrong '
+                                 f'(default {DEFAULT_REASKS}: off)')
+        parser.add_argument('--no-compact', action='store_true',
+                            help='Send GPT the OCR text as extracted, without dropping noise and repeated page blocks')
+        parser.add_argument('--pdf-dpi', type=int,
+                            help=f'DPI for rasterizing PDF pages without a text layer (default {DEFAULT_PDF_DPI})')
+        parser.add_argument('--pdf-max-pages', type=int,
+                            help=f'Most PDF pages to OCR per file (default {DEFAULT_PDF_MAX_OCR_PAGES})')
+        parser.add_argument('--preprocess', choices=PREPROCESS_MODES,
+                            help='Image preprocessing: full resolution, or fast (crop to text and downscale)')
+        parser.add_argument('--ocr-backend', choices=OCR_BACKENDS,
+                            help='OCR engine: tesserocr keeps Tesseract loaded, pytesseract starts it per image '
+                                 '(default auto: tesserocr when installed)')
+        parser.add_argument('--gpt-only', action='store_true',
+                            help='Always use GPT, even when the local extractor finds every field')
+        parser.add_argument('--no-dedup', action='store_true',
+                            help='Process near-duplicate files (the same receipt uploaded twice) separately')
+        parser.add_argument('--local-min-confidence', type=float,
+                            help=f'Per-field confidence needed to skip GPT (default {DEFAULT_MIN_CONFIDENCE})')
+        parser.add_argument('--check-connection', action='store_true',
+                            help='Send a one-token test request to OpenAI before processing')
+        parser.add_argument('--cache-path', help='Receipt cache database (default: $RECEIPT_CACHE_PATH or ~/.cache/solvify-crm)')
+        parser.add_argument('--no-cache', action='store_true', help='Do not read or write the OCR/GPT result cache')
+        parser.add_argument('--clear-cache', action='store_true', help='Empty the OCR/GPT result cache before processing')
+        parser.add_argument('--progress-interval', type=float,
+                            help='Seconds between progress events (default: $RECEIPT_PROGRESS_INTERVAL or 0.2)')
+        parser.add_argument('--no-progress', action='store_true',
+                            help='Only write results and matches, no progress events')
+        parser.add_argument('--profile', metavar='PATH',
+                            help='Profile this run and write the result to PATH (OCR pool workers are not profiled)')
+        parser.add_argument('--profiler', choices=PROFILERS, default='cprofile',
+                            help='cprofile: pstats data; pyinstrument: HTML for a .html PATH, else text')
         parser.add_argument('file_path', nargs='?', help='Single receipt file to process')
-        parser.add_argument('transactions_json', nargs='?', help='JSON string of transactions for matching')
+        parser.add_argument('transactions_json', nargs='?',
+                            help='JSON string of transactions for matching (prefer --transactions)')
         args = parser.parse_args()
         
         logger.info(f"Starting receipt analysis with args: {args}")
-        print(json.dumps({
-            "stage": "initialization",
-            "progress": 10,
-            "message": "Starting receipt analysis"
-        }), flush=True)
+        if args.pdf_dpi:
+            os.environ['RECEIPT_PDF_DPI'] = str(args.pdf_dpi)
+        if args.pdf_max_pages is not None:
+            os.environ['RECEIPT_PDF_MAX_OCR_PAGES'] = str(args.pdf_max_pages)
+        if args.preprocess:
+            os.environ['RECEIPT_PREPROCESS'] = args.preprocess
+        if args.ocr_backend:
+            os.environ['RECEIPT_OCR_BACKEND'] = args.ocr_backend
+        if args.gpt_only:
+            os.environ['RECEIPT_LOCAL_FIELDS'] = '0'
+        if args.gpt_batch_tokens is not None:
+            os.environ['RECEIPT_GPT_BATCH_TOKENS'] = str(args.gpt_batch_tokens)
+        if args.gpt_text_tokens is not None:
+            os.environ['RECEIPT_GPT_TEXT_TOKENS'] = str(args.gpt_text_tokens)
+        if args.no_compact:
+            os.environ['RECEIPT_COMPACT'] = '0'
+        if args.gpt_reasks is not None:
+            os.environ['RECEIPT_GPT_REASKS'] = str(args.gpt_reasks)
+        if args.no_dedup:
+            os.environ['RECEIPT_DEDUP'] = '0'
+        if args.local_min_confidence is not None:
+            os.environ['RECEIPT_LOCAL_MIN_CONFIDENCE'] = str(args.local_min_confidence)
+        if args.progress_interval is not None:
+            os.environ['RECEIPT_PROGRESS_INTERVAL'] = str(args.progress_interval)
+        if args.no_progress:
+            os.environ['RECEIPT_PROGRESS'] = '0'
+        workers = args.workers or os.cpu_count() or 1
         
-        if args.scan:
-            # Process all receipts in directory
-            logger.info(f"Scanning directory: {args.scan}")
-            receipts = process_directory(args.scan)
-            result = {
-                'stats': {
-                    'total': len(receipts),
-                    'matched': 0,
-                    'unmatched': len(receipts)
-                },
-                'receipts': [asdict(r) for r in receipts]
-            }
-            print(json.dumps(result, ensure_ascii=False))
-            
-        elif args.match and args.transactions_json:
-            # Match receipts with transactions
-            logger.info("Starting receipt matching process")
-            receipts = process_directory(args.match)
-            transactions = json.loads(args.transactions_json)
-            matches = match_receipts_with_transactions(receipts, transactions)
-            print(json.dumps({'matches': matches}, ensure_ascii=False))
-            
-        elif args.file_path:
-            # Process single receipt
-            logger.info(f"Processing single receipt: {args.file_path}")
-            if not Path(args.file_path).is_file():
-                error_msg = f'File not found: {args.file_path}'
-                logger.error(error_msg)
+        cache = None
+        if not args.no_cache:
+            try:
+                cache = ReceiptCache(args.cache_path, versions=cache_versions(), settings=cache_settings())
+                if args.clear_cache:
+                    cache.clear()
+            except Exception as e:
+                # The cache is an optimization; never fail a run because of it
+                logger.warning(f"Receipt cache unavailable, continuing without it: {str(e)}")
+                cache = None
+        
+        if args.check_connection:
+            try:
+                check_openai_connection()
+            except Exception as e:
                 print(json.dumps({
                     "stage": "error",
                     "progress": 0,
-                    "message": error_msg
+                    "message": f"Failed to initialize OpenAI client: {str(e)}"
                 }), flush=True)
                 sys.exit(1)
+        
+        # Stage timings for the whole run; --profile also profiles it. One
+        # reporter covers the run, so its percentage never goes backwards
+        run_start = time.perf_counter()
+        phases = MATCH_PHASES if args.match else SCAN_PHASES if args.scan else FILE_PHASES
+        with profiled(args.profile, args.profiler), collecting() as run_timings, \
+                ProgressReporter(phases) as progress:
+            if args.check_connection:
+                progress.progress("initialization", "Successfully initialized OpenAI client", force=True)
+            progress.progress("initialization", "Starting receipt analysis", force=True)
+            if args.scan:
+                # Process all receipts in directory
+                logger.info(f"Scanning directory: {args.scan}")
+                receipts = process_directory(args.scan, workers, cache,
+                                             args.gpt_concurrency, args.gpt_timeout, args.gpt_retries)
+                send_timings(run_timings, run_start)
+                print(json.dumps(scan_result(receipts), ensure_ascii=False))
             
-            print(json.dumps({
-                "stage": "processing",
-                "progress": 20,
-                "message": f"Processing file: {args.file_path}"
-            }), flush=True)
+            elif args.match and (args.transactions or args.transactions_json):
+                # Match receipts with transactions
+                logger.info("Starting receipt matching process")
+                receipts = process_directory(args.match, workers, cache,
+                                             args.gpt_concurrency, args.gpt_timeout, args.gpt_retries)
+                if args.transactions:
+                    # Parsed while the matcher indexes them, never loaded whole
+                    transactions = iter_transaction_source(args.transactions)
+                else:
+                    transactions = json.loads(args.transactions_json)
+                # Candidates go out in batches instead of one document with all of them
+                summary = stream_receipt_matches(receipts, transactions, args.top_k)
+                send_timings(run_timings, run_start)
+                send_progress("complete", 100, "Matching complete", summary)
             
-            # Handle different file types
-            file_path = args.file_path.lower()
-            if file_path.endswith('.pdf'):
-                extracted_text = extract_text_from_pdf(args.file_path)
-            elif file_path.endswith('.heic'):
-                # For HEIC files, convert to PIL Image first
-                image = convert_heic_to_pil(args.file_path)
-                processed_image = preprocess_image(image)
-                extracted_text = pytesseract.image_to_string(processed_image)
-            else:
-                # For other image formats
-                extracted_text = extract_text_from_image(args.file_path)
+            elif args.file_path:
+                # Process single receipt
+                logger.info(f"Processing single receipt: {args.file_path}")
+                if not Path(args.file_path).is_file():
+                    error_msg = f'File not found: {args.file_path}'
+                    logger.error(error_msg)
+                    print(json.dumps({
+                        "stage": "error",
+                        "progress": 0,
+                        "message": error_msg
+                    }), flush=True)
+                    sys.exit(1)
+            
+                progress.start('file', 1)
+                progress.progress("processing", f"Processing file: {args.file_path}", force=True, fraction=0.2)
+            
+                # Handle different file types
+                extracted_text = extract_text_cached(args.file_path, cache)
                 
-            if not extracted_text:
-                error_msg = 'Failed to extract text from file'
+                if not extracted_text:
+                    error_msg = 'Failed to extract text from file'
+                    logger.error(error_msg)
+                    print(json.dumps({
+                        "stage": "error",
+                        "progress": 0,
+                        "message": error_msg
+                    }), flush=True)
+                    sys.exit(1)
+            
+                result = parse_receipt_cached(extracted_text, cache)
+                send_timings(run_timings, run_start)
+                progress.progress("complete", "Analysis complete", result, fraction=1.0)
+            
+            else:
+                error_msg = 'Invalid arguments'
                 logger.error(error_msg)
                 print(json.dumps({
                     "stage": "error",
                     "progress": 0,
                     "message": error_msg
                 }), flush=True)
+                parser.print_help()
                 sys.exit(1)
             
-            result = parse_receipt_with_gpt(extracted_text)
-            print(json.dumps({
-                "stage": "complete",
-                "progress": 100,
-                "message": "Analysis complete",
-                "data": result
-            }, ensure_ascii=False), flush=True)
-            
-        else:
-            error_msg = 'Invalid arguments'
-            logger.error(error_msg)
-            print(json.dumps({
-                "stage": "error",
-                "progress": 0,
-                "message": error_msg
-            }), flush=True)
-            parser.print_help()
-            sys.exit(1)
-            
     except Exception as e:
         error_msg = f"Fatal error: {str(e)}\n{traceback.format_exc()}"
         logger.error(error_msg)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+import contextvars
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+EventSink = Callable[[Dict[str, Any]], None]
+
+# Where progress events go in the current context; None means stdout. The
+# daemon installs a per-request sink that tags events with the request id.
+_sink: contextvars.ContextVar[Optional[EventSink]] = contextvars.ContextVar('event_sink', default=None)
+
+# Seconds between progress events, and between batches of match events
+DEFAULT_PROGRESS_INTERVAL = 0.2
+# Matches sent in one "matches" event at most, so no single line gets huge
+DEFAULT_MATCH_BATCH = 500
+# Always written, as given: they carry a run's results or its failure.
+# "complete" is not among them: within a scan it ends one file.
+FINAL_STAGES = {'error', 'summary', 'comparison', 'unmatched', 'timings'}
+
+def progress_settings() -> Tuple[bool, float]:
+    """(progress events enabled, seconds between them), from the environment.
+
+    RECEIPT_PROGRESS=0 turns progress events off; match events and final
+    stages are still written.
+    """
+    return (
+        os.getenv('RECEIPT_PROGRESS', '1') != '0',
+        float(os.getenv('RECEIPT_PROGRESS_INTERVAL') or DEFAULT_PROGRESS_INTERVAL)
+    )
+
+def encode_event(event: Dict[str, Any]) -> bytes:
+    """One event as a UTF-8 JSON line."""
+    return (json.dumps(event) + '\n').encode('utf-8')
+
+def _write_stdout(line: bytes) -> None:
+    try:
+        fd = sys.stdout.fileno()
+    except (AttributeError, OSError, ValueError):
+        # Not backed by a file (captured in tests, redirected to a buffer)
+        sys.stdout.write(line.decode('utf-8'))
+        sys.stdout.flush()
+        return
+    # Anything printed earlier goes first; then the whole line in one write,
+    # so lines from different threads never interleave
+    sys.stdout.flush()
+    view = memoryview(line)
+    while view:
+        view = view[os.write(fd, view):]
+
+def write_event(event: Dict[str, Any]) -> None:
+    """Send one progress event to the current sink, or to stdout as a JSON line."""
+    sink = _sink.get()
+    if sink is not None:
+        sink(event)
+        return
+    _write_stdout(encode_event(event))
+
+@contextmanager
+def events_to(sink: EventSink) -> Iterator[None]:
+    """Route progress events raised in this context (and tasks started from it) to sink."""
+    token = _sink.set(sink)
+    try:
+        yield
+    finally:
+        _sink.reset(token)
+
+class ProgressReporter:
+    """Overall progress of a run made of weighted phases, written at a limited rate.
+
+    Each phase counts items (files, receipts); the overall percentage is the
+    weight of the finished phases plus the finished share of the current
+    one, and never goes backwards. Progress events are written at most every
+    `interval` seconds. "match" events are collected and written as one
+    "matches" event per interval; they are flushed before any other event
+    so the order is kept.
+    """
+
+    def __init__(self, phases: Sequence[Tuple[str, float]] = (('work', 100.0),),
+                 interval: Optional[float] = None, enabled: Optional[bool] = None,
+                 match_batch: int = DEFAULT_MATCH_BATCH):
+        default_enabled, default_interval = progress_settings()
+        self.enabled = default_enabled if enabled is None else enabled
+        self.interval = default_interval if interval is None else interval
+        self.match_batch = match_batch
+        scale = 100.0 / sum(weight for _, weight in phases)
+        self._phases: Dict[str, Tuple[float, float]] = {}
+        start = 0.0
+        for name, weight in phases:
+            self._phases[name] = (start, weight * scale)
+            start += weight * scale
+        self._base, self._weight = 0.0, 0.0
+        self._total = 0
+        self._done = 0
+        self._percent = 0.0
+        self._next_progress = 0.0
+        self._next_matches = time.monotonic() + self.interval
+        self._matches: List[Dict[str, Any]] = []
+        self._token = None
+
+    def __enter__(self) -> 'ProgressReporter':
+        self._token = _reporter.set(self)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        try:
+            self.flush()
+        finally:
+            _reporter.reset(self._token)
+
+    def start(self, phase: str, total: int) -> None:
+        """Begin a phase of `total` items; earlier phases count as finished."""
+        self._base, self._weight = self._phases[phase]
+        self._total = total
+        self._done = 0
+
+    def advance(self, done: Optional[int] = None) -> None:
+        """Mark `done` items of the current phase finished (default: one more)."""
+        self._done = self._done + 1 if done is None else done
+
+    def percent(self, fraction: float = 0.0) -> float:
+        """Overall percentage, with `fraction` of the current item done."""
+        if self._total:
+            share = min(1.0, (self._done + min(max(fraction, 0.0), 1.0)) / self._total)
+        else:
+            share = 1.0 if self._done else 0.0
+        self._percent = max(self._percent, round(self._base + self._weight * share, 1))
+        return self._percent
+
+    def due(self) -> bool:
+        """Whether a progress event would be written now."""
+        return self.enabled and time.monotonic() >= self._next_progress
+
+    def progress(self, stage: str, message: str, data: Optional[Dict[str, Any]] = None,
+                 force: bool = False, fraction: float = 0.0) -> None:
+        """Write a progress event with the overall percentage, unless one went out too recently.
+
+        Events with data are always written; force skips the rate limit.
+        """
+        if data is None and not (self.enabled and (force or time.monotonic() >= self._next_progress)):
+            return
+        event = {"stage": stage, "progress": self.percent(fraction), "message": message}
+        if data is not None:
+            event["data"] = data
+        self._next_progress = time.monotonic() + self.interval
+        self._write(event)
+
+    def match(self, data: Dict[str, Any]) -> None:
+        """Queue a match for the next "matches" event."""
+        self._matches.append(data)
+        if len(self._matches) >= self.match_batch or time.monotonic() >= self._next_matches:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the queued matches now."""
+        if not self._matches:
+            return
+        matches, self._matches = self._matches, []
+        self._next_matches = time.monotonic() + self.interval
+        write_event({"stage": "matches", "progress": self.percent(), "message": f"{len(matches)} matches",
+                     "data": {"matches": matches}})
+
+    def relay(self, event: Dict[str, Any]) -> None:
+        """Pass on an event raised while this reporter is active.
+
+        Final stages are written as they are. Other stages report progress
+        within the current item (0-100), which becomes the overall
+        percentage; without data they are rate limited like progress().
+        """
+        stage = event.get('stage')
+        if stage == 'match':
+            self.match(event.get('data'))
+        elif stage in FINAL_STAGES:
+            self._write(event)
+        else:
+            self.progress(stage, event.get('message', ''), event.get('data'),
+                          fraction=(event.get('progress') or 0) / 100)
+
+    def _write(self, event: Dict[str, Any]) -> None:
+        self.flush()
+        write_event(event)
+
+_reporter: contextvars.ContextVar[Optional[ProgressReporter]] = contextvars.ContextVar('progress_reporter',
+                                                                                        default=None)
+
+def current_reporter() -> Optional[ProgressReporter]:
+    """The reporter of the run in progress in this context, if any."""
+    return _reporter.get()
+
+@contextmanager
+def reporting(phases: Sequence[Tuple[str, float]]) -> Iterator[ProgressReporter]:
+    """The active reporter, or a new one with these phases for the duration of the block."""
+    reporter = _reporter.get()
+    if reporter is not None:
+        yield reporter
+        return
+    with ProgressReporter(phases) as reporter:
+        yield reporter
+
+def emit_event(event: Dict[str, Any]) -> None:
+    """Send an event through the active reporter, or straight out when there is none."""
+    reporter = _reporter.get()
+    if reporter is not None:
+        reporter.relay(event)
+    else:
+        write_event(event)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = Path.home() / '.cache' / 'solvify-crm' / 'receipt_cache.sqlite3'
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def text_digest(text: str) -> str:
+    """SHA-256 of extracted text."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class ReceiptCache:
+    """Content-addressed on-disk cache for receipt processing results.
+
+    Entries live in separate namespaces ('text' for OCR/PDF output keyed by
+    file hash, 'parsed' for GPT fields keyed by text hash), each tagged with
+    the pipeline version that produced it. Entries from other versions are
+    stale and dropped on open. Run settings that change a result (DPI, OCR
+    backend, compaction) are part of the key instead, so runs with different
+    settings keep their own entries side by side; the total size is kept
+    under max_bytes by evicting the least recently used entries. Safe to
+    share between threads.
+    """
+
+    def __init__(self, path: Optional[str] = None, versions: Optional[Dict[str, str]] = None,
+                 max_bytes: int = DEFAULT_MAX_BYTES, settings: Optional[Dict[str, str]] = None):
+        self.path = Path(path or os.getenv('RECEIPT_CACHE_PATH') or DEFAULT_CACHE_PATH)
+        self.versions = versions or {}
+        self.settings = settings or {}
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                version TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (kind, key)
+            )
+        ''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)')
+        self._db.commit()
+        self.prune_stale()
+
+    def get(self, kind: str, key: str) -> Optional[Any]:
+        """Return a cached value, or None on a miss or a stale version."""
+        with self._lock:
+            return self._get(kind, key)
+
+    def _key(self, kind: str, key: str) -> str:
+        settings = self.settings.get(kind)
+        return f"{settings}/{key}" if settings else key
+
+    def _get(self, kind: str, key: str) -> Optional[Any]:
+        key = self._key(kind, key)
+        row = self._db.execute(
+            'SELECT value FROM entries WHERE kind = ? AND key = ? AND version = ?',
+            (kind, key, self.versions.get(kind, ''))
+        ).fetchone()
+        if row is None:
+            return None
+        self._db.execute(
+            'UPDATE entries SET last_used = ? WHERE kind = ? AND key = ?',
+            (time.time(), kind, key)
+        )
+        self._db.commit()
+        return json.loads(row[0])
+
+    def put(self, kind: str, key: str, value: Any) -> None:
+        """Store a value and evict least recently used entries over the size limit."""
+        with self._lock:
+            self._put(kind, key, value)
+
+    def _put(self, kind: str, key: str, value: Any) -> None:
+        key = self._key(kind, key)
+        encoded = json.dumps(value, ensure_ascii=False)
+        size = len(encoded.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        self._db.execute(
+            'INSERT OR REPLACE INTO entries (kind, key, version, value, size, last_used) VALUES (?, ?, ?, ?, ?, ?)',
+            (kind, key, self.versions.get(kind, ''), encoded, size, time.time())
+        )
+        self._evict()
+        self._db.commit()
+
+    def _evict(self) -> None:
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for kind, key, size in self._db.execute(
+            'SELECT kind, key, size FROM entries ORDER BY last_used ASC'
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute('DELETE FROM entries WHERE kind = ? AND key = ?', (kind, key))
+            total -= size
+            evicted += 1
+        logger.info(f"Receipt cache evicted {evicted} entries")
+
+    def prune_stale(self) -> int:
+        """Delete entries written by another pipeline version; returns the count.
+
+        Entries for other run settings are kept; only LRU eviction removes them.
+        """
+        removed = 0
+        for kind, version in self.versions.items():
+            removed += self._db.execute(
+                'DELETE FROM entries WHERE kind = ? AND version != ?', (kind, version)
+            ).rowcount
+        self._db.commit()
+        if removed:
+            logger.info(f"Receipt cache pruned {removed} stale entries")
+        return removed
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        with self._lock:
+            self._db.execute('DELETE FROM entries')
+            self._db.commit()
+
+    def close(self) -> None:
+        self._db.close()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""Long-running receipt worker speaking JSON lines.
+
+Each request is one JSON object per line:
+
+    {"id": "42", "op": "parse", "file_path": "/tmp/receipt.pdf"}
+    {"id": "43", "op": "scan", "directory": "/tmp/receipts"}
+    {"id": "44", "op": "match_receipts", "directory": "/tmp/receipts", "transactions": [...]}
+    {"id": "45", "op": "match_receipts", "directory": "/tmp/receipts", "transactions_path": "/tmp/tx.jsonl"}
+    {"id": "46", "op": "match", "receipts": [...], "transactions": [...], "mode": "optimal"}
+
+The usual stage/progress/message events stream back tagged with
+"request_id", followed by one "result" event carrying the output the CLI
+would have printed (or an "error" event). parse, scan and match_receipts
+send a "timings" event with their stage timings just before it.
+match_receipts streams its candidates in batched "matches" events, as
+--match does, and its result is the summary. Requests run concurrently; the
+imported OCR stack, the OpenAI client and the receipt cache stay warm
+between them.
+"""
+
+import argparse
+import io
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import socketserver
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional, TextIO
+
+# The scripts mirror their log to stdout, which carries the protocol here;
+# point that handler at stderr while they are imported
+_stdout, sys.stdout = sys.stdout, sys.stderr
+try:
+    import parse_receipt
+    import match_transactions
+finally:
+    sys.stdout = _stdout
+from bank_statements import iter_transaction_source
+from progress_events import ProgressReporter, events_to
+from stage_timings import collecting
+
+logger = logging.getLogger(__name__)
+
+# Modules the OCR pool workers start with, so a scan never pays their import
+OCR_PRELOAD = ['parse_receipt', 'cv2', 'numpy', 'pytesseract', 'PyPDF2', 'pdf2image', 'PIL.Image']
+
+class EventWriter:
+    """Writes JSON lines to one client stream; shared by that client's requests."""
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def write(self, event: Dict[str, Any]) -> None:
+        line = json.dumps(event, ensure_ascii=False) + '\n'
+        with self._lock:
+            try:
+                self.stream.write(line)
+                self.stream.flush()
+            except (OSError, ValueError):
+                # The client went away; the request still finishes and is cached
+                pass
+
+class ReceiptDaemon:
+    """Runs requests on a thread pool with shared caches and settings."""
+
+    def __init__(self, max_concurrent: int = 4, workers: int = 1, cache_path: Optional[str] = None,
+                 use_cache: bool = True, gpt_concurrency: int = 1, gpt_timeout: float = 60.0,
+                 gpt_retries: int = 5):
+        self.workers = workers
+        self.gpt_concurrency = gpt_concurrency
+        self.gpt_timeout = gpt_timeout
+        self.gpt_retries = gpt_retries
+        self.cache = None
+        if use_cache:
+            try:
+                self.cache = parse_receipt.ReceiptCache(cache_path, versions=parse_receipt.cache_versions(),
+                                                        settings=parse_receipt.cache_settings())
+            except Exception as e:
+                logger.warning(f"Receipt cache unavailable, continuing without it: {str(e)}")
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='request')
+        self._ids = itertools.count(1)
+        self.handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+            'ping': lambda request: {'pong': True},
+            'parse': self._timed(self._parse),
+            'scan': self._timed(self._scan),
+            'match_receipts': self._timed(self._match_receipts),
+            'match': self._match
+        }
+
+    def warm_up(self) -> None:
+        """Import the OCR stack, load the OCR backend and create the OpenAI client before the first request."""
+        for module in OCR_PRELOAD[1:]:
+            try:
+                __import__(module)
+            except ImportError as e:
+                logger.warning(f"Could not preload {module}: {str(e)}")
+        parse_receipt._image_module()
+        parse_receipt.get_backend()
+        parse_receipt.get_client()
+
+    def submit(self, line: str, writer: EventWriter):
+        """Parse one request line and schedule it; returns the future, or None for a bad line."""
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("Request must be a JSON object")
+        except ValueError as e:
+            writer.write({"request_id": None, "stage": "error", "progress": 0,
+                          "message": f"Invalid request: {str(e)}"})
+            return None
+        request_id = request.get('id') or str(next(self._ids))
+        return self.executor.submit(self._run, request_id, request, writer)
+
+    def _run(self, request_id: str, request: Dict[str, Any], writer: EventWriter) -> None:
+        def sink(event: Dict[str, Any]) -> None:
+            writer.write({"request_id": request_id, **event})
+
+        with events_to(sink):
+            try:
+                handler = self.handlers.get(request.get('op'))
+                if handler is None:
+                    raise ValueError(f"Unknown op: {request.get('op')!r}")
+                result = handler(request)
+                sink({"stage": "result", "progress": 100, "message": "Request complete", "data": result})
+            except BaseException as e:
+                # SystemExit included: the CLI code paths exit on fatal errors
+                logger.error(f"Request {request_id} failed: {str(e)}\n{traceback.format_exc()}")
+                sink({"stage": "error", "progress": 0, "message": f"Error: {str(e)}"})
+
+    def _timed(self, handler: Callable[[Dict[str, Any]], Any]) -> Callable[[Dict[str, Any]], Any]:
+        """Wrap a handler so the request's stage timings go out as a "timings" event before its result."""
+        def run(request: Dict[str, Any]) -> Any:
+            start = time.perf_counter()
+            with collecting() as timings:
+                result = handler(request)
+            parse_receipt.send_timings(timings, start)
+            return result
+        return run
+
+    def _process_directory(self, request: Dict[str, Any], directory: str):
+        return parse_receipt.process_directory(
+            directory,
+            request.get('workers', self.workers),
+            self.cache,
+            request.get('gpt_concurrency', self.gpt_concurrency),
+            self.gpt_timeout,
+            self.gpt_retries
+        )
+
+    def _parse(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        file_path = request['file_path']
+        if not os.path.isfile(file_path):
+            raise FileNotFoundError(f"File not found: {file_path}")
+        extracted_text = parse_receipt.extract_text_cached(file_path, self.cache)
+        if not extracted_text:
+            raise ValueError("Failed to extract text from file")
+        return parse_receipt.parse_receipt_cached(extracted_text, self.cache)
+
+    def _scan(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        return parse_receipt.scan_result(self._process_directory(request, request['directory']))
+
+    def _match_receipts(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        with ProgressReporter(parse_receipt.MATCH_PHASES):
+            receipts = self._process_directory(request, request['directory'])
+            if 'transactions_path' in request:
+                transactions = iter_transaction_source(request['transactions_path'])
+            else:
+                transactions = request['transactions']
+            return parse_receipt.stream_receipt_matches(receipts, transactions,
+                                                        request.get('top_k', parse_receipt.DEFAULT_MATCH_TOP_K))
+
+    def _match(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        if 'data_path' in request:
+            with open(request['data_path'], 'r') as f:
+                data = json.load(f)
+        else:
+            data = request
+        receipts = data['receipts']
+        if request.get('statements'):
+            transactions = match_transactions.iter_statement_transactions(request['statements'])
+        else:
+            transactions = data['transactions']
+        return match_transactions.reconcile(receipts, transactions, request.get('mode', 'greedy'),
+                                            request.get('state_path'), data.get('confirmed_matches'))
+
+    def serve_stream(self, lines, writer: EventWriter) -> None:
+        """Handle requests from one client until it closes its input or asks to shut down."""
+        pending = set()
+        for line in lines:
+            if not line.strip():
+                continue
+            if _is_shutdown(line):
+                break
+            future = self.submit(line, writer)
+            if future is not None:
+                pending.add(future)
+                pending = {f for f in pending if not f.done()}
+        wait(pending)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        if self.cache:
+            self.cache.close()
+
+def _is_shutdown(line: str) -> bool:
+    try:
+        request = json.loads(line)
+    except ValueError:
+        return False
+    return isinstance(request, dict) and request.get('op') == 'shutdown'
+
+class _UnixRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        writer = EventWriter(io.TextIOWrapper(self.wfile, encoding='utf-8', write_through=True))
+        self.server.daemon.serve_stream(io.TextIOWrapper(self.rfile, encoding='utf-8'), writer)
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def serve_socket(daemon: ReceiptDaemon, path: str) -> None:
+    """Accept clients on a Unix socket; each connection is its own JSON-lines stream."""
+    if os.path.exists(path):
+        os.unlink(path)
+    with _UnixServer(path, _UnixRequestHandler) as server:
+        server.daemon = daemon
+        logger.info(f"Receipt daemon listening on {path}")
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve receipt parsing and matching requests as JSON lines')
+    parser.add_argument('--socket', help='Listen on this Unix socket instead of stdin/stdout')
+    parser.add_argument('--max-concurrent', type=int, default=4, help='Requests processed at the same time')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='OCR worker processes per scan request (0 = one per CPU core)')
+    parser.add_argument('--gpt-concurrency', type=int, default=1,
+                        help='Concurrent GPT extraction requests per scan (1 = one at a time)')
+    parser.add_argument('--gpt-timeout', type=float, default=60.0, help='Per-request GPT timeout in seconds')
+    parser.add_argument('--gpt-retries', type=int, default=5,
+                        help='Retries with backoff on rate limits, timeouts and server errors')
+    parser.add_argument('--gpt-batch-tokens', type=int,
+                        help='Pack receipts needing GPT into one request up to this many text tokens (default 0: off)')
+    parser.add_argument('--gpt-text-tokens', type=int, help='Most receipt text tokens sent to GPT (0 = no cap)')
+    parser.add_argument('--no-compact', action='store_true', help='Send GPT the OCR text as extracted')
+    parser.add_argument('--gpt-reasks', type=int,
+                        help='Follow-up requests per receipt for fields GPT left out or got wrong (default 0: off)')
+    parser.add_argument('--pdf-dpi', type=int, help='DPI for rasterizing PDF pages without a text layer')
+    parser.add_argument('--pdf-max-pages', type=int, help='Most PDF pages to OCR per file')
+    parser.add_argument('--preprocess', choices=parse_receipt.PREPROCESS_MODES, help='Image preprocessing mode')
+    parser.add_argument('--ocr-backend', choices=parse_receipt.OCR_BACKENDS,
+                        help='OCR engine (default auto: in-process tesserocr when installed, else pytesseract)')
+    parser.add_argument('--gpt-only', action='store_true', help='Always use GPT, never the local field extractor')
+    parser.add_argument('--no-dedup', action='store_true', help='Process near-duplicate files in a scan separately')
+    parser.add_argument('--cache-path', help='Receipt cache database (default: $RECEIPT_CACHE_PATH or ~/.cache/solvify-crm)')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the OCR/GPT result cache')
+    args = parser.parse_args()
+    # Set before the fork server starts so pool workers inherit them
+    if args.pdf_dpi:
+        os.environ['RECEIPT_PDF_DPI'] = str(args.pdf_dpi)
+    if args.pdf_max_pages is not None:
+        os.environ['RECEIPT_PDF_MAX_OCR_PAGES'] = str(args.pdf_max_pages)
+    if args.preprocess:
+        os.environ['RECEIPT_PREPROCESS'] = args.preprocess
+    if args.ocr_backend:
+        os.environ['RECEIPT_OCR_BACKEND'] = args.ocr_backend
+    if args.gpt_only:
+        os.environ['RECEIPT_LOCAL_FIELDS'] = '0'
+    if args.no_dedup:
+        os.environ['RECEIPT_DEDUP'] = '0'
+    if args.gpt_batch_tokens is not None:
+        os.environ['RECEIPT_GPT_BATCH_TOKENS'] = str(args.gpt_batch_tokens)
+    if args.gpt_text_tokens is not None:
+        os.environ['RECEIPT_GPT_TEXT_TOKENS'] = str(args.gpt_text_tokens)
+    if args.no_compact:
+        os.environ['RECEIPT_COMPACT'] = '0'
+    if args.gpt_reasks is not None:
+        os.environ['RECEIPT_GPT_REASKS'] = str(args.gpt_reasks)
+
+    # Forking from a threaded server is unsafe; pool workers come from a
+    # fork server that already has the OCR stack imported
+    multiprocessing.set_start_method('forkserver')
+    multiprocessing.set_forkserver_preload(OCR_PRELOAD)
+
+    daemon = ReceiptDaemon(
+        max_concurrent=args.max_concurrent,
+        workers=args.workers or os.cpu_count() or 1,
+        cache_path=args.cache_path,
+        use_cache=not args.no_cache,
+        gpt_concurrency=args.gpt_concurrency,
+        gpt_timeout=args.gpt_timeout,
+        gpt_retries=args.gpt_retries
+    )
+    daemon.warm_up()
+    stdout_writer = EventWriter(sys.stdout)
+    stdout_writer.write({"request_id": None, "stage": "ready", "progress": 100,
+                         "message": f"Receipt daemon ready (pid {os.getpid()})"})
+    try:
+        if args.socket:
+            serve_socket(daemon, args.socket)
+        else:
+            daemon.serve_stream(sys.stdin, stdout_writer)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.close()
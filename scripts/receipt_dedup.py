@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import re
+import unicodedata
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from receipt_fields import extract_fields
+
+# Perceptual hash: a difference hash over a HASH_SIZE x HASH_SIZE grid (256 bits)
+HASH_SIZE = 16
+HASH_BITS = HASH_SIZE * HASH_SIZE
+# Bits in which two copies of one picture may differ (resized, recompressed)
+DEFAULT_MAX_HASH_DISTANCE = 12
+# Hashes within DEFAULT_MAX_HASH_DISTANCE bits always agree on one of the
+# bands, so the index only compares hashes that share a band
+HASH_BANDS = 16
+# The hash cannot tell one shop's receipts apart (same layout, other
+# amounts), so candidates are compared at COMPARE_WIDTH pixels: copies of
+# one picture differ little in every COMPARE_TILE square, a changed digit
+# a lot in one
+COMPARE_WIDTH = 384
+COMPARE_TILE = 8
+MAX_TILE_DIFFERENCE = 0.6
+# Nearest candidates compared per image; a copy missed among many similar
+# receipts is still caught by its text
+MAX_IMAGE_CANDIDATES = 4
+
+# MinHash of word shingles, banded for the text index: texts of similarity
+# s share a band with probability 1 - (1 - s^rows)^bands
+SHINGLE_WORDS = 2
+SIGNATURE_BANDS = 32
+SIGNATURE_ROWS = 4
+DEFAULT_MIN_TEXT_SIMILARITY = 0.5
+# Found in both texts, these must agree for them to be one receipt
+KEY_FIELDS = ('total_amount', 'date', 'invoice_number')
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, 1 << 32), _rng.randrange(0, 1 << 32))
+                 for _ in range(SIGNATURE_BANDS * SIGNATURE_ROWS)]
+
+def dedup_enabled() -> bool:
+    """Whether scans skip near-duplicate receipts; --no-dedup / RECEIPT_DEDUP=0 turns it off."""
+    return os.getenv('RECEIPT_DEDUP', '1') != '0'
+
+def image_hash(image) -> int:
+    """Difference hash of a PIL image: whether each cell of a small grayscale
+    copy is brighter than its right-hand neighbour."""
+    import numpy as np
+    from PIL import Image
+    pixels = np.asarray(image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS))
+    # Row by row, the first cell in the highest bit
+    brighter = (pixels[:, :-1] > pixels[:, 1:]).ravel()
+    return int.from_bytes(np.packbits(brighter).tobytes(), 'big') >> (-len(brighter) % 8)
+
+def hash_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+def comparable(image):
+    """A PIL image as same_picture() compares it: COMPARE_WIDTH wide, brightness and contrast normalized."""
+    import numpy as np
+    from PIL import Image
+    height = max(COMPARE_TILE, round(COMPARE_WIDTH * image.height / image.width))
+    pixels = np.asarray(image.convert('L').resize((COMPARE_WIDTH, height), Image.LANCZOS), dtype=np.float32)
+    return (pixels - pixels.mean()) / (pixels.std() + 1e-6)
+
+def same_picture(a, b) -> bool:
+    """Whether two comparable() images are copies of one picture, tile by tile; different shapes never are."""
+    if abs(a.shape[0] - b.shape[0]) > 0.02 * a.shape[0]:
+        return False
+    rows = min(a.shape[0], b.shape[0]) // COMPARE_TILE * COMPARE_TILE
+    difference = abs(a[:rows] - b[:rows]).reshape(rows // COMPARE_TILE, COMPARE_TILE,
+                                                  COMPARE_WIDTH // COMPARE_TILE, COMPARE_TILE)
+    return float(difference.mean(axis=(1, 3)).max()) <= MAX_TILE_DIFFERENCE
+
+def shingles(text: str) -> Set[str]:
+    """Runs of SHINGLE_WORDS words of the folded text; OCR spacing and punctuation do not count."""
+    folded = unicodedata.normalize('NFKD', text.lower())
+    words = re.findall(r'[a-z0-9]+', ''.join(ch for ch in folded if not unicodedata.combining(ch)))
+    if len(words) < SHINGLE_WORDS:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+def minhash(text_shingles: Set[str]) -> Tuple[int, ...]:
+    """MinHash signature: equal positions estimate the Jaccard similarity of two shingle sets."""
+    hashes = [zlib.crc32(shingle.encode('utf-8')) for shingle in text_shingles]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+def signature_similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+class ImageDuplicateIndex:
+    """Perceptual hashes of receipt images, bucketed by band.
+
+    Each hash is compared only with the hashes sharing one of its bands; the
+    closest within max_distance bits that `confirm` accepts, of the
+    MAX_IMAGE_CANDIDATES closest, is its duplicate.
+    """
+
+    def __init__(self, max_distance: int = DEFAULT_MAX_HASH_DISTANCE):
+        self.max_distance = max_distance
+        self._hashes: Dict[str, int] = {}
+        self._buckets: Dict[Tuple[int, int], List[str]] = {}
+
+    def add(self, key: str, value: int,
+            confirm: Optional[Callable[[str, str], bool]] = None) -> Optional[Tuple[str, float]]:
+        """Index a hash; returns (key, similarity) of the nearest earlier duplicate, if any."""
+        band_bits = HASH_BITS // HASH_BANDS
+        bands = [(band, (value >> (band * band_bits)) & ((1 << band_bits) - 1)) for band in range(HASH_BANDS)]
+        candidates = {other for band in bands for other in self._buckets.get(band, ())}
+        self._hashes[key] = value
+        for band in bands:
+            self._buckets.setdefault(band, []).append(key)
+        nearest = sorted((hash_distance(value, self._hashes[other]), other) for other in candidates)
+        for distance, other in nearest[:MAX_IMAGE_CANDIDATES]:
+            if distance > self.max_distance:
+                break
+            if confirm is None or confirm(key, other):
+                return other, round(1 - distance / HASH_BITS, 4)
+        return None
+
+class TextDuplicateIndex:
+    """MinHash signatures of extracted receipt texts, bucketed by LSH band.
+
+    Candidates share a band; a candidate is a duplicate when the signatures
+    estimate at least min_similarity and the total, date and invoice number
+    found in both texts agree, so the same shop's receipts from different
+    days stay apart.
+    """
+
+    def __init__(self, min_similarity: float = DEFAULT_MIN_TEXT_SIMILARITY):
+        self.min_similarity = min_similarity
+        self._texts: Dict[str, str] = {}
+        self._signatures: Dict[str, Tuple[int, ...]] = {}
+        self._fields: Dict[str, Dict[str, Any]] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[str]] = {}
+
+    def add(self, key: str, text: str) -> Optional[Tuple[str, float]]:
+        """Index a text; returns (key, similarity) of the most similar earlier duplicate, if any."""
+        if not text:
+            return None
+        text_shingles = shingles(text)
+        if not text_shingles:
+            return None
+        signature = minhash(text_shingles)
+        bands = [(band, signature[band * SIGNATURE_ROWS:(band + 1) * SIGNATURE_ROWS])
+                 for band in range(SIGNATURE_BANDS)]
+        candidates = {other for band in bands for other in self._buckets.get(band, ())}
+        self._texts[key] = text
+        best = None
+        for other in candidates:
+            similarity = signature_similarity(signature, self._signatures[other])
+            if similarity >= self.min_similarity and (best is None or similarity > best[1]) \
+                    and self._same_key_fields(key, other):
+                best = (other, similarity)
+        self._signatures[key] = signature
+        for band in bands:
+            self._buckets.setdefault(band, []).append(key)
+        if best is None:
+            return None
+        return best[0], round(best[1], 4)
+
+    def _key_fields(self, key: str) -> Dict[str, Any]:
+        if key not in self._fields:
+            fields = extract_fields(self._texts[key])
+            self._fields[key] = {field: fields[field][0] for field in KEY_FIELDS if fields[field][0] is not None}
+        return self._fields[key]
+
+    def _same_key_fields(self, key: str, other: str) -> bool:
+        fields, other_fields = self._key_fields(key), self._key_fields(other)
+        return all(other_fields[field] == value for field, value in fields.items() if field in other_fields)
+
+class ReceiptDeduplicator:
+    """Near-duplicate receipts of one scan, each linked to the first copy seen.
+
+    Image files are compared by perceptual hash before OCR, and extracted
+    texts by MinHash before GPT; only representatives are processed.
+    """
+
+    def __init__(self, max_hash_distance: int = DEFAULT_MAX_HASH_DISTANCE,
+                 min_text_similarity: float = DEFAULT_MIN_TEXT_SIMILARITY):
+        self.images = ImageDuplicateIndex(max_hash_distance)
+        self.texts = TextDuplicateIndex(min_text_similarity)
+        self._representative: Dict[str, str] = {}
+        self._duplicates: Dict[str, List[Dict[str, Any]]] = {}
+
+    def add_image(self, key: str, value: int,
+                  confirm: Optional[Callable[[str, str], bool]] = None) -> Optional[str]:
+        """Index an image hash; returns its representative when the image is a duplicate.
+
+        confirm(key, other) compares the candidates themselves, e.g. with same_picture().
+        """
+        return self._link(key, self.images.add(key, value, confirm), 'image')
+
+    def add_text(self, key: str, text: str) -> Optional[str]:
+        """Index extracted text; returns its representative when the text is a duplicate."""
+        return self._link(key, self.texts.add(key, text), 'text')
+
+    def is_duplicate(self, key: str) -> bool:
+        return key in self._representative
+
+    def duplicates_of(self, key: str) -> List[Dict[str, Any]]:
+        """The copies linked to a representative: filename, how they matched and how closely."""
+        return self._duplicates.get(key, [])
+
+    def _link(self, key: str, found: Optional[Tuple[str, float]], method: str) -> Optional[str]:
+        if found is None:
+            return None
+        other, similarity = found
+        representative = self._representative.get(other, other)
+        self._representative[key] = representative
+        self._duplicates.setdefault(representative, []).append({
+            'filename': os.path.basename(key),
+            'match': method,
+            'similarity': similarity
+        })
+        return representative
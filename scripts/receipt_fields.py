@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+REQUIRED_FIELDS = ['supplier_name', 'invoice_number', 'date', 'total_amount', 'currency', 'vat_amount']
+
+# Fields below this confidence send the receipt to GPT
+DEFAULT_MIN_CONFIDENCE = 0.8
+
+_AMOUNT = re.compile(r'(?<![\d.,])-?\d{1,3}(?:[ \u00a0.]\d{3})*[.,]\d{2}(?![\d.,])|(?<![\d.,])-?\d+[.,]\d{2}(?![\d.,])')
+_TOTAL_LINE = re.compile(r'\b(att betala|totalt|total|summa|grand total|amount due|to pay|kortk[öo]p)\b', re.IGNORECASE)
+_VAT_LINE = re.compile(r'\b(moms|vat|mervärdesskatt|mva)\b', re.IGNORECASE)
+_VAT_TOTAL_LINE = re.compile(r'\b(summa moms|moms totalt|total moms|totalt moms|total vat|vat total)\b', re.IGNORECASE)
+_PERCENT = re.compile(r'\d+(?:[.,]\d+)?\s*%')
+_DATE_LINE = re.compile(r'\b(datum|date|fakturadatum|köpdatum|kvittodatum|invoice date)\b', re.IGNORECASE)
+_DATES = [
+    (re.compile(r'\b(\d{4})-(\d{2})-(\d{2})\b'), ('y', 'm', 'd')),
+    (re.compile(r'\b(\d{4})/(\d{2})/(\d{2})\b'), ('y', 'm', 'd')),
+    (re.compile(r'\b(\d{2})[./](\d{2})[./](\d{4})\b'), ('d', 'm', 'y')),
+    (re.compile(r'\b(\d{4})(\d{2})(\d{2})\b'), ('y', 'm', 'd'))
+]
+_INVOICE_NUMBER = re.compile(
+    r'\b(?:kvitto\s*(?:nr|nummer)?|kvittonr|fakturan(?:r|ummer)|faktura\s*nr|invoice\s*(?:no|number|#)|'
+    r'receipt\s*(?:no|number|#)|ordern(?:r|ummer)|order\s*(?:no|number|#)|verifikation(?:snr)?)'
+    r'[\s.:#-]*([A-Z0-9][A-Z0-9/-]{2,})',
+    re.IGNORECASE
+)
+_ORG_NUMBER = re.compile(r'\b(?:org\.?\s*n(?:r|ummer)|organisationsnummer)\b[\s.:]*\d{6}-\d{4}', re.IGNORECASE)
+_CURRENCY_CODE = re.compile(r'\b(SEK|EUR|USD|GBP|NOK|DKK)\b')
+_CURRENCY_SYMBOLS = [('€', 'EUR'), ('£', 'GBP'), ('$', 'USD')]
+_SWEDISH_WORDS = re.compile(r'\b(moms|totalt|kvitto|att betala|kr)\b', re.IGNORECASE)
+# Header lines that are not the supplier name
+_NOT_SUPPLIER = re.compile(r'\b(kvitto|receipt|faktura|invoice|välkommen|welcome|tel|telefon|www\.|org)\b', re.IGNORECASE)
+
+def parse_amount(value: str) -> float:
+    """Parse '1 234,50', '1.234,50' or '1234.50' into a float."""
+    cleaned = re.sub(r'[\s\u00a0]', '', value)
+    if re.search(r'[.,]\d{2}$', cleaned):
+        cleaned = re.sub(r'[.,]', '', cleaned[:-3]) + '.' + cleaned[-2:]
+    return float(cleaned)
+
+def _line_amounts(line: str) -> List[float]:
+    # Percentages ("Moms 25%") are rates, not amounts
+    line = _PERCENT.sub(' ', line)
+    return [parse_amount(match) for match in _AMOUNT.findall(line)]
+
+def _total(lines: List[str]) -> Tuple[Optional[float], float]:
+    labelled = [amounts[-1] for line in lines if _TOTAL_LINE.search(line) and not _VAT_LINE.search(line)
+                for amounts in (_line_amounts(line),) if amounts and amounts[-1] > 0]
+    if labelled:
+        # The final/grand total is the largest labelled one
+        return max(labelled), 0.9
+    amounts = [amount for line in lines for amount in _line_amounts(line) if amount > 0]
+    if amounts:
+        return max(amounts), 0.5
+    return None, 0.0
+
+def _vat(lines: List[str], total: Optional[float]) -> Tuple[Optional[float], float]:
+    summed = [amounts[-1] for line in lines if _VAT_TOTAL_LINE.search(line)
+              for amounts in (_line_amounts(line),) if amounts]
+    if summed:
+        vat, confidence = summed[-1], 0.9
+    else:
+        # One line per VAT rate; identical lines are usually repeated summaries
+        per_rate = {line.strip(): amounts[-1] for line in lines if _VAT_LINE.search(line)
+                    for amounts in (_line_amounts(line),) if amounts}
+        if not per_rate:
+            return None, 0.0
+        vat, confidence = round(sum(per_rate.values()), 2), 0.85 if len(per_rate) == 1 else 0.7
+    if vat < 0 or (total is not None and vat >= total):
+        return vat, 0.2
+    return vat, confidence
+
+def _date(lines: List[str]) -> Tuple[Optional[str], float]:
+    labelled, found = [], []
+    for line in lines:
+        for pattern, order in _DATES:
+            for match in pattern.finditer(line):
+                parts = dict(zip(order, match.groups()))
+                try:
+                    value = datetime(int(parts['y']), int(parts['m']), int(parts['d'])).strftime('%Y-%m-%d')
+                except ValueError:
+                    continue
+                if not 2000 <= int(parts['y']) <= 2100:
+                    continue
+                found.append(value)
+                if _DATE_LINE.search(line):
+                    labelled.append(value)
+    if labelled:
+        return labelled[0], 0.9
+    distinct = list(dict.fromkeys(found))
+    if len(distinct) == 1:
+        return distinct[0], 0.85
+    if distinct:
+        return distinct[0], 0.5
+    return None, 0.0
+
+def _invoice_number(text: str) -> Tuple[Optional[str], float]:
+    match = _INVOICE_NUMBER.search(text)
+    if match and any(ch.isdigit() for ch in match.group(1)):
+        return match.group(1), 0.85
+    return None, 0.0
+
+def _currency(text: str) -> Tuple[Optional[str], float]:
+    codes = _CURRENCY_CODE.findall(text.upper())
+    if codes:
+        return max(set(codes), key=codes.count), 0.9
+    for symbol, code in _CURRENCY_SYMBOLS:
+        if symbol in text:
+            return code, 0.85
+    if _SWEDISH_WORDS.search(text):
+        return 'SEK', 0.8
+    return None, 0.0
+
+def _supplier_name(lines: List[str], text: str) -> Tuple[Optional[str], float]:
+    # The first header line with a few letters in it, before any amounts
+    for line in lines[:8]:
+        candidate = line.strip()
+        letters = sum(ch.isalpha() for ch in candidate)
+        if letters < 3 or _AMOUNT.search(candidate) or _NOT_SUPPLIER.search(candidate):
+            continue
+        if any(pattern.search(candidate) for pattern, _ in _DATES):
+            continue
+        # A header followed by an organisation number is the legal seller
+        return candidate, 0.85 if _ORG_NUMBER.search(text) else 0.6
+    return None, 0.0
+
+def labels_field(line: str) -> bool:
+    """Whether a line labels a field: a total, VAT, date, invoice or organisation number, or currency."""
+    return bool(_TOTAL_LINE.search(line) or _VAT_LINE.search(line) or _DATE_LINE.search(line)
+                or _INVOICE_NUMBER.search(line) or _ORG_NUMBER.search(line) or _CURRENCY_CODE.search(line.upper()))
+
+def holds_value(line: str) -> bool:
+    """Whether a line holds an amount or a date."""
+    return bool(_line_amounts(line)) or any(pattern.search(line) for pattern, _ in _DATES)
+
+def extract_fields(text: str) -> Dict[str, Tuple[Any, float]]:
+    """Rule-based guesses for the required receipt fields: {field: (value, confidence)}."""
+    lines = [line for line in text.splitlines() if line.strip()]
+    total = _total(lines)
+    return {
+        'supplier_name': _supplier_name(lines, text),
+        'invoice_number': _invoice_number(text),
+        'date': _date(lines),
+        'total_amount': total,
+        'currency': _currency(text),
+        'vat_amount': _vat(lines, total[0])
+    }
+
+def parse_locally(text: str, min_confidence: float = DEFAULT_MIN_CONFIDENCE) -> Optional[Dict[str, Any]]:
+    """Receipt fields in the GPT result shape, or None when any required field
+    is missing or below min_confidence."""
+    if not text or not text.strip():
+        return None
+    fields = extract_fields(text)
+    if any(value is None or confidence < min_confidence for value, confidence in fields.values()):
+        return None
+    parsed = {field: value for field, (value, _) in fields.items()}
+    field_confidence = {field: confidence for field, (_, confidence) in fields.items()}
+    parsed['confidence_score'] = round(min(field_confidence.values()), 2)
+    parsed['field_confidence'] = field_confidence
+    parsed['line_items'] = []
+    parsed['extraction'] = 'local'
+    return parsed
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import sys
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from bank_statements import iter_statements
+
+_REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DEFAULT_STATEMENTS = [os.path.join(_REPO_ROOT, 'Svea.csv')] + sorted(
+    glob.glob(os.path.join(_REPO_ROOT, 'account-statement_*.csv'))
+)
+
+# Used when no bank exports are available: (reference, amount, currency)
+FALLBACK_PROFILE = [
+    ('Månadsavgift Grundpaket', 49.0, 'SEK'),
+    ('PAYPAL *marketingevolu', 1796.97, 'SEK'),
+    ('Swish till TELIA SVERIGE AB', 399.0, 'SEK'),
+    ('CURSOR USAGE JAN', 212.4, 'SEK'),
+    ('EL CORTE INGLES JAIME', 38.9, 'EUR'),
+    ('UBER *TRIP', 14.2, 'EUR'),
+    ('Glovo 03FEB A1Z95LQ8', 23.5, 'EUR'),
+    ('CAFE VOS Y YO', 6.8, 'EUR'),
+    ('ALIPASTA S L', 27.0, 'EUR'),
+    ('Adobe', 24.59, 'EUR'),
+    ('BANCA MARCH, S.A.', 1800.0, 'EUR'),
+    ('MC DONALD S ALICANTE E', 11.45, 'EUR')
+]
+
+# Transactions that are not purchases with a receipt
+_NON_PURCHASE_TYPES = {'EXCHANGE', 'TOPUP', 'TRANSFER'}
+_INTERNAL_TRANSFER = re.compile(r'^(revolut\*\*|överföring till)', re.IGNORECASE)
+_LEGAL_FORMS = ['AB', 'S.L.', 'S.A.', 'Ltd', 'Inc', 'GmbH']
+# Prefixes a receipt header never shows ("Swish till ...", "PAYPAL *...")
+_REFERENCE_PREFIX = re.compile(r'^(swish till|paypal \*|sq \*|zettle_\*)\s*', re.IGNORECASE)
+
+# Realistic volume: the Svea and Revolut exports hold ~1 100 transactions a year
+DEFAULT_TRANSACTIONS_PER_DAY = 3.0
+DEFAULT_MATCH_RATE = 0.85
+
+def load_profile(paths: Optional[List[str]] = None) -> List[Tuple[str, float, str]]:
+    """(reference, amount, currency) of the purchases in the bank exports.
+
+    Falls back to a built-in sample when the exports are missing.
+    """
+    paths = [p for p in (paths if paths is not None else DEFAULT_STATEMENTS) if os.path.exists(p)]
+    profile = []
+    try:
+        for transaction in iter_statements(paths):
+            if (transaction['amount'] >= 0 or transaction.get('type') in _NON_PURCHASE_TYPES
+                    or _INTERNAL_TRANSFER.match(transaction['reference'])):
+                continue
+            profile.append((transaction['reference'], -transaction['amount'], transaction.get('currency', 'SEK')))
+    except (OSError, ValueError):
+        profile = []
+    return profile or list(FALLBACK_PROFILE)
+
+def supplier_from_reference(reference: str) -> str:
+    """The supplier name a receipt header would show for a bank reference."""
+    name = _REFERENCE_PREFIX.sub('', reference.strip())
+    name = name.split('*')[0].strip() or name.replace('*', ' ').strip()
+    # Card references end in dates, store numbers and order codes
+    words = [w for w in name.split() if not any(ch.isdigit() for ch in w)]
+    return ' '.join(words or name.split()).title()
+
+def _reference_variant(reference: str, rnd: random.Random) -> str:
+    # Same merchant, different terminal or order: another code, or truncation
+    roll = rnd.random()
+    if roll < 0.15:
+        return f"{reference[:18]} {rnd.randint(100, 9999)}"
+    if roll < 0.25:
+        return reference[:rnd.randint(10, max(10, len(reference)))]
+    return reference
+
+def _amount_noise(amount: float, rnd: random.Random) -> float:
+    roll = rnd.random()
+    if roll < 0.75:
+        return amount
+    if roll < 0.9:
+        # Currency conversion or card fee: inside the 3% band
+        return round(amount * rnd.uniform(1.002, 1.025), 2)
+    # Tip added, or a partly refunded purchase
+    return round(amount * rnd.uniform(1.04, 1.15), 2)
+
+def _date_noise(rnd: random.Random) -> int:
+    roll = rnd.random()
+    if roll < 0.55:
+        return 0
+    if roll < 0.85:
+        return rnd.randint(1, 2)
+    if roll < 0.95:
+        return rnd.randint(3, 6)
+    # Late bookings, outside the matcher's date window
+    return rnd.randint(8, 20)
+
+def _receipt(receipt_id: str, supplier: str, amount: float, day: date, currency: str,
+             invoice_number: Optional[str]) -> Dict[str, Any]:
+    return {
+        "id": receipt_id,
+        "filename": f"{receipt_id}.pdf",
+        "supplier_name": supplier,
+        "invoice_number": invoice_number,
+        "date": day.isoformat(),
+        "total_amount": amount,
+        "vat_amount": round(amount * 0.2, 2),
+        "currency": currency,
+        "confidence_score": 0.9,
+        "line_items": []
+    }
+
+def generate(size: int, seed: int = 0, profile: Optional[List[Tuple[str, float, str]]] = None,
+             match_rate: float = DEFAULT_MATCH_RATE,
+             transactions_per_day: float = DEFAULT_TRANSACTIONS_PER_DAY) -> Dict[str, Any]:
+    """Synthetic receipts and transactions with known matches.
+
+    Returns {"receipts", "transactions", "truth"}, where truth maps the id of
+    each receipt that has a transaction to that transaction's id. Both sides
+    hold `size` records: transactions sampled from the bank export profile
+    over a span that keeps the daily volume realistic, `match_rate` of them
+    with a receipt carrying amount, date and supplier name noise, and the
+    remaining receipts without a transaction. The same arguments always give
+    the same data.
+    """
+    rnd = random.Random(seed)
+    profile = profile or load_profile()
+    end = date(2024, 12, 31)
+    span = max(1, int(size / transactions_per_day))
+    start = end - timedelta(days=span)
+
+    transactions = []
+    for i in range(size):
+        reference, amount, currency = rnd.choice(profile)
+        # Same merchant, different purchase
+        amount = round(max(1.0, amount * rnd.lognormvariate(0, 0.35)), 2)
+        transactions.append({
+            "id": f"t{i:07d}",
+            "date": (start + timedelta(days=rnd.randint(0, span))).isoformat(),
+            "amount": -amount,
+            "reference": _reference_variant(reference, rnd),
+            "currency": currency
+        })
+
+    receipts = []
+    truth = {}
+    matched = rnd.sample(range(size), int(size * match_rate))
+    for i, position in enumerate(matched):
+        transaction = transactions[position]
+        receipt_id = f"r{i:07d}"
+        supplier = supplier_from_reference(transaction['reference'])
+        if rnd.random() < 0.2:
+            # Legal name on the receipt, often absent from the reference
+            supplier = f"{supplier} {rnd.choice(_LEGAL_FORMS)}"
+        if rnd.random() < 0.1:
+            # Payment processor references the receipt never mentions
+            supplier = supplier_from_reference(rnd.choice(profile)[0])
+        invoice_number = f"{rnd.randint(10000, 999999)}" if rnd.random() < 0.5 else None
+        if invoice_number and rnd.random() < 0.1:
+            transaction['reference'] = f"{transaction['reference']} {invoice_number}"
+        day = date.fromisoformat(transaction['date']) - timedelta(days=_date_noise(rnd))
+        receipts.append(_receipt(receipt_id, supplier, _amount_noise(-transaction['amount'], rnd), day,
+                                 transaction['currency'], invoice_number))
+        truth[receipt_id] = transaction['id']
+
+    for i in range(len(matched), size):
+        reference, amount, currency = rnd.choice(profile)
+        day = start + timedelta(days=rnd.randint(0, span))
+        amount = round(max(1.0, amount * rnd.lognormvariate(0, 0.35)), 2)
+        receipts.append(_receipt(f"r{i:07d}", supplier_from_reference(reference), amount, day, currency,
+                                 f"{rnd.randint(10000, 999999)}" if rnd.random() < 0.5 else None))
+
+    # Receipts arrive in no particular order
+    rnd.shuffle(receipts)
+    return {"receipts": receipts, "transactions": transactions, "truth": truth}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate seeded receipts and transactions with known matches')
+    parser.add_argument('size', type=int, help='Number of receipts (and of transactions)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--match-rate', type=float, default=DEFAULT_MATCH_RATE,
+                        help='Share of transactions that have a receipt')
+    parser.add_argument('--per-day', type=float, default=DEFAULT_TRANSACTIONS_PER_DAY,
+                        help='Transactions per day; sets the date span')
+    parser.add_argument('--statements', nargs='+', metavar='CSV',
+                        help='Bank exports to sample references and amounts from (default: the repo exports)')
+    parser.add_argument('--output', help='Write to this file instead of stdout')
+    args = parser.parse_args()
+
+    data = generate(args.size, args.seed, load_profile(args.statements), args.match_rate, args.per_day)
+    # Usable directly as match_transactions.py input; "truth" is ignored there
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+    else:
+        json.dump(data, sys.stdout, ensure_ascii=False)
+        sys.stdout.write('\n')
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import sqlite3
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+# Bumped when what a stored state means changes; older states are rescored in full
+STORE_VERSION = '2'
+
+Score = Tuple[float, List[str]]
+
+@dataclass
+class ReconciliationPlan:
+    """What an incremental run can reuse.
+
+    clean_receipts / clean_transactions: ids of records whose features are
+    unchanged since the last run, which scored with the same scoring
+    version. known_scores: the stored scores at or above the threshold of
+    pairs of clean records, by (receipt id, transaction id); every other
+    clean pair scored below it.
+    """
+    clean_receipts: Set[str] = field(default_factory=set)
+    clean_transactions: Set[str] = field(default_factory=set)
+    known_scores: Dict[Tuple[str, str], Score] = field(default_factory=dict)
+
+def _fingerprint(features: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(features, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+class ReconciliationStore:
+    """SQLite store of the last run: the features of every record, the scores of
+    the pairs at or above the threshold, and the matches.
+
+    A record's fingerprint covers exactly the fields the scoring uses, so an
+    unchanged fingerprint means every score involving it is unchanged too.
+    Matches are not carried over: they are solved again from the scores, so
+    a new record can take over a pair exactly as in a full run.
+    """
+
+    def __init__(self, path: str, receipt_features: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 transaction_features: Callable[[Dict[str, Any]], Dict[str, Any]]):
+        self.path = Path(path)
+        self.receipt_features = receipt_features
+        self.transaction_features = transaction_features
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), timeout=30)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS records (
+                kind TEXT NOT NULL,
+                id TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                features TEXT NOT NULL,
+                PRIMARY KEY (kind, id)
+            );
+            CREATE TABLE IF NOT EXISTS scores (
+                receipt_id TEXT NOT NULL,
+                transaction_id TEXT NOT NULL,
+                confidence_score REAL NOT NULL,
+                reasons TEXT NOT NULL,
+                PRIMARY KEY (receipt_id, transaction_id)
+            );
+            CREATE TABLE IF NOT EXISTS matches (
+                receipt_id TEXT PRIMARY KEY,
+                transaction_id TEXT NOT NULL UNIQUE,
+                confidence_score REAL NOT NULL,
+                reasons TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS aliases (
+                alias TEXT PRIMARY KEY,
+                supplier_key TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        ''')
+        self._db.commit()
+
+    def _fingerprints(self, kind: str) -> Dict[str, str]:
+        return dict(self._db.execute('SELECT id, fingerprint FROM records WHERE kind = ?', (kind,)))
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def alias_pairs(self) -> List[Tuple[str, str]]:
+        """Supplier aliases learned from confirmed matches, as (alias, supplier key)."""
+        return list(self._db.execute('SELECT alias, supplier_key FROM aliases ORDER BY alias'))
+
+    def plan(self, receipts: List[Dict[str, Any]], transactions: List[Dict[str, Any]],
+             scoring_version: str = '') -> ReconciliationPlan:
+        """Find the records and scores of the current input the last run already covered.
+
+        scoring_version identifies anything besides the record features that
+        scores depend on (the alias index); when it differs from the last
+        run, nothing is reused.
+        """
+        plan = ReconciliationPlan()
+        if self._meta('store_version') != STORE_VERSION or self._meta('scoring_version') != scoring_version:
+            return plan
+        old_receipts = self._fingerprints('receipt')
+        old_transactions = self._fingerprints('transaction')
+        plan.clean_receipts = {str(r['id']) for r in receipts
+                               if old_receipts.get(str(r['id'])) == _fingerprint(self.receipt_features(r))}
+        plan.clean_transactions = {str(t['id']) for t in transactions
+                                   if old_transactions.get(str(t['id'])) == _fingerprint(self.transaction_features(t))}
+        for receipt_id, transaction_id, confidence, reasons in self._db.execute(
+            'SELECT receipt_id, transaction_id, confidence_score, reasons FROM scores'
+        ):
+            if receipt_id in plan.clean_receipts and transaction_id in plan.clean_transactions:
+                plan.known_scores[(receipt_id, transaction_id)] = (confidence, json.loads(reasons))
+        return plan
+
+    def save(self, receipts: List[Dict[str, Any]], transactions: List[Dict[str, Any]],
+             scores: Dict[Tuple[str, str], Score], matches: List[Dict[str, Any]], scoring_version: str = '',
+             alias_pairs: Optional[List[Tuple[str, str]]] = None) -> None:
+        """Replace the stored state with this run's records, scores and matches.
+
+        scores holds every pair at or above the threshold, by (receipt id,
+        transaction id); scoring_version is the one this run scored with;
+        alias_pairs, when given, replace the stored aliases for the next run.
+        """
+        with self._db:
+            self._db.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                                 [('store_version', STORE_VERSION), ('scoring_version', scoring_version)])
+            if alias_pairs is not None:
+                self._db.execute('DELETE FROM aliases')
+                self._db.executemany('INSERT INTO aliases (alias, supplier_key) VALUES (?, ?)', alias_pairs)
+            self._db.execute('DELETE FROM records')
+            self._db.executemany(
+                'INSERT OR REPLACE INTO records (kind, id, fingerprint, features) VALUES (?, ?, ?, ?)',
+                [('receipt', str(r['id']), _fingerprint(f), json.dumps(f, ensure_ascii=False))
+                 for r in receipts for f in (self.receipt_features(r),)]
+                + [('transaction', str(t['id']), _fingerprint(f), json.dumps(f, ensure_ascii=False))
+                   for t in transactions for f in (self.transaction_features(t),)]
+            )
+            self._db.execute('DELETE FROM scores')
+            self._db.executemany(
+                'INSERT INTO scores (receipt_id, transaction_id, confidence_score, reasons) VALUES (?, ?, ?, ?)',
+                [(receipt_id, transaction_id, score, json.dumps(reasons, ensure_ascii=False))
+                 for (receipt_id, transaction_id), (score, reasons) in scores.items()]
+            )
+            self._db.execute('DELETE FROM matches')
+            self._db.executemany(
+                'INSERT INTO matches (receipt_id, transaction_id, confidence_score, reasons) VALUES (?, ?, ?, ?)',
+                [(str(m['receipt']['id']), str(m['transaction']['id']), m['confidence_score'],
+                  json.dumps(m['reasons'], ensure_ascii=False)) for m in matches]
+            )
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __enter__(self) -> 'ReconciliationStore':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
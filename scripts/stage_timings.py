@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Timings collected in the current context: the run's, and the current file's
+_collectors: contextvars.ContextVar[Tuple['StageTimings', ...]] = contextvars.ContextVar('stage_timings',
+                                                                                         default=())
+
+PROFILERS = ('cprofile', 'pyinstrument')
+
+class StageTimings:
+    """Seconds, calls, items and bytes per stage, for one run or one file.
+
+    Stages nest (extract_text holds extract_text_from_pdf, which holds
+    rasterization and OCR), so their seconds do not add up to the total.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.files: List[Dict[str, Any]] = []
+
+    def add(self, stage: str, seconds: float, items: int = 1, nbytes: int = 0) -> None:
+        entry = self.stages.setdefault(stage, {"seconds": 0.0, "calls": 0, "items": 0, "bytes": 0})
+        entry["seconds"] += seconds
+        entry["calls"] += 1
+        entry["items"] += items
+        entry["bytes"] += nbytes
+
+    def merge(self, stages: Dict[str, Dict[str, float]]) -> None:
+        """Add the totals of another as_dict(), e.g. from an OCR worker process."""
+        for stage, other in stages.items():
+            entry = self.stages.setdefault(stage, {"seconds": 0.0, "calls": 0, "items": 0, "bytes": 0})
+            for key in entry:
+                entry[key] += other.get(key, 0)
+
+    def as_dict(self) -> Dict[str, Dict[str, float]]:
+        return {stage: {**entry, "seconds": round(entry["seconds"], 4)} for stage, entry in self.stages.items()}
+
+class StageTimer:
+    """Handed out by timed(); set items or nbytes once they are known."""
+
+    def __init__(self, items: int, nbytes: int):
+        self.items = items
+        self.nbytes = nbytes
+
+@contextmanager
+def timed(stage: str, items: int = 1, nbytes: int = 0) -> Iterator[StageTimer]:
+    """Time the block as `stage` in every collector of the current context."""
+    timer = StageTimer(items, nbytes)
+    start = time.perf_counter()
+    try:
+        yield timer
+    finally:
+        elapsed = time.perf_counter() - start
+        for timings in _collectors.get():
+            timings.add(stage, elapsed, timer.items, timer.nbytes)
+
+@contextmanager
+def collecting(timings: Optional[StageTimings] = None, isolated: bool = False) -> Iterator[StageTimings]:
+    """Collect the stages timed in this context (and tasks started from it).
+
+    Collectors nest: a file's timings also count towards the run's. An
+    isolated collector only sees its own block, for results that are
+    handed back and recorded elsewhere.
+    """
+    timings = timings if timings is not None else StageTimings()
+    outer = () if isolated else _collectors.get()
+    token = _collectors.set(outer + (timings,))
+    try:
+        yield timings
+    finally:
+        _collectors.reset(token)
+
+def record(stages: Dict[str, Dict[str, float]]) -> None:
+    """Add stages timed elsewhere (another process, an isolated collector) to the current collectors."""
+    for timings in _collectors.get():
+        timings.merge(stages)
+
+def record_file(name: str, timings: StageTimings) -> None:
+    """Attach one file's stages to the current collectors."""
+    entry = {"file": name, "stages": timings.as_dict()}
+    for collector in _collectors.get():
+        collector.files.append(entry)
+
+def run_summary(timings: StageTimings, seconds: float) -> Dict[str, Any]:
+    """The "timings" event data: wall time, per-stage totals and per-file stages."""
+    return {"seconds": round(seconds, 4), "stages": timings.as_dict(), "files": timings.files}
+
+@contextmanager
+def profiled(path: Optional[str], profiler: str = 'cprofile') -> Iterator[None]:
+    """Profile the block and write the result to path; does nothing without a path.
+
+    cprofile writes pstats data (python -m pstats PATH); pyinstrument, when
+    installed, writes HTML for a .html path and text otherwise. Only this
+    process is profiled, not OCR pool workers.
+    """
+    if not path:
+        yield
+        return
+    if profiler == 'pyinstrument':
+        from pyinstrument import Profiler
+        sampler = Profiler(async_mode='enabled')
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            output = sampler.output_html() if path.endswith('.html') else sampler.output_text()
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(output)
+        return
+    import cProfile
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
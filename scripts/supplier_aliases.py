@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+import hashlib
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Payment processors put their own name in front of the merchant's
+# ("PAYPAL *marketingevolu", "SQ *CAFE", "ZETTLE_*BAGERIET")
+_PROCESSOR_PREFIX = re.compile(
+    r'^(paypal|pp|sq|sumup|zettle|iz|klarna|stripe|google|apple\.com/bill|amzn mktp|amazon|vipps|swish)\s*[*_]+\s*'
+)
+_LEGAL_SUFFIXES = {'ab', 'publ', 'aktiebolag', 'inc', 'ltd', 'llc', 'limited', 'gmbh', 'as', 'asa', 'oy', 'bv',
+                   'sa', 'srl', 'co', 'corp', 'corporation', 'company', 'plc', 'hb', 'kb'}
+
+# Trigram similarity needed for a fuzzy alias hit
+DEFAULT_MIN_SIMILARITY = 0.6
+
+def _fold(text: str) -> str:
+    # Lowercase ASCII: "Café Åhléns" -> "cafe ahlens"
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
+def supplier_key(name: str) -> str:
+    """Normalized supplier name: folded, punctuation and legal suffixes removed."""
+    tokens = re.sub(r'[^a-z0-9]+', ' ', _fold(name)).split()
+    kept = [t for t in tokens if t not in _LEGAL_SUFFIXES]
+    return ' '.join(kept or tokens)
+
+def reference_core(reference: str) -> str:
+    """The merchant part of a bank reference, without processor prefix and number-only tokens."""
+    folded = _PROCESSOR_PREFIX.sub('', _fold(reference).strip())
+    tokens = [t for t in re.sub(r'[^a-z0-9]+', ' ', folded).split() if not t.isdigit()]
+    return ' '.join(t for t in tokens if t not in _LEGAL_SUFFIXES)
+
+def _trigrams(text: str) -> Set[str]:
+    # Spaces dropped: references often glue words together ("marketingevolu")
+    compact = f"  {text.replace(' ', '')} "
+    return {compact[i:i + 3] for i in range(len(compact) - 2)}
+
+class SupplierAliasIndex:
+    """Bank reference aliases of suppliers, learned from matches the user confirmed.
+
+    Each alias is the reference core of a transaction that was matched to a
+    supplier. A reference resolves through an exact alias hit, or through a
+    trigram index when it only shares most of its trigrams with an alias
+    (truncated or slightly different references). Lookups touch only the
+    aliases that share a trigram with the reference.
+    """
+
+    def __init__(self, min_similarity: float = DEFAULT_MIN_SIMILARITY):
+        self.min_similarity = min_similarity
+        self._aliases: Dict[str, str] = {}
+        self._alias_trigrams: Dict[str, Set[str]] = {}
+        self._postings: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._aliases)
+
+    def add(self, supplier_name: str, reference: str) -> None:
+        """Record that transactions with this reference were paid to this supplier."""
+        core = reference_core(reference)
+        key = supplier_key(supplier_name)
+        if core and key:
+            self._index(core, key)
+
+    def _index(self, alias: str, key: str) -> None:
+        self._aliases[alias] = key
+        grams = _trigrams(alias)
+        self._alias_trigrams[alias] = grams
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(alias)
+
+    def learn(self, matches: Iterable[Dict[str, Dict[str, str]]]) -> None:
+        """Add the aliases of confirmed {"receipt", "transaction"} matches."""
+        for match in matches:
+            self.add(match['receipt']['supplier_name'], match['transaction']['reference'])
+
+    def pairs(self) -> List[Tuple[str, str]]:
+        """(alias, supplier key) pairs, sorted."""
+        return sorted(self._aliases.items())
+
+    def digest(self) -> str:
+        """Content hash; scores only depend on the index through its aliases."""
+        return hashlib.sha1(repr((self.min_similarity, self.pairs())).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def from_pairs(cls, pairs: Iterable[Tuple[str, str]],
+                   min_similarity: float = DEFAULT_MIN_SIMILARITY) -> 'SupplierAliasIndex':
+        index = cls(min_similarity)
+        for alias, key in pairs:
+            index._index(alias, key)
+        return index
+
+    def lookup(self, reference: str) -> Optional[Tuple[str, str, float]]:
+        """Resolve a bank reference to (supplier key, alias, similarity), or None."""
+        core = reference_core(reference)
+        if not core:
+            return None
+        if core in self._aliases:
+            return self._aliases[core], core, 1.0
+        grams = _trigrams(core)
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for alias in self._postings.get(gram, ()):
+                shared[alias] = shared.get(alias, 0) + 1
+        best = None
+        for alias, count in shared.items():
+            similarity = count / (len(grams) + len(self._alias_trigrams[alias]) - count)
+            if similarity < self.min_similarity:
+                continue
+            # Ties go to the alphabetically first alias so results are stable
+            if best is None or similarity > best[2] or (similarity == best[2] and alias < best[1]):
+                best = (self._aliases[alias], alias, similarity)
+        return best
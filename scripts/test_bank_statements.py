@@ -0,0 +1,66 @@
+import io
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from bank_statements import iter_json_values, iter_transaction_input
+
+SCRIPT = Path(__file__).with_name('parse_receipt.py')
+
+VALUES = [
+    {'id': 1, 'date': '2024-01-02', 'amount': 2.5, 'description': 'Kaffe, "bulle" [2] {st}'},
+    {'id': '2', 'date': '2024-01-03', 'amount': -1234.75, 'description': 'Åhléns \\ é€'},
+    {'id': 3, 'date': '2024-01-04', 'amount': 10, 'tags': [1, 2.25, {'nested': [None, True]}]},
+    {'id': 4, 'date': '2024-01-05', 'amount': 1e3, 'description': ''},
+]
+
+def as_array(values):
+    return '\ufeff[\n' + ',\n'.join(json.dumps(value, ensure_ascii=False) for value in values) + '\n]\n'
+
+def as_lines(values):
+    return ''.join(json.dumps(value, ensure_ascii=False) + '\r\n' for value in values)
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64, 1 << 16])
+def test_array_and_lines_split_across_chunks(chunk_size):
+    for text in (as_array(VALUES), as_lines(VALUES)):
+        assert list(iter_json_values(io.StringIO(text), chunk_size=chunk_size)) == VALUES
+        assert list(iter_transaction_input(io.StringIO(text), chunk_size=chunk_size)) == VALUES
+
+def test_unterminated_array_is_an_error():
+    with pytest.raises(ValueError):
+        list(iter_json_values(io.StringIO(as_array(VALUES)[:-3]), chunk_size=5))
+
+def large_transactions():
+    """More bytes of transactions than fit on a command line."""
+    arg_max = os.sysconf('SC_ARG_MAX') if hasattr(os, 'sysconf') else 2 * 1024 * 1024
+    transaction = {'date': '2024-01-02', 'amount': 99.5, 'description': 'x' * 200}
+    count = arg_max // len(json.dumps(transaction)) + 100
+    return [dict(transaction, id=i) for i in range(count)], arg_max
+
+@pytest.mark.parametrize('form', [as_array, as_lines])
+@pytest.mark.parametrize('source', ['path', 'stdin'])
+def test_match_reads_transactions_larger_than_arg_max(tmp_path, form, source):
+    transactions, arg_max = large_transactions()
+    text = form(transactions)
+    assert len(text.encode('utf-8')) > arg_max
+    data_path = tmp_path / 'transactions.json'
+    data_path.write_text(text, encoding='utf-8')
+    receipts = tmp_path / 'receipts'
+    receipts.mkdir()
+
+    result = subprocess.run(
+        [sys.executable, str(SCRIPT), '--no-cache', '--match', str(receipts),
+         '--transactions', str(data_path) if source == 'path' else '-'],
+        input=text if source == 'stdin' else None, capture_output=True, text=True,
+        cwd=tmp_path, env=dict(os.environ, OPENAI_API_KEY='test-key'), timeout=120
+    )
+
+    assert result.returncode == 0, result.stderr
+    events = [json.loads(line) for line in result.stdout.splitlines() if line.startswith('{')]
+    summary = next(event['data'] for event in events if event['stage'] == 'complete')
+    assert summary['transactions'] == len(transactions)
+    assert summary['skipped_transactions'] == 0
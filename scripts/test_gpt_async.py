@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+
+import asyncio
+import json
+import re
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import parse_receipt
+from gpt_batches import BatchPacker, parse_batch_response
+from progress_events import ProgressReporter, events_to
+from receipt_fields import REQUIRED_FIELDS
+
+FIELDS = {
+    "supplier_name": "Bageriet AB",
+    "invoice_number": "4711",
+    "date": "2024-03-12",
+    "total_amount": 125.0,
+    "currency": "SEK",
+    "vat_amount": 13.39,
+    "confidence_score": 0.9,
+    "line_items": []
+}
+# Per-request delay, so requests overlap when the concurrency allows it
+RESPONSE_SECONDS = 0.2
+
+class FakeOpenAI(ThreadingHTTPServer):
+    """A chat completions endpoint that fails on cue.
+
+    The receipt text says how: "RATE-LIMITED" gets a 429 with Retry-After
+    on its first attempt, "OVERLOADED" a 503, and "STALLS" a response
+    slower than any client timeout. A batched request answers every receipt
+    but those saying "SKIPPED", or nothing parseable when one says
+    "GARBLED". Requests in flight, attempts per text and the size of every
+    request (1 for a single receipt) are counted.
+    """
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeOpenAIHandler)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.attempts = {}
+        self.request_sizes = []
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        text = body['messages'][-1]['content']
+        batch = re.split(r'=== Receipt id (\d+) ===\n', text)[1:]
+        with server.lock:
+            server.request_sizes.append(len(batch) // 2 or 1)
+        marker = next((m for m in ('RATE-LIMITED', 'OVERLOADED', 'STALLS') if m in text), None)
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            attempt = server.attempts.setdefault(marker, [])
+            attempt.append(time.monotonic())
+            first = len(attempt) == 1
+        try:
+            if marker == 'RATE-LIMITED' and first:
+                return self._send(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                                  {'Retry-After': '0.5'})
+            if marker == 'OVERLOADED' and first:
+                return self._send(503, {"error": {"message": "Overloaded", "type": "server_error"}})
+            time.sleep(3 if marker == 'STALLS' and first else RESPONSE_SECONDS)
+            if not batch:
+                content = json.dumps(FIELDS)
+            elif 'GARBLED' in text:
+                content = 'Here are the receipts you asked for'
+            else:
+                content = json.dumps({"receipts": [dict(FIELDS, id=int(number))
+                                                   for number, receipt in zip(batch[::2], batch[1::2])
+                                                   if 'SKIPPED' not in receipt]})
+            self._send(200, {
+                "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": body['model'],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(text) // 4, "completion_tokens": len(content) // 4,
+                          "total_tokens": (len(text) + len(content)) // 4}
+            })
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on a stalled request
+            pass
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _send(self, status, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    server = FakeOpenAI()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv('OPENAI_BASE_URL', f'http://127.0.0.1:{server.server_address[1]}/v1')
+    # One request per receipt, nothing held back
+    monkeypatch.setenv('RECEIPT_GPT_BATCH_TOKENS', '0')
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def receipt_text(number: int, marker: str = '') -> str:
+    return f"Bageriet AB\nOrg nr 556677-8899\nKvitto {number} {marker}\nTotalt 125,00 SEK\nMoms 13,39\n2024-03-12\n"
+
+def build_receipts(texts, concurrency: int, timeout: float = 2.0, max_retries: int = 2, cache=None):
+    """Run the async GPT stage of process_directory on already extracted texts; a hang fails after 10s."""
+    files = [f'receipt{i}.jpg' for i in range(len(texts))]
+    extracted = iter([(text, [], None, {}) for text in texts])
+    progress = ProgressReporter([('files', 100)], enabled=False)
+    progress.start('files', len(files))
+    with events_to(lambda event: None):
+        return asyncio.run(asyncio.wait_for(parse_receipt._build_receipts_async(
+            files, extracted, cache, concurrency, timeout, max_retries, progress
+        ), 10))
+
+def test_requests_stay_within_the_concurrency_limit(fake_openai):
+    receipts = build_receipts([receipt_text(i) for i in range(9)], concurrency=3)
+    assert [r.error for r in receipts] == [None] * 9
+    assert [r.filename for r in receipts] == [f'receipt{i}.jpg' for i in range(9)]
+    assert all(r.supplier_name == FIELDS['supplier_name'] and r.total_amount == FIELDS['total_amount']
+               for r in receipts)
+    assert fake_openai.max_in_flight == 3
+
+def test_rate_limits_and_server_errors_are_retried(fake_openai):
+    start = time.monotonic()
+    receipts = build_receipts([receipt_text(0, 'RATE-LIMITED'), receipt_text(1, 'OVERLOADED'), receipt_text(2)],
+                              concurrency=3)
+    assert [r.error for r in receipts] == [None] * 3
+    assert len(fake_openai.attempts['RATE-LIMITED']) == 2
+    assert len(fake_openai.attempts['OVERLOADED']) == 2
+    # The retry waited as long as Retry-After asked
+    first, second = fake_openai.attempts['RATE-LIMITED']
+    assert second - first >= 0.5
+    assert time.monotonic() - start < 3
+
+def test_stalled_request_times_out_and_is_retried(fake_openai):
+    start = time.monotonic()
+    receipts = build_receipts([receipt_text(0, 'STALLS'), receipt_text(1)], concurrency=2, timeout=0.5)
+    assert [r.error for r in receipts] == [None, None]
+    assert len(fake_openai.attempts['STALLS']) == 2
+    # Not held up by the stalled response
+    assert time.monotonic() - start < 2.5
+
+def test_retry_budget_exhausted_gives_an_error_receipt(fake_openai):
+    receipts = build_receipts([receipt_text(0, 'STALLS')], concurrency=1, timeout=0.3, max_retries=0)
+    assert 'timed out' in receipts[0].error
+    assert len(fake_openai.attempts['STALLS']) == 1
+
+def test_batch_entries_left_out_are_sent_again_alone(fake_openai, monkeypatch):
+    monkeypatch.setenv('RECEIPT_GPT_BATCH_TOKENS', '10000')
+    receipts = build_receipts([receipt_text(0), receipt_text(1, 'SKIPPED'), receipt_text(2)], concurrency=2)
+    assert [r.error for r in receipts] == [None] * 3
+    assert all(r.supplier_name == FIELDS['supplier_name'] for r in receipts)
+    assert sorted(fake_openai.request_sizes) == [1, 3]
+
+def test_unparseable_batch_response_sends_every_receipt_again(fake_openai, monkeypatch):
+    monkeypatch.setenv('RECEIPT_GPT_BATCH_TOKENS', '10000')
+    receipts = build_receipts([receipt_text(0, 'GARBLED'), receipt_text(1), receipt_text(2)], concurrency=3)
+    assert [r.error for r in receipts] == [None] * 3
+    assert sorted(fake_openai.request_sizes) == [1, 1, 1, 3]
+
+class FailingCache:
+    def get(self, kind, key):
+        return None
+
+    def put(self, kind, key, value):
+        raise sqlite3.OperationalError("database is locked")
+
+def test_failing_batch_fails_the_scan_instead_of_hanging(fake_openai, monkeypatch):
+    monkeypatch.setenv('RECEIPT_GPT_BATCH_TOKENS', '10000')
+    with pytest.raises(sqlite3.OperationalError):
+        build_receipts([receipt_text(i) for i in range(3)], concurrency=2, cache=FailingCache())
+
+def test_batch_packer_respects_budget_and_receipt_cap():
+    packer = BatchPacker(10, max_receipts=3, measure=len)
+    assert packer.add('a', 'xxxx') == []
+    assert packer.add('b', 'xxxx') == []
+    # Over the budget: the pending batch goes, the new text starts the next
+    assert packer.add('c', 'xxxx') == [[('a', 'xxxx'), ('b', 'xxxx')]]
+    # A text over the budget by itself is a batch of one
+    assert packer.add('d', 'x' * 20) == [[('c', 'xxxx')], [('d', 'x' * 20)]]
+    assert [packer.add(key, 'x') for key in 'efg'] == [[], [], []]
+    assert packer.add('h', 'x') == [[('e', 'x'), ('f', 'x'), ('g', 'x')]]
+    assert packer.flush() == [[('h', 'x')]]
+    assert packer.flush() == []
+
+def test_parse_batch_response_fails_missing_repeated_and_invalid_entries():
+    entry = {field: FIELDS[field] for field in REQUIRED_FIELDS}
+    content = json.dumps({"receipts": [
+        dict(entry, id=1),
+        dict(entry, id=3), dict(entry, id="3"),
+        dict(entry, id=4, total_amount="a lot"),
+        dict({k: v for k, v in entry.items() if k != 'currency'}, id=5),
+        dict(entry, id=6, vat_amount=None),
+        dict(entry, id=9), {"fields": entry}, "receipt 7"
+    ]})
+    parsed, failed = parse_batch_response(content, 7)
+    assert sorted(parsed) == [0, 5]
+    assert parsed[0] == entry
+    # Nulls are left for the defaults to fill in
+    assert 'vat_amount' not in parsed[5]
+    assert failed == [1, 2, 3, 4, 6]
+
+@pytest.mark.parametrize('content', [None, '', 'not json', '[]', '{"receipts": {"id": 1}}', '{"results": []}'])
+def test_unparseable_batch_response_fails_every_entry(content):
+    assert parse_batch_response(content, 3) == ({}, [0, 1, 2])
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from gpt_followup import DEFAULT_REASKS, invalid_fields, merge_answer, reask_budget, reask_prompt
+
+VALID = {
+    "supplier_name": "Bageriet AB",
+    "invoice_number": "4711",
+    "date": "2024-03-12",
+    "total_amount": 125.0,
+    "currency": "SEK",
+    "vat_amount": 13.39
+}
+
+def test_follow_ups_are_opt_in(monkeypatch):
+    monkeypatch.delenv('RECEIPT_GPT_REASKS', raising=False)
+    assert DEFAULT_REASKS == 0
+    assert reask_budget() == 0
+    monkeypatch.setenv('RECEIPT_GPT_REASKS', '2')
+    assert reask_budget() == 2
+
+def test_valid_fields_pass():
+    assert invalid_fields(VALID) == {}
+    # Amounts may come as strings, VAT may be zero
+    assert invalid_fields(dict(VALID, total_amount="125.00", vat_amount=0)) == {}
+
+@pytest.mark.parametrize('changes, expected', [
+    ({'invoice_number': None}, {'invoice_number': 'missing'}),
+    ({'supplier_name': ' Unknown '}, {'supplier_name': 'missing'}),
+    ({'currency': 'n/a'}, {'currency': 'missing'}),
+    ({'date': ''}, {'date': 'missing'}),
+    ({'date': '12/03/2024'}, {'date': 'not a YYYY-MM-DD date'}),
+    ({'date': '2024-02-30'}, {'date': 'not a YYYY-MM-DD date'}),
+    ({'date': '1024-03-12'}, {'date': 'not a plausible year'}),
+    ({'total_amount': 'a lot'}, {'total_amount': 'not a number'}),
+    ({'total_amount': True}, {'total_amount': 'not a number'}),
+    ({'total_amount': 0}, {'total_amount': 'not positive'}),
+    ({'total_amount': -125.0}, {'total_amount': 'not positive'}),
+    ({'vat_amount': 'moms'}, {'vat_amount': 'not a number'}),
+    ({'vat_amount': -1}, {'vat_amount': 'negative'}),
+    ({'vat_amount': 200}, {'vat_amount': 'more than the total', 'total_amount': 'less than the VAT'}),
+    ({'currency': 'kr'}, {'currency': 'not a currency code'}),
+    ({'currency': 'sek'}, {'currency': 'not a currency code'}),
+])
+def test_each_rejection_rule(changes, expected):
+    assert invalid_fields(dict(VALID, **changes)) == expected
+
+def test_reask_prompt_asks_only_for_the_problem_fields():
+    parsed = dict(VALID, date='12/03/2024', invoice_number=None)
+    prompt = reask_prompt("Bageriet AB\nKvitto 4711\nDatum 12/03/2024\nTotalt 125,00", invalid_fields(parsed), parsed)
+    assert '- invoice_number: The invoice or receipt number\n' in prompt
+    assert '(previously "12/03/2024": not a YYYY-MM-DD date)' in prompt
+    for field in ('supplier_name', 'total_amount', 'currency', 'vat_amount'):
+        assert f'- {field}:' not in prompt
+    assert 'Kvitto 4711' in prompt
+
+def test_merge_keeps_only_answers_that_make_the_field_valid():
+    parsed = dict(VALID, invoice_number=None, date='12/03/2024', currency='kr')
+    problems = invalid_fields(parsed)
+    answer = json.dumps({
+        'invoice_number': '4711',
+        'date': '2024/03/12',
+        'currency': 'SEK',
+        # Not asked for
+        'supplier_name': 'Someone Else AB'
+    })
+    merged = merge_answer(parsed, answer, problems)
+    assert merged == dict(VALID, date='12/03/2024')
+
+def test_merge_checks_vat_against_the_answered_total():
+    parsed = dict(VALID, total_amount=10.0, vat_amount=13.39)
+    problems = invalid_fields(parsed)
+    assert merge_answer(parsed, json.dumps({'total_amount': 125.0, 'vat_amount': 13.39}), problems) == VALID
+    # A total still below the VAT fixes nothing
+    assert merge_answer(parsed, json.dumps({'total_amount': 12.0}), problems) == parsed
+
+@pytest.mark.parametrize('content', [None, '', 'not json', '[1, 2]', '{"invoice_number": null}'])
+def test_unusable_answers_change_nothing(content):
+    parsed = dict(VALID, invoice_number=None)
+    assert merge_answer(parsed, content, invalid_fields(parsed)) == parsed
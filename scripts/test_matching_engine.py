@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+import functools
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from match_transactions import (MATCH_THRESHOLD, assign_greedy, assign_optimal, calculate_match_score,
+                                find_greedy_matches, find_optimal_matches)
+from matching_engine import AMOUNT_DATE_RULES, WEIGHTED_RULES, MatchEngine, score_pair
+from parse_receipt import Receipt, match_receipts_with_transactions
+from reconciliation_data import FALLBACK_PROFILE, generate
+from supplier_aliases import SupplierAliasIndex
+
+SUPPLIERS = ['Telia Sverige AB', 'Cafe Vos Y Yo', 'Adobe', 'Marketing Evolution', 'Uber', '', 'a']
+REFERENCES = ['Swish till TELIA SVERIGE AB', 'CAFE VOS Y YO', 'Adobe', 'PAYPAL *marketingevolu', 'UBER *TRIP',
+              'Glovo 03FEB A1Z95LQ8', 'ADOBE 12345', '']
+# No amount, unparseable amounts, formatted strings and negatives
+AMOUNTS = [0, 0.0, '', 'n/a', '1 234,50', '1,234.50', '€12,5', '-49', 49, 49.49, 399.0, 1796.97]
+
+def random_pairs(seed: int, size: int):
+    """Receipts and transactions crowded onto a few amounts, dates and names, so every tier and edge case occurs."""
+    rnd = random.Random(seed)
+    start = date(2024, 1, 1)
+    receipts = []
+    for i in range(size):
+        invoice = rnd.choice([None, '', '12345', 'A1Z95LQ8', 42])
+        receipts.append({
+            "id": f"r{i}",
+            "supplier_name": rnd.choice(SUPPLIERS),
+            "invoice_number": invoice,
+            "date": (start + timedelta(days=rnd.randint(0, 40))).isoformat(),
+            "total_amount": rnd.choice(AMOUNTS + [round(rnd.uniform(40, 60), 2)])
+        })
+    transactions = []
+    for i in range(size):
+        transactions.append({
+            "id": f"t{i}",
+            "date": (start + timedelta(days=rnd.randint(0, 40))).isoformat(),
+            "amount": rnd.choice(AMOUNTS + [-round(rnd.uniform(40, 60), 2)]),
+            "reference": rnd.choice(REFERENCES)
+        })
+    return receipts, transactions
+
+def assert_parity(receipts, transactions, rules, aliases=None):
+    engine = MatchEngine(transactions, rules, aliases)
+    for receipt in receipts:
+        returned = {t: (score, reasons) for t, score, reasons in engine.score(receipt, range(len(transactions)))}
+        for t, transaction in enumerate(transactions):
+            expected = score_pair(receipt, transaction, rules, aliases)
+            if t in returned:
+                assert returned[t][0] == expected[0], (receipt, transaction)
+                assert returned[t][1] == expected[1], (receipt, transaction)
+            else:
+                # Left out only when it cannot reach the threshold
+                assert expected[0] < rules.threshold, (receipt, transaction)
+        # The candidate index never drops a pair at or above the threshold
+        candidates = set(engine.index.candidate_positions(receipt))
+        assert {t for t, (score, _) in returned.items() if score >= rules.threshold} <= candidates
+
+def brute_force_greedy(receipts, transactions, aliases=None):
+    """The matcher before indexing and vectorizing: every receipt against every transaction."""
+    matches = []
+    used = set()
+    for receipt in receipts:
+        best, best_score, best_reasons = None, 0, []
+        for transaction in transactions:
+            if transaction['id'] in used:
+                continue
+            score, reasons = calculate_match_score(receipt, transaction, aliases)
+            if score > best_score:
+                best, best_score, best_reasons = transaction, score, reasons
+        if best and best_score >= WEIGHTED_RULES.threshold:
+            matches.append((receipt['id'], best['id'], best_score, best_reasons))
+            used.add(best['id'])
+    return matches
+
+def test_scores_match_calculate_match_score_on_edge_cases():
+    for seed in range(5):
+        receipts, transactions = random_pairs(seed, 60)
+        assert_parity(receipts, transactions, WEIGHTED_RULES)
+
+def test_scores_match_with_supplier_aliases():
+    receipts, transactions = random_pairs(7, 60)
+    aliases = SupplierAliasIndex()
+    aliases.add('Marketing Evolution', 'PAYPAL *marketingevolu')
+    aliases.add('Uber', 'UBER *TRIP')
+    assert_parity(receipts, transactions, WEIGHTED_RULES, aliases)
+
+def test_scores_match_amount_date_rules():
+    for seed in range(3):
+        receipts, transactions = random_pairs(seed, 60)
+        assert_parity(receipts, transactions, AMOUNT_DATE_RULES)
+
+def test_scores_match_on_generated_data():
+    data = generate(300, seed=3, profile=list(FALLBACK_PROFILE))
+    assert_parity(data['receipts'][:80], data['transactions'], WEIGHTED_RULES)
+
+def test_greedy_matches_equal_full_scan():
+    data = generate(400, seed=5, profile=list(FALLBACK_PROFILE))
+    for receipts, transactions in [random_pairs(11, 80), (data['receipts'], data['transactions'])]:
+        engine = MatchEngine(transactions, WEIGHTED_RULES)
+        matches = find_greedy_matches(receipts, engine, report=False)
+        assert [(m['receipt']['id'], m['transaction']['id'], m['confidence_score'], m['reasons'])
+                for m in matches] == brute_force_greedy(receipts, transactions)
+
+def best_total_confidence(scores, receipts: int):
+    """The highest total confidence of any one-to-one assignment, each receipt matched or not, by exhaustive search."""
+    @functools.lru_cache(maxsize=None)
+    def best(r: int, used: frozenset) -> float:
+        if r == receipts:
+            return 0.0
+        # Left unmatched, or given any free transaction it scores with
+        return max([best(r + 1, used)] + [score + best(r + 1, used | {t})
+                                          for (rr, t), (score, _) in scores.items() if rr == r and t not in used])
+    return best(0, frozenset())
+
+def assert_optimal(matches, scores, receipts):
+    pairs = [(m['receipt']['position'], m['transaction']['position']) for m in matches]
+    assert len({r for r, _ in pairs}) == len(pairs) and len({t for _, t in pairs}) == len(pairs)
+    assert all(pair in scores and scores[pair][0] == m['confidence_score'] for pair, m in zip(pairs, matches))
+    assert sum(m['confidence_score'] for m in matches) == pytest.approx(best_total_confidence(scores, len(receipts)))
+
+def records(count: int, prefix: str):
+    return [{"id": f"{prefix}{i}", "position": i} for i in range(count)]
+
+def test_optimal_beats_greedy_where_greedy_blocks_a_receipt():
+    receipts, transactions = records(2, 'r'), records(2, 't')
+    # The first receipt's best transaction is the second receipt's only one
+    scores = {(0, 0): (0.9, []), (0, 1): (0.85, []), (1, 0): (0.8, [])}
+    greedy = assign_greedy(receipts, transactions, scores)
+    optimal = assign_optimal(receipts, transactions, scores)
+    assert [(m['receipt']['id'], m['transaction']['id']) for m in greedy] == [('r0', 't0')]
+    assert [(m['receipt']['id'], m['transaction']['id']) for m in optimal] == [('r0', 't1'), ('r1', 't0')]
+    assert_optimal(optimal, scores, receipts)
+
+def test_optimal_assignment_is_the_best_on_random_instances():
+    rnd = random.Random(17)
+    for _ in range(300):
+        # More receipts than transactions, or fewer, so some are always left over
+        receipts, transactions = records(rnd.randint(1, 7), 'r'), records(rnd.randint(1, 7), 't')
+        density = rnd.choice([0.2, 0.5, 0.9])
+        scores = {(r, t): (round(rnd.uniform(MATCH_THRESHOLD, 1.0), rnd.choice([1, 2, 4])), [])
+                  for r in range(len(receipts)) for t in range(len(transactions)) if rnd.random() < density}
+        assert_optimal(assign_optimal(receipts, transactions, scores), scores, receipts)
+
+def test_find_optimal_matches_is_the_best_on_scored_data():
+    for seed in range(20):
+        receipts, transactions = random_pairs(seed, 8)
+        for records_ in (receipts, transactions):
+            for position, record in enumerate(records_):
+                record['position'] = position
+        engine = MatchEngine(transactions, WEIGHTED_RULES)
+        scores = {}
+        for r, receipt in enumerate(receipts):
+            for t, transaction in enumerate(transactions):
+                score, reasons = calculate_match_score(receipt, transaction)
+                if score >= MATCH_THRESHOLD:
+                    scores[(r, t)] = (score, reasons)
+        matches = find_optimal_matches(receipts, engine)
+        assert_optimal(matches, scores, receipts)
+        # Never worse than greedy
+        greedy = find_greedy_matches(receipts, engine, report=False)
+        assert sum(m['confidence_score'] for m in matches) >= sum(m['confidence_score'] for m in greedy) - 1e-9
+
+def previous_candidates(receipts, transactions):
+    """match_receipts_with_transactions as it compared every receipt with every transaction."""
+    matches = []
+    for receipt in receipts:
+        receipt_matches = []
+        receipt_date = date.fromisoformat(receipt.date)
+        for transaction in transactions:
+            date_diff = abs((receipt_date - date.fromisoformat(transaction['date'])).days)
+            amount_diff = abs(float(receipt.total_amount) - float(transaction['amount']))
+            confidence = 0.0
+            if date_diff == 0:
+                confidence += 0.5
+            elif date_diff <= 2:
+                confidence += 0.3
+            elif date_diff <= 5:
+                confidence += 0.1
+            if amount_diff < 0.01:
+                confidence += 0.5
+            elif amount_diff < 1.0:
+                confidence += 0.3
+            elif amount_diff < 5.0:
+                confidence += 0.1
+            if confidence > 0:
+                receipt_matches.append((transaction['id'], round(confidence * 100), date_diff, amount_diff))
+        if receipt_matches:
+            receipt_matches.sort(key=lambda match: match[1], reverse=True)
+            matches.append((receipt.id, receipt_matches))
+    return matches
+
+def test_receipt_candidates_are_unchanged_on_positive_amounts():
+    for seed in range(10):
+        rnd = random.Random(seed)
+        start = date(2024, 1, 1)
+        # Crowded onto a few days and amounts, so most receipts have several candidates and ties
+        amounts = [round(rnd.uniform(40, 60), 2) for _ in range(6)]
+        receipts = [Receipt(id=f"r{i}", filename=f"r{i}.jpg", supplier_name='', invoice_number='',
+                            date=(start + timedelta(days=rnd.randint(0, 20))).isoformat(),
+                            total_amount=rnd.choice(amounts) + rnd.choice([0, 0, 0.005, 0.5, 3.0, 10.0]),
+                            vat_amount=0, currency='SEK', confidence_score=1, line_items=[])
+                    for i in range(30)]
+        transactions = [{"id": f"t{i}", "date": (start + timedelta(days=rnd.randint(0, 20))).isoformat(),
+                         "amount": rnd.choice(amounts)} for i in range(60)]
+        expected = previous_candidates(receipts, transactions)
+        for top_k in (None, 5):
+            matches = [(result['receipt_id'], [(m['transaction_id'], m['confidence'], m['date_difference'],
+                                                 pytest.approx(m['amount_difference'], abs=1e-6))
+                                                for m in result['matches']])
+                       for result in match_receipts_with_transactions(receipts, transactions, top_k)]
+            assert matches == [(receipt_id, candidates[:top_k]) for receipt_id, candidates in expected]
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import importlib.util
+import logging
+import sys
+import threading
+
+import pytest
+
+import ocr_backends
+from ocr_backends import PytesseractBackend, get_backend, resolve_backend
+
+@pytest.fixture(autouse=True)
+def fresh_backends(monkeypatch):
+    monkeypatch.setattr(ocr_backends, '_backends', {})
+    monkeypatch.delenv('RECEIPT_OCR_BACKEND', raising=False)
+
+@pytest.fixture
+def without_tesserocr(monkeypatch):
+    """tesserocr as if it were not installed."""
+    find_spec = importlib.util.find_spec
+    monkeypatch.setattr(importlib.util, 'find_spec',
+                        lambda name, *args: None if name == 'tesserocr' else find_spec(name, *args))
+    # None in sys.modules makes the import itself raise ImportError
+    monkeypatch.setitem(sys.modules, 'tesserocr', None)
+
+def test_auto_resolves_to_pytesseract_without_tesserocr(without_tesserocr):
+    assert resolve_backend() == 'pytesseract'
+    assert resolve_backend('auto') == 'pytesseract'
+    assert isinstance(get_backend(), PytesseractBackend)
+
+def test_requested_tesserocr_falls_back_when_it_is_missing(without_tesserocr, caplog):
+    with caplog.at_level(logging.WARNING, logger='ocr_backends'):
+        backend = get_backend('tesserocr')
+    assert isinstance(backend, PytesseractBackend)
+    assert get_backend('tesserocr') is backend is get_backend('pytesseract')
+    assert "falling back to pytesseract" in caplog.text
+
+def test_first_use_off_the_main_thread_falls_back(tmp_path, monkeypatch, caplog):
+    # Like tesserocr, installs a signal handler on import, which only the main thread may do
+    (tmp_path / 'tesserocr.py').write_text(
+        "import signal\nsignal.signal(signal.SIGINT, signal.default_int_handler)\n", encoding='utf-8'
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, 'tesserocr', raising=False)
+    results = []
+    with caplog.at_level(logging.WARNING, logger='ocr_backends'):
+        thread = threading.Thread(target=lambda: results.append(get_backend('tesserocr')))
+        thread.start()
+        thread.join()
+    assert len(results) == 1 and isinstance(results[0], PytesseractBackend)
+    assert "falling back to pytesseract" in caplog.text
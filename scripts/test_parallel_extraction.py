@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import os
+import time
+
+import pytest
+
+import parse_receipt
+from progress_events import events_to
+
+FIELDS = {
+    "supplier_name": "Bageriet AB",
+    "date": "2024-03-12",
+    "total_amount": 125.0,
+    "currency": "SEK",
+    "vat_amount": 13.39,
+    "confidence_score": 0.9,
+    "line_items": []
+}
+NAMES = ['a.jpg', 'b.jpg', 'c.jpg', 'crash.jpg', 'd.jpg', 'e.jpg', 'f.jpg']
+
+def fake_extract_text(file_path: str) -> str:
+    """The file's own contents as its text, with a stage event; earlier files
+    take longer, so a pool finishes them out of order. "crash.jpg" kills the
+    worker process reading it."""
+    name = os.path.basename(file_path)
+    if name == 'crash.jpg':
+        os._exit(1)
+    time.sleep(0.05 * (len(NAMES) - NAMES.index(name)))
+    parse_receipt.send_progress("text_extraction", 50, f"Read {name}")
+    with open(file_path, encoding='utf-8') as f:
+        return f.read()
+
+@pytest.fixture
+def receipts_dir(tmp_path, monkeypatch):
+    # Pool workers are forked, so they see these patches too
+    monkeypatch.setattr(parse_receipt, 'extract_text', fake_extract_text)
+    monkeypatch.setattr(parse_receipt, 'parse_receipt_cached',
+                        lambda text, cache=None: dict(FIELDS, invoice_number=text))
+    monkeypatch.setenv('RECEIPT_DEDUP', '0')
+    monkeypatch.setenv('RECEIPT_GPT_BATCH_TOKENS', '0')
+    monkeypatch.setenv('RECEIPT_PROGRESS_INTERVAL', '0')
+    for name in NAMES:
+        (tmp_path / name).write_text(f"Invoice {name}", encoding='utf-8')
+    return tmp_path
+
+def listed(directory):
+    return [os.path.basename(path) for path in parse_receipt._list_receipt_files(str(directory))]
+
+def scan(directory, workers):
+    events = []
+    with events_to(events.append):
+        receipts = parse_receipt.process_directory(str(directory), workers=workers)
+    return [(r.filename, r.invoice_number, r.error) for r in receipts], [(e['stage'], e['message']) for e in events]
+
+def test_workers_give_the_same_receipts_and_events_as_one(receipts_dir):
+    os.remove(receipts_dir / 'crash.jpg')
+    serial = scan(receipts_dir, workers=1)
+    parallel = scan(receipts_dir, workers=3)
+    assert parallel == serial
+    receipts, events = serial
+    assert [filename for filename, _, _ in receipts] == listed(receipts_dir)
+    assert [message for stage, message in events if stage == 'text_extraction'] == \
+        [f"Read {name}" for name in listed(receipts_dir)]
+
+def test_a_crashing_worker_fails_only_its_own_file(receipts_dir):
+    receipts, events = scan(receipts_dir, workers=3)
+    assert [filename for filename, _, _ in receipts] == listed(receipts_dir)
+    for filename, invoice_number, error in receipts:
+        if filename == 'crash.jpg':
+            assert error.startswith("OCR worker crashed")
+        else:
+            assert (invoice_number, error) == (f"Invoice {filename}", None)
+    assert [message for stage, message in events if stage == 'text_extraction'] == \
+        [f"Read {name}" for name in listed(receipts_dir) if name != 'crash.jpg']
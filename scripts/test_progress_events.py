@@ -0,0 +1,44 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from make_receipt_fixtures import FIXTURE_DIR
+
+SCRIPT = Path(__file__).with_name('parse_receipt.py')
+
+def run_events(tmp_path, *args, **env):
+    """The JSON events a parse_receipt run writes, every progress event included."""
+    receipts = tmp_path / 'receipts'
+    receipts.mkdir()
+    for name in ('ica_nara', 'circle_k', 'hotel_berlin'):
+        shutil.copy(os.path.join(FIXTURE_DIR, name + '.jpg'), receipts)
+    # A copy of the same picture, so the duplicate check has work to do
+    shutil.copy(os.path.join(FIXTURE_DIR, 'ica_nara.jpg'), receipts / 'ica_nara_copy.jpg')
+    transactions = tmp_path / 'transactions.json'
+    transactions.write_text('[{"id": 1, "date": "2024-03-14", "amount": 150.85}]', encoding='utf-8')
+    paths = {'{receipts}': str(receipts), '{transactions}': str(transactions)}
+    result = subprocess.run(
+        [sys.executable, str(SCRIPT), '--no-cache', *[paths.get(arg, arg) for arg in args]],
+        capture_output=True, text=True, cwd=tmp_path, timeout=120,
+        env=dict(os.environ, OPENAI_API_KEY='test-key', RECEIPT_PROGRESS_INTERVAL='0', **env)
+    )
+    assert result.returncode == 0, result.stderr
+    lines = [json.loads(line) for line in result.stdout.splitlines() if line.startswith('{')]
+    return [line for line in lines if 'stage' in line]
+
+@pytest.mark.parametrize('args', [('--scan', '{receipts}'), ('--match', '{receipts}', '--transactions', '{transactions}')])
+def test_progress_never_goes_backwards(tmp_path, args):
+    events = run_events(tmp_path, *args)
+    stages = [event['stage'] for event in events]
+    assert stages[0] == 'initialization' and 'dedup' in stages
+    progress = [event['progress'] for event in events]
+    assert progress == sorted(progress)
+
+def test_no_progress_leaves_only_results(tmp_path):
+    events = run_events(tmp_path, '--no-progress', '--scan', '{receipts}')
+    assert [event['stage'] for event in events] == ['timings']
@@ -0,0 +1,55 @@
+import ocr_backends
+import parse_receipt
+from receipt_cache import ReceiptCache
+
+def test_runs_with_different_settings_keep_their_entries(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    low = ReceiptCache(path, versions={'text': '2'}, settings={'text': 'pdf150x2:full:tesseract'})
+    low.put('text', 'abc', {'text': 'low dpi'})
+    low.close()
+
+    high = ReceiptCache(path, versions={'text': '2'}, settings={'text': 'pdf300x5:full:tesseract'})
+    assert high.get('text', 'abc') is None
+    high.put('text', 'abc', {'text': 'high dpi'})
+    high.close()
+
+    low = ReceiptCache(path, versions={'text': '2'}, settings={'text': 'pdf150x2:full:tesseract'})
+    assert low.get('text', 'abc') == {'text': 'low dpi'}
+    low.close()
+
+def test_version_bump_prunes_stale_entries(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    old = ReceiptCache(path, versions={'text': '2', 'parsed': '2'}, settings={'text': 'pdf200x10'})
+    old.put('text', 'abc', {'text': 'old pipeline'})
+    old.put('parsed', 'def', {'supplier_name': 'ACME'})
+    old.close()
+
+    new = ReceiptCache(path, versions={'text': '3', 'parsed': '2'}, settings={'text': 'pdf200x10'})
+    assert new.get('text', 'abc') is None
+    assert new.get('parsed', 'def') == {'supplier_name': 'ACME'}
+    assert new._db.execute("SELECT COUNT(*) FROM entries WHERE kind = 'text'").fetchone()[0] == 0
+    new.close()
+
+def test_text_is_cached_under_the_backend_that_read_it(tmp_path, monkeypatch):
+    monkeypatch.setenv('RECEIPT_OCR_BACKEND', 'tesserocr')
+    receipt = tmp_path / 'receipt.jpg'
+    receipt.write_bytes(b'receipt')
+    cache = ReceiptCache(str(tmp_path / 'cache.sqlite3'), versions=parse_receipt.cache_versions(),
+                         settings=parse_receipt.cache_settings())
+
+    class Tesserocr:
+        name = 'tesserocr'
+
+    # tesserocr could not start, so pytesseract read the file
+    monkeypatch.setattr(ocr_backends, '_backends', {'tesserocr': ocr_backends.PytesseractBackend()})
+    monkeypatch.setattr(parse_receipt, 'extract_text', lambda path: 'read by pytesseract')
+    assert parse_receipt.extract_text_cached(str(receipt), cache) == 'read by pytesseract'
+    # Once tesserocr runs, its own reading is used and cached beside the other
+    monkeypatch.setattr(ocr_backends, '_backends', {'tesserocr': Tesserocr()})
+    monkeypatch.setattr(parse_receipt, 'extract_text', lambda path: 'read by tesserocr')
+    assert parse_receipt.extract_text_cached(str(receipt), cache) == 'read by tesserocr'
+    monkeypatch.setattr(parse_receipt, 'extract_text', lambda path: None)
+    assert parse_receipt.extract_text_cached(str(receipt), cache) == 'read by tesserocr'
+    monkeypatch.setattr(ocr_backends, '_backends', {'tesserocr': ocr_backends.PytesseractBackend()})
+    assert parse_receipt.extract_text_cached(str(receipt), cache) == 'read by pytesseract'
+    cache.close()
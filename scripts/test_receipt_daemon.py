@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from reconciliation_data import FALLBACK_PROFILE, generate
+
+SCRIPT = Path(__file__).with_name('receipt_daemon.py')
+
+def run_daemon(tmp_path, requests):
+    """The JSON events a stdin/stdout daemon writes for these requests, up to its exit."""
+    lines = ''.join(json.dumps(request) + '\n' for request in requests)
+    result = subprocess.run(
+        [sys.executable, str(SCRIPT), '--no-cache'], input=lines,
+        capture_output=True, text=True, cwd=tmp_path, timeout=120,
+        env=dict(os.environ, OPENAI_API_KEY='test-key', RECEIPT_PROGRESS_INTERVAL='0')
+    )
+    assert result.returncode == 0, result.stderr
+    return [json.loads(line) for line in result.stdout.splitlines()]
+
+def test_every_request_gets_its_events_and_one_outcome(tmp_path):
+    data = generate(20, seed=3, profile=FALLBACK_PROFILE)
+    events = run_daemon(tmp_path, [
+        {"id": "ping", "op": "ping"},
+        {"id": "match", "op": "match", "receipts": data['receipts'], "transactions": data['transactions'],
+         "mode": "optimal"},
+        {"id": "unknown", "op": "unknown"},
+        {"op": "shutdown"},
+        # Never read: the daemon stops at shutdown
+        {"id": "late", "op": "ping"}
+    ])
+    assert events[0]['stage'] == 'ready'
+    by_request = {}
+    for event in events[1:]:
+        assert 'request_id' in event
+        by_request.setdefault(event['request_id'], []).append(event)
+    assert set(by_request) == {'ping', 'match', 'unknown'}
+    for request_id, request_events in by_request.items():
+        outcomes = [event for event in request_events if event['stage'] in ('result', 'error')]
+        assert outcomes == [request_events[-1]], request_id
+
+    assert by_request['ping'][-1]['data'] == {'pong': True}
+    assert by_request['unknown'][-1]['stage'] == 'error'
+    match = by_request['match']
+    assert match[-1]['stage'] == 'result'
+    assert len(match) > 1 and match[0]['stage'] == 'progress'
+    stages = [event['stage'] for event in match]
+    assert stages.index('summary') < stages.index('comparison') < stages.index('unmatched')
+    summary = match[-1]['data']
+    assert summary == match[stages.index('summary')]['data']
+    assert 0 < summary['total_matches'] == len(data['receipts']) - summary['unmatched_receipts']
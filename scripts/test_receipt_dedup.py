@@ -0,0 +1,23 @@
+import parse_receipt
+from PIL import Image
+from receipt_dedup import TextDuplicateIndex
+
+def test_empty_text_is_never_a_duplicate():
+    index = TextDuplicateIndex()
+    assert index.add('a.png', None) is None
+    assert index.add('b.png', '') is None
+
+def test_serial_scan_reports_files_without_text(tmp_path, monkeypatch):
+    # Different pictures, so both reach text extraction
+    for name, size in (('a.png', 16), ('b.png', 48)):
+        image = Image.new('L', (64, 64), 255)
+        image.paste(0, (0, 0, size, 64))
+        image.save(tmp_path / name)
+    monkeypatch.setattr(parse_receipt, 'extract_text', lambda file_path: None)
+    monkeypatch.setenv('RECEIPT_DEDUP', '1')
+    monkeypatch.setenv('RECEIPT_GPT_BATCH_TOKENS', '0')
+
+    receipts = parse_receipt.process_directory(str(tmp_path))
+
+    assert [receipt.filename for receipt in receipts] == ['a.png', 'b.png']
+    assert all(receipt.error == "No text could be extracted" for receipt in receipts)
@@ -0,0 +1,28 @@
+import json
+import os
+
+from benchmark_fields import evaluate
+from make_receipt_fixtures import FIXTURE_DIR, INVOICES, RECEIPTS, invoice_text
+from receipt_fields import REQUIRED_FIELDS
+
+def test_bundled_fixtures_match_their_definitions():
+    for receipt in RECEIPTS:
+        base = os.path.join(FIXTURE_DIR, receipt['name'])
+        assert os.path.exists(base + '.jpg')
+        with open(base + '.txt', 'r', encoding='utf-8') as f:
+            assert f.read().splitlines() == receipt['lines']
+        with open(base + '.json', 'r', encoding='utf-8') as f:
+            assert json.load(f) == receipt['fields']
+    for seed, invoice in enumerate(INVOICES):
+        base = os.path.join(FIXTURE_DIR, invoice['name'])
+        text, fields = invoice_text(invoice, seed)
+        with open(base + '.txt', 'r', encoding='utf-8') as f:
+            assert f.read() == text
+        with open(base + '.json', 'r', encoding='utf-8') as f:
+            assert json.load(f) == fields
+
+def test_receipts_that_skip_gpt_have_every_field_right():
+    result = evaluate(FIXTURE_DIR, 0.8)
+    assert result['fixtures'] == len(RECEIPTS) + len(INVOICES)
+    assert 0 < result['gpt_skip_rate'] < 1
+    assert result['skipped_field_accuracy'] == {field: 1.0 for field in REQUIRED_FIELDS}
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+import match_transactions
+from progress_events import events_to
+from reconciliation_data import FALLBACK_PROFILE, generate
+
+def reconcile(receipts: List[Dict[str, Any]], transactions: List[Dict[str, Any]], mode: str = 'greedy',
+              state_path: Optional[str] = None, confirmed: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """The summary, unmatched records and {receipt id: transaction id} of a reconcile run."""
+    events = []
+    with events_to(events.append):
+        match_transactions.reconcile(receipts, transactions, mode, state_path, confirmed)
+    by_stage = {event['stage']: event for event in events}
+    pairs = {}
+    for event in events:
+        if event['stage'] == 'matches':
+            pairs.update((m['receipt']['id'], m['transaction']['id']) for m in event['data']['matches'])
+    return {
+        "summary": by_stage['summary']['data'],
+        "unmatched": by_stage['unmatched']['data'],
+        "pairs": pairs
+    }
+
+def sample(size: int, seed: int) -> Dict[str, Any]:
+    return generate(size, seed=seed, profile=list(FALLBACK_PROFILE))
+
+def test_rerun_on_unchanged_input_gives_the_same_result(tmp_path):
+    data = sample(600, 1)
+    for mode in ('greedy', 'optimal'):
+        state = str(tmp_path / f'{mode}.sqlite')
+        stateless = reconcile(data['receipts'], data['transactions'], mode)
+        runs = [reconcile(data['receipts'], data['transactions'], mode, state) for _ in range(3)]
+        assert all(run == stateless for run in runs)
+
+def test_aliases_come_from_confirmed_matches(tmp_path):
+    data = sample(600, 2)
+    confirmed = [{"receipt_id": r, "transaction_id": t} for r, t in list(data['truth'].items())[:100]]
+    state = str(tmp_path / 'state.sqlite')
+    first = reconcile(data['receipts'], data['transactions'], 'greedy', state, confirmed)
+    again = reconcile(data['receipts'], data['transactions'], 'greedy', state, confirmed)
+    assert first == again
+    for entry in confirmed:
+        assert first['pairs'][entry['receipt_id']] == entry['transaction_id']
+    # Learned aliases are kept in the store for later runs
+    store = match_transactions.ReconciliationStore(state, match_transactions.receipt_features,
+                                                   match_transactions.transaction_features)
+    assert store.alias_pairs()
+    store.close()
+
+def test_incremental_run_equals_full_run(tmp_path):
+    data = sample(800, 3)
+    receipts, transactions = data['receipts'], data['transactions']
+    by_date = sorted(transactions, key=lambda t: t['date'])
+    early = {t['id'] for t in by_date[:len(by_date) * 6 // 10]}
+    # The rest of the year arrives later, and some records are edited or dropped
+    changed = [dict(r, total_amount=round(float(r['total_amount']) * 1.02, 2)) if i % 25 == 0 else r
+               for i, r in enumerate(receipts)]
+    dropped = [t for i, t in enumerate(transactions) if i % 40 != 0]
+    steps = [
+        ([r for i, r in enumerate(receipts) if i % 10 < 7], [t for t in transactions if t['id'] in early]),
+        (receipts, transactions),
+        (changed, dropped),
+        (changed, dropped)
+    ]
+    for mode in ('greedy', 'optimal'):
+        state = str(tmp_path / f'{mode}.sqlite')
+        for step_receipts, step_transactions in steps:
+            incremental = reconcile(step_receipts, step_transactions, mode, state)
+            assert incremental == reconcile(step_receipts, step_transactions, mode)
+
+def test_store_is_closed_when_a_run_fails(tmp_path, monkeypatch):
+    closed = []
+    close = match_transactions.ReconciliationStore.close
+    monkeypatch.setattr(match_transactions.ReconciliationStore, 'close',
+                        lambda store: (closed.append(store), close(store)))
+
+    def fail(*args):
+        raise RuntimeError("solver failed")
+    monkeypatch.setattr(match_transactions, 'assign_greedy', fail)
+    data = sample(50, 5)
+    with pytest.raises(RuntimeError):
+        reconcile(data['receipts'], data['transactions'], 'greedy', str(tmp_path / 'state.sqlite3'))
+    assert len(closed) == 1
+
+def test_streamed_transactions_give_the_same_result(tmp_path):
+    data = sample(300, 4)
+    confirmed = [{"receipt_id": r, "transaction_id": t} for r, t in list(data['truth'].items())[:5]]
+    for mode in ('greedy', 'optimal'):
+        for confirmed_matches in (None, confirmed):
+            for state in (None, str(tmp_path / f'{mode}{bool(confirmed_matches)}.sqlite')):
+                listed = reconcile(data['receipts'], data['transactions'], mode, state, confirmed_matches)
+                streamed = reconcile(data['receipts'], iter(data['transactions']), mode, state, confirmed_matches)
+                assert streamed == listed
+
+def test_statement_transactions_keep_only_the_matching_columns(tmp_path):
+    statement = tmp_path / 'revolut.csv'
+    statement.write_text(
+        "Type,Product,Started Date,Completed Date,Description,Amount,Fee,Currency,State,Balance\n"
+        "CARD_PAYMENT,Current,2024-03-14 10:00:00,2024-03-15 09:00:00,ICA Nara,-150.85,0.00,SEK,COMPLETED,849.15\n",
+        encoding='utf-8'
+    )
+    transactions = match_transactions.iter_statement_transactions([str(statement)])
+    assert not isinstance(transactions, list)
+    [transaction] = transactions
+    assert set(transaction) == set(match_transactions.STATEMENT_COLUMNS)
+    assert (transaction['date'], transaction['amount'], transaction['reference']) == ('2024-03-14', -150.85, 'ICA Nara')
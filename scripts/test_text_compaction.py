@@ -0,0 +1,38 @@
+from gpt_batches import estimate_tokens
+from text_compaction import compact_text
+
+HEADER = ['Telia Sverige AB', 'Stjärntorget 1, 169 94 Solna', 'Org.nr 556430-0142']
+FOOTER = ['Styrelsens säte Stockholm', 'Godkänd för F-skatt', 'Kundtjänst telia.se/foretag']
+
+def test_repeated_page_headers_and_footers_are_dropped():
+    text = '\n'.join(HEADER + ['Abonnemang 199,00'] + FOOTER + ['Sida 1 av 2']
+                     + HEADER + ['Surf 49,00'] + FOOTER + ['Sida 2 av 2'])
+    assert compact_text(text, 0).splitlines() == HEADER + ['Abonnemang 199,00'] + FOOTER + ['Surf 49,00']
+
+def test_noise_and_whitespace_go():
+    text = 'Telia  Sverige   AB\n.,;:\n| | |\n\nTotalt   248,00\n'
+    assert compact_text(text, 0) == 'Telia Sverige AB\nTotalt 248,00'
+
+def test_amount_and_date_lines_survive_the_repeat_rules():
+    # The same item three times in a row, twice over, and a repeated date line
+    items = ['Kaffe 25,00'] * 6
+    text = '\n'.join(HEADER + ['Datum 2024-03-14'] + items + ['Tack för besöket', 'Datum 2024-03-14',
+                                                             'Tack för besöket', 'Totalt 150,00'])
+    assert compact_text(text, 0).splitlines() == (HEADER + ['Datum 2024-03-14'] + items
+                                                  + ['Tack för besöket', 'Datum 2024-03-14', 'Totalt 150,00'])
+
+def test_over_the_cap_field_lines_are_kept_in_order():
+    boilerplate = [f'Villkor punkt {chr(97 + i)} gäller för alla köp i butiken och på webben' for i in range(20)]
+    items = [f'Vara nummer {i} {10 + i},00' for i in range(20)]
+    fields = ['Datum 2024-03-14', 'Totalt 590,00', 'Moms 25% 118,00']
+    lines = HEADER + boilerplate[:10] + [fields[0]] + items[:10] + [fields[1]] + boilerplate[10:] + items[10:] + [fields[2]]
+    text = '\n'.join(lines)
+    compacted = compact_text(text, 80).splitlines()
+    assert sum(estimate_tokens(line) for line in compacted) <= 80
+    for line in HEADER + fields:
+        assert line in compacted
+    # Nothing moves: what is kept reads in the printed order
+    assert compacted == [line for line in lines if line in compacted]
+    assert [line for line in compacted if line in HEADER + fields] == HEADER + fields
+    # Boilerplate goes first
+    assert not any(line in compacted for line in boilerplate)
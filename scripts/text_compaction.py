@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import os
+import re
+from typing import List, Set, Tuple
+
+from gpt_batches import estimate_tokens
+from receipt_fields import holds_value, labels_field
+
+# Estimated tokens of receipt text sent to GPT; 0 sends the whole compacted text
+DEFAULT_MAX_TEXT_TOKENS = 1000
+# The first lines name the supplier, so they count as field lines
+HEADER_LINES = 3
+# This many lines repeating an earlier run, in order, are a page header or footer
+BLOCK_LINES = 3
+# Lines with fewer letters and digits than this share of their characters are OCR noise
+MIN_ALNUM_SHARE = 0.4
+
+_WORD = re.compile(r'[^\W_]{2,}')
+_PAGE_COUNTER = re.compile(r'^(?:sida|sid|page|s\.)\s*\d+\s*(?:av|of|/)\s*\d+$', re.IGNORECASE)
+
+def compaction_settings() -> Tuple[bool, int]:
+    """(compaction enabled, token cap), from --no-compact / RECEIPT_COMPACT and
+    --gpt-text-tokens / RECEIPT_GPT_TEXT_TOKENS."""
+    return (
+        os.getenv('RECEIPT_COMPACT', '1') != '0',
+        max(0, int(os.getenv('RECEIPT_GPT_TEXT_TOKENS') or DEFAULT_MAX_TEXT_TOKENS))
+    )
+
+def _informative(line: str) -> bool:
+    if not _WORD.search(line) or _PAGE_COUNTER.match(line):
+        return False
+    characters = len(line.replace(' ', ''))
+    return sum(ch.isalnum() for ch in line) >= MIN_ALNUM_SHARE * characters or holds_value(line)
+
+def _repeated_blocks(lines: List[str]) -> Set[int]:
+    """Positions of lines in runs of BLOCK_LINES that repeat an earlier, non-overlapping run."""
+    keys = [line.lower() for line in lines]
+    first_end = {}
+    repeated = set()
+    for start in range(len(keys) - BLOCK_LINES + 1):
+        end = first_end.setdefault(tuple(keys[start:start + BLOCK_LINES]), start + BLOCK_LINES)
+        if end <= start:
+            repeated.update(range(start, start + BLOCK_LINES))
+    return repeated
+
+def _priority(line: str, position: int) -> int:
+    if position < HEADER_LINES or labels_field(line):
+        return 0
+    if holds_value(line):
+        return 1
+    if any(ch.isdigit() for ch in line):
+        return 2
+    return 3
+
+def compact_text(text: str, max_tokens: int = DEFAULT_MAX_TEXT_TOKENS) -> str:
+    """OCR text with what GPT does not need taken out.
+
+    Whitespace is collapsed; noise lines (no word of two letters or digits,
+    mostly symbols, page counters) are dropped, and so are page headers and
+    footers repeated on later pages and other repeated lines, unless they
+    hold an amount or a date (the same item bought twice). Over max_tokens, lines are kept by priority: the header and lines
+    labelling a field (total, VAT/moms, date, invoice number), then other
+    lines with amounts or dates, then other lines with digits, then the rest.
+    Kept lines stay in their original order.
+    """
+    lines = [' '.join(line.split()) for line in text.splitlines()]
+    lines = [line for line in lines if line and _informative(line)]
+    repeated = _repeated_blocks(lines)
+    seen = set()
+    kept = []
+    for position, line in enumerate(lines):
+        key = line.lower()
+        if (position in repeated or key in seen) and not holds_value(line):
+            continue
+        seen.add(key)
+        kept.append(line)
+    if not kept:
+        # Nothing but noise; let GPT see what there is
+        return text.strip()
+    if not max_tokens or estimate_tokens('\n'.join(kept)) <= max_tokens:
+        return '\n'.join(kept)
+    chosen = []
+    tokens = 0
+    for position in sorted(range(len(kept)), key=lambda position: (_priority(kept[position], position), position)):
+        tokens += estimate_tokens(kept[position])
+        if tokens > max_tokens:
+            break
+        chosen.append(position)
+    return '\n'.join(kept[position] for position in sorted(chosen))